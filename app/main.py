@@ -1,58 +1,49 @@
 import os
 import time
-from typing import List
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from prometheus_client import Counter, Histogram, start_http_server
+from fastapi import FastAPI, HTTPException, Request
+from prometheus_client import start_http_server
 
+from app.schemas import HealthResponse, PredictBatchRequest, PredictBatchResponse, PredictRequest, PredictResponse
 from server.inference import ModelRunner
-from server.validation import features_to_dict, ValidationError
+from server.validation import features_to_row, rows_to_matrix, ValidationError
+from server import metrics
+from server.metrics import PREDICTIONS_TOTAL, PREDICTION_DURATION, ERRORS_TOTAL
 from server import logger as _logger
 
 
 MODEL_PATH = os.getenv("MODEL_PATH", "models/model.pkl")
 MODEL_VERSION = os.getenv("MODEL_VERSION", "v1.0.0")
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "sklearn")  # "sklearn" or "compiled"
 METRICS_PORT = int(os.getenv("METRICS_PORT", "8000"))
 
-PREDICTIONS_TOTAL = Counter('predictions_total', 'Total predictions', ['model_version'])
-PREDICTION_DURATION = Histogram('prediction_duration_seconds', 'Prediction duration', ['model_version'])
-ERRORS_TOTAL = Counter('errors_total', 'Total errors', ['model_version', 'error_type'])
-
 logger = _logger.service_logger
 
 
-class Feature(BaseModel):
-    name: str
-    value: float
-
-
-class PredictRequest(BaseModel):
-    features: List[Feature]
-
-
-class HealthResponse(BaseModel):
-    status: str
-    model_version: str
-
-
-class PredictResponse(BaseModel):
-    prediction: str
-    confidence: float
-    model_version: str
-
-
 api = FastAPI(title="ML Service", version=MODEL_VERSION)
-runner = ModelRunner(MODEL_PATH, version=MODEL_VERSION)
+runner = ModelRunner(MODEL_PATH, version=MODEL_VERSION, backend=INFERENCE_BACKEND)
+if runner.model is not None:
+    try:
+        runner.warm_up()
+    except Exception as e:
+        logger.warning(f"Model warm-up failed: {e}")
 
 start_http_server(METRICS_PORT)
 logger.info(f"HTTP service initialized. Model version: {runner.version}")
 logger.info(f"Prometheus metrics are available on port: {METRICS_PORT}")
 
 
+@api.middleware("http")
+async def track_in_flight(request: Request, call_next):
+    # Unknown paths share one label so clients cannot grow the label set
+    path = request.url.path if request.url.path in ("/health", "/predict", "/predict_batch") else "other"
+    with metrics.in_flight("http", path):
+        return await call_next(request)
+
+
 @api.get("/health", response_model=HealthResponse)
 def health() -> HealthResponse:
-    logger.info("Starting HTTP health check...")
+    logger.info("Starting HTTP health check...", extra={"event": "health_check"})
     try:
         return HealthResponse(status="SERVING", model_version=runner.version)
     except Exception as e:
@@ -66,7 +57,8 @@ def predict(request: PredictRequest) -> PredictResponse:
 
     try:
         features = request.features
-        logger.info(f"HTTP predict request received. Number of features: {len(features)}")
+        logger.info("HTTP predict request received. Number of features: %d", len(features),
+                    extra={"event": "predict_request"})
 
         if not features:
             ERRORS_TOTAL.labels(model_version=runner.version, error_type="empty_features").inc()
@@ -75,17 +67,18 @@ def predict(request: PredictRequest) -> PredictResponse:
         PREDICTIONS_TOTAL.labels(model_version=runner.version).inc()
 
         # Reuse existing validation: works with any objects having .name and .value
-        feats = features_to_dict(features)
-        pred, conf = runner.predict(feats)
-
-        duration = time.time() - start_time
-        PREDICTION_DURATION.labels(model_version=runner.version).observe(duration)
-
-        return PredictResponse(
-            prediction=pred,
-            confidence=conf,
-            model_version=runner.version,
-        )
+        with metrics.stage("http", "predict", "validate"):
+            row = features_to_row(features, runner.schema)
+        with metrics.stage("http", "predict", "model"):
+            pred, conf, probabilities = runner.predict(row, request.return_probabilities)
+
+        with metrics.stage("http", "predict", "respond"):
+            return PredictResponse(
+                prediction=pred,
+                confidence=conf,
+                model_version=runner.version,
+                probabilities=probabilities,
+            )
     except ValidationError as ve:
         ERRORS_TOTAL.labels(model_version=runner.version, error_type="validation").inc()
         logger.error(f"Validation Error in HTTP Predict: {str(ve)}")
@@ -97,3 +90,40 @@ def predict(request: PredictRequest) -> PredictResponse:
         ERRORS_TOTAL.labels(model_version=runner.version, error_type="internal").inc()
         logger.error(f"Error in HTTP Predict: {str(e)}")
         raise HTTPException(status_code=500, detail=f"internal error: {e}")
+    finally:
+        PREDICTION_DURATION.labels(model_version=runner.version).observe(time.time() - start_time)
+
+
+@api.post("/predict_batch", response_model=PredictBatchResponse)
+def predict_batch(request: PredictBatchRequest) -> PredictBatchResponse:
+    start_time = time.time()
+
+    try:
+        logger.info("HTTP predict_batch request received. Number of rows: %d", len(request.rows),
+                    extra={"event": "predict_batch_request"})
+
+        with metrics.stage("http", "predict_batch", "validate"):
+            X = rows_to_matrix((row.features for row in request.rows), runner.schema)
+        PREDICTIONS_TOTAL.labels(model_version=runner.version).inc(len(X))
+        with_probabilities = [row.return_probabilities for row in request.rows]
+        with metrics.stage("http", "predict_batch", "model"):
+            results = runner.predict_many(X, with_probabilities=any(with_probabilities))
+
+        with metrics.stage("http", "predict_batch", "respond"):
+            return PredictBatchResponse(predictions=[
+                PredictResponse(
+                    prediction=pred, confidence=conf, model_version=runner.version,
+                    probabilities=probabilities if wanted else None,
+                )
+                for (pred, conf, probabilities), wanted in zip(results, with_probabilities)
+            ])
+    except ValidationError as ve:
+        ERRORS_TOTAL.labels(model_version=runner.version, error_type="validation").inc()
+        logger.error(f"Validation Error in HTTP PredictBatch: {str(ve)}")
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        ERRORS_TOTAL.labels(model_version=runner.version, error_type="internal").inc()
+        logger.error(f"Error in HTTP PredictBatch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"internal error: {e}")
+    finally:
+        PREDICTION_DURATION.labels(model_version=runner.version).observe(time.time() - start_time)
@@ -0,0 +1,33 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class Feature(BaseModel):
+    name: str
+    value: float
+
+
+class PredictRequest(BaseModel):
+    features: List[Feature]
+    return_probabilities: bool = False
+
+
+class HealthResponse(BaseModel):
+    status: str
+    model_version: str
+
+
+class PredictResponse(BaseModel):
+    prediction: str
+    confidence: float
+    model_version: str
+    probabilities: Optional[Dict[str, float]] = None
+
+
+class PredictBatchRequest(BaseModel):
+    rows: List[PredictRequest]
+
+
+class PredictBatchResponse(BaseModel):
+    predictions: List[PredictResponse]
@@ -0,0 +1,71 @@
+"""
+Benchmark: sklearn RandomForest inference vs the compiled forest backend
+Checks that both backends agree on the iris test set, then times them
+
+Usage: python -m benchmarks.bench_compiled_forest
+"""
+
+import argparse
+import time
+import numpy as np
+from sklearn.datasets import load_iris
+from sklearn.model_selection import train_test_split
+
+from server.inference import CompiledForest, ModelRunner
+
+MODELS = ['models/model.pkl', 'models/model_v2.pkl']
+ROW_COUNTS = [1, 16, 128, 1000, 10000]
+
+def iris_test_set():
+    """Same split as train_model.py"""
+    X, y = load_iris(return_X_y=True)
+    _, X_test, _, _ = train_test_split(X, y, test_size=0.2, random_state=42)
+    return X_test
+
+def check_equivalence(model, engine, X):
+    sk_labels = model.predict(X)
+    sk_proba = model.predict_proba(X)
+    labels, _ = engine.predict(X)
+    proba = engine.predict_proba(X)
+    assert np.array_equal(sk_labels, labels), "labels differ from sklearn"
+    assert np.allclose(sk_proba, proba, rtol=0, atol=1e-12), "probabilities differ from sklearn"
+
+def check_backends(model, engine, X):
+    """Both traversal strategies of the engine must match sklearn"""
+    check_equivalence(model, engine, X)
+    repeated = np.tile(X, (engine.VECTORIZED_MAX_ROWS // len(X) + 1, 1))
+    check_equivalence(model, engine, repeated)
+
+def timeit(fn, repeat):
+    fn()  # warm-up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    X_test = iris_test_set()
+    rng = np.random.default_rng(42)
+
+    for path in MODELS:
+        model = ModelRunner(path).model
+        engine = CompiledForest(model)
+        check_backends(model, engine, X_test)
+        print(f"\n=== {path}: {engine.n_trees} trees, max depth {engine.max_depth} ===")
+        print("Compiled backend matches sklearn on the iris test set")
+        print(f"{'rows':>8} {'sklearn predict+proba':>24} {'compiled':>12} {'speedup':>9}")
+
+        for n in ROW_COUNTS:
+            X = X_test[rng.integers(0, len(X_test), size=n)]
+            sk = timeit(lambda: (model.predict(X), model.predict_proba(X)), args.repeat)
+            compiled = timeit(lambda: engine.predict(X), args.repeat)
+            print(f"{n:>8} {sk * 1000:>21.3f} ms {compiled * 1000:>9.3f} ms {sk / compiled:>8.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark: model startup with the pickle loader vs the memory-mapped forest
+Exports each pickled model to a .forest file, checks that the mapped model
+predicts exactly like sklearn, then compares
+  - load time in this process (file already in the page cache)
+  - time from a fresh interpreter to the first prediction
+  - anonymous (unshareable) memory a server process holds after loading
+The pickle loader's fresh-process numbers include importing sklearn, which
+the mapped loader never needs.
+
+Usage: python -m benchmarks.bench_model_load [--repeat N] [--large]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import joblib
+import numpy as np
+from sklearn.datasets import make_classification
+from sklearn.ensemble import RandomForestClassifier
+
+from server.inference import CompiledForest, MAPPED_SUFFIX
+from benchmarks.bench_compiled_forest import MODELS, check_backends, iris_test_set
+
+# Runs in a fresh interpreter: load, score one row, report timings and memory.
+STARTUP_SCRIPT = """
+import json, sys, time
+def anonymous_kb():
+    with open('/proc/self/smaps_rollup') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('Anonymous:'))
+import numpy as np
+from server.inference import ModelRunner
+imported = time.perf_counter()
+before = anonymous_kb()
+runner = ModelRunner(sys.argv[1])
+runner.predict(np.zeros(runner.model.n_features_in_))
+ready = time.perf_counter()
+print(json.dumps({'load': ready - imported, 'anon_kb': anonymous_kb() - before}))
+"""
+
+def export(model, path):
+    CompiledForest(model).save(path)
+    return path
+
+def large_model():
+    """A forest big enough for load time and memory to matter"""
+    X, y = make_classification(n_samples=20000, n_features=20, n_informative=10, n_classes=3, random_state=42)
+    return RandomForestClassifier(n_estimators=300, random_state=42, n_jobs=-1).fit(X, y), X[:40]
+
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+def startup(path, repeat):
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, path], env=env,
+                             capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    return {key: float(np.median([run[key] for run in runs])) for key in runs[0]}
+
+def compare(name, model, pickle_path, mapped_path, X, repeat):
+    mapped = CompiledForest.load(mapped_path)
+    check_backends(model, mapped, X)
+    print(f"\n=== {name}: {mapped.n_trees} trees, "
+          f"pickle {os.path.getsize(pickle_path) / 2**20:.2f} MiB, "
+          f"mapped {os.path.getsize(mapped_path) / 2**20:.2f} MiB ===")
+    print("Memory-mapped model matches sklearn")
+
+    in_process = {
+        'pickle': timeit(lambda: joblib.load(pickle_path), repeat),
+        'mapped': timeit(lambda: CompiledForest.load(mapped_path), repeat),
+    }
+    fresh = {'pickle': startup(pickle_path, max(3, repeat // 4)),
+             'mapped': startup(mapped_path, max(3, repeat // 4))}
+    print(f"{'loader':>8} {'load':>12} {'fresh process to 1st prediction':>34} {'anon memory':>14}")
+    for loader in ('pickle', 'mapped'):
+        print(f"{loader:>8} {in_process[loader] * 1000:>9.2f} ms {fresh[loader]['load'] * 1000:>31.1f} ms "
+              f"{fresh[loader]['anon_kb'] / 1024:>10.1f} MiB")
+    print(f"load speedup: {in_process['pickle'] / in_process['mapped']:.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--large', action='store_true', help='also benchmark a 300-tree forest on synthetic data')
+    args = parser.parse_args()
+
+    X_test = iris_test_set()
+    with tempfile.TemporaryDirectory() as tmp:
+        for path in MODELS:
+            model = joblib.load(path)
+            mapped_path = export(model, os.path.join(tmp, os.path.basename(path)[:-4] + MAPPED_SUFFIX))
+            compare(path, model, path, mapped_path, X_test, args.repeat)
+
+        if args.large:
+            model, X = large_model()
+            pickle_path = os.path.join(tmp, 'large.pkl')
+            joblib.dump(model, pickle_path)
+            compare('synthetic 300 trees', model, pickle_path, export(model, os.path.join(tmp, 'large.forest')),
+                    X, args.repeat)
+
+if __name__ == '__main__':
+    main()
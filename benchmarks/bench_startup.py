@@ -0,0 +1,117 @@
+"""
+Startup profiler for the gRPC server
+1. Import time: runs `python -X importtime -c "import server.server"` and
+   lists the slowest imports (cumulative, including their children)
+2. Time to first request: starts `python -m server.server` for each model
+   artifact, with and without warm-up, and measures the time until the gRPC
+   health check reports SERVING, the latency of the first Predict and the
+   median latency of the following ones
+
+Usage: python -m benchmarks.bench_startup [--top N] [--requests N]
+"""
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import numpy as np
+import grpc
+from grpc_health.v1 import health_pb2, health_pb2_grpc
+
+import model_pb2_grpc
+from client.predictor import make_request
+
+MODELS = ['models/model.pkl', 'models/model.forest']
+STARTUP_TIMEOUT_S = 60
+
+def import_profile(top):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import server.server'],
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    total = next(cumulative for cumulative, _, name in rows if name.strip() == 'server.server')
+    print(f"\n=== Import time of server.server: {total / 1000:.1f} ms ===")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for cumulative, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:>9.1f} ms {self_us / 1000:>7.1f} ms  {name}")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
+
+def wait_listening(port, deadline):
+    """Poll the port itself: a gRPC channel opened before the server listens
+    sits in reconnect backoff for seconds, which would swamp the measurement"""
+    while time.perf_counter() < deadline:
+        try:
+            socket.create_connection(('localhost', port), timeout=0.1).close()
+            return True
+        except OSError:
+            time.sleep(0.005)
+    return False
+
+def wait_serving(channel, deadline):
+    health = health_pb2_grpc.HealthStub(channel)
+    request = health_pb2.HealthCheckRequest(service='mlservice.v1.PredictionService')
+    while time.perf_counter() < deadline:
+        try:
+            if health.Check(request, timeout=0.5).status == health_pb2.HealthCheckResponse.SERVING:
+                return True
+        except grpc.RpcError:
+            pass
+        time.sleep(0.005)
+    return False
+
+def time_to_first_request(model_path, warmup_rounds, requests):
+    port = free_port()
+    env = dict(os.environ, MODEL_PATH=model_path, PORT=str(port), METRICS_PORT=str(free_port()),
+               WARMUP_ROUNDS=str(warmup_rounds), MODEL_WATCH_INTERVAL_S='0', PYTHONPATH=os.getcwd())
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'server.server'], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = start + STARTUP_TIMEOUT_S
+        if not wait_listening(port, deadline):
+            raise RuntimeError(f"server with {model_path} did not start listening")
+        with grpc.insecure_channel(f'localhost:{port}') as channel:
+            if not wait_serving(channel, deadline):
+                raise RuntimeError(f"server with {model_path} did not become SERVING")
+            serving = time.perf_counter() - start
+            stub = model_pb2_grpc.PredictionServiceStub(channel)
+            request = make_request([5.1, 3.5, 1.4, 0.2])
+            latencies = []
+            for _ in range(requests + 1):
+                t = time.perf_counter()
+                stub.Predict(request)
+                latencies.append(time.perf_counter() - t)
+        return serving, latencies[0], float(np.median(latencies[1:]))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=20, help='slowest imports to list')
+    parser.add_argument('--requests', type=int, default=50, help='requests after the first one')
+    args = parser.parse_args()
+
+    import_profile(args.top)
+
+    print("\n=== Time to first request ===")
+    print(f"{'model':>22} {'warm-up':>8} {'to SERVING':>12} {'1st Predict':>12} {'steady':>10}")
+    for path in MODELS:
+        for warmup_rounds in (0, 8):
+            serving, first, steady = time_to_first_request(path, warmup_rounds, args.requests)
+            print(f"{path:>22} {'on' if warmup_rounds else 'off':>8} {serving * 1000:>9.0f} ms "
+                  f"{first * 1000:>9.2f} ms {steady * 1000:>7.2f} ms")
+
+if __name__ == '__main__':
+    main()
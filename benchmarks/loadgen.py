@@ -0,0 +1,274 @@
+"""
+Load generator and latency benchmark for the prediction service
+Sends Predict (--batch 1) or PredictBatch requests to one of the targets
+  inproc  PredictionService handlers in this process (validation + model, no network)
+  grpc    a running gRPC server (python -m server.server)
+  http    a running FastAPI app (uvicorn app.main:api)
+
+With --rate the load is open-loop: request i is due at start + i / rate no
+matter how long earlier requests took, and its latency is measured from that
+due time. A stalled server therefore shows up as queueing delay in every
+request it held back instead of as a single slow sample (coordinated
+omission). --concurrency bounds the requests in flight; if it is too low to
+sustain the rate, requests start late and the report says so. Without --rate
+every worker sends back-to-back (closed loop) and only service time is meaningful.
+
+Reports throughput and p50/p90/p99/p999 latency as JSON.
+
+Usage: python -m benchmarks.loadgen --target grpc --rate 500 --concurrency 16 --duration 30
+       python -m benchmarks.loadgen --target inproc --batch 64 --encoding dense --output run.json
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+import numpy as np
+
+import model_pb2
+from client.predictor import FEATURE_NAMES, make_dense_batch_request, make_request
+
+TARGETS = ('inproc', 'grpc', 'http')
+ENCODINGS = ('features', 'dense')
+PAYLOAD_POOL = 256
+PERCENTILES = {'p50': 50.0, 'p90': 90.0, 'p99': 99.0, 'p999': 99.9}
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram with ~1% relative error.
+
+    Fixed memory regardless of run length, and histograms of several
+    workers can be merged.
+    """
+    PRECISION = 0.01
+    MIN_US = 1.0
+    MAX_US = 3600e6
+
+    def __init__(self):
+        self._log_base = math.log1p(self.PRECISION)
+        self.counts = np.zeros(self._bucket(self.MAX_US) + 1, dtype=np.int64)
+        self.total = 0
+        self.sum_us = 0.0
+        self.max_us = 0.0
+
+    def _bucket(self, value_us: float) -> int:
+        return math.ceil(math.log(max(value_us, self.MIN_US) / self.MIN_US) / self._log_base)
+
+    def record(self, seconds: float):
+        value_us = min(seconds * 1e6, self.MAX_US)
+        self.counts[self._bucket(value_us)] += 1
+        self.total += 1
+        self.sum_us += value_us
+        self.max_us = max(self.max_us, value_us)
+
+    def merge(self, other: "LatencyHistogram"):
+        self.counts += other.counts
+        self.total += other.total
+        self.sum_us += other.sum_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th percentile, in microseconds"""
+        if self.total == 0:
+            return 0.0
+        rank = max(1, math.ceil(q / 100.0 * self.total))
+        bucket = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self.MIN_US * math.exp(bucket * self._log_base), self.max_us)
+
+    def summary_ms(self) -> dict:
+        summary = {name: round(self.percentile(q) / 1000, 3) for name, q in PERCENTILES.items()}
+        summary['max'] = round(self.max_us / 1000, 3)
+        summary['mean'] = round(self.sum_us / self.total / 1000, 3) if self.total else 0.0
+        return summary
+
+def make_rows(n: int, batch: int, seed: int) -> list:
+    """n payloads of `batch` iris-like rows; varied so the prediction cache does not hide the model"""
+    rng = np.random.default_rng(seed)
+    low, high = np.array([4.3, 2.0, 1.0, 0.1]), np.array([7.9, 4.4, 6.9, 2.5])
+    return [rng.uniform(low, high, size=(batch, len(FEATURE_NAMES))).round(2).tolist() for _ in range(n)]
+
+def make_grpc_payload(rows: list, encoding: str):
+    if len(rows) == 1:
+        if encoding == 'dense':
+            dense = make_dense_batch_request(rows).dense
+            return model_pb2.PredictRequest(dense=dense)
+        return make_request(rows[0])
+    if encoding == 'dense':
+        return make_dense_batch_request(rows)
+    return model_pb2.PredictBatchRequest(rows=[make_request(row) for row in rows])
+
+def make_http_payload(rows: list) -> dict:
+    requests = [{'features': [{'name': name, 'value': value} for name, value in zip(FEATURE_NAMES, row)]}
+                for row in rows]
+    return requests[0] if len(rows) == 1 else {'rows': requests}
+
+def inproc_target(args):
+    """Call the PredictionService handlers directly; returns (send, close)"""
+    from server.server import PredictionService
+    service = PredictionService(start_metrics=False)
+    service.warm_up()
+    payloads = [make_grpc_payload(rows, args.encoding) for rows in make_rows(PAYLOAD_POOL, args.batch, args.seed)]
+    if args.batch == 1:
+        method, handler, empty = 'Predict', service._predict, model_pb2.PredictResponse
+    else:
+        method, handler, empty = 'PredictBatch', service._predict_batch, model_pb2.PredictBatchResponse
+
+    def send(i):
+        _, code, _ = service._invoke(method, handler, payloads[i % len(payloads)], empty)
+        return 'OK' if code is None else code.name
+
+    return send, service.close
+
+def grpc_target(args):
+    import grpc
+    import model_pb2_grpc
+    channel = grpc.insecure_channel(args.address)
+    grpc.channel_ready_future(channel).result(timeout=args.timeout)
+    stub = model_pb2_grpc.PredictionServiceStub(channel)
+    call = stub.Predict if args.batch == 1 else stub.PredictBatch
+    payloads = [make_grpc_payload(rows, args.encoding) for rows in make_rows(PAYLOAD_POOL, args.batch, args.seed)]
+
+    def send(i):
+        try:
+            call(payloads[i % len(payloads)], timeout=args.timeout)
+            return 'OK'
+        except grpc.RpcError as e:
+            return e.code().name
+
+    return send, channel.close
+
+def http_target(args):
+    try:
+        import httpx
+    except ImportError:
+        sys.exit("The http target needs httpx: pip install httpx")
+    if args.encoding == 'dense':
+        sys.exit("The HTTP app accepts named features only; use --encoding features")
+    client = httpx.Client(base_url=args.url, timeout=args.timeout,
+                          limits=httpx.Limits(max_connections=args.concurrency))
+    path = '/predict' if args.batch == 1 else '/predict_batch'
+    payloads = [make_http_payload(rows) for rows in make_rows(PAYLOAD_POOL, args.batch, args.seed)]
+
+    def send(i):
+        try:
+            status = client.post(path, json=payloads[i % len(payloads)]).status_code
+            return 'OK' if status == 200 else f'HTTP_{status}'
+        except httpx.HTTPError as e:
+            return type(e).__name__
+
+    return send, client.close
+
+def run(send, rate: float, concurrency: int, duration: float, warmup: float, drain: float) -> dict:
+    """Drive `send` from `concurrency` threads; measurements start after `warmup` seconds.
+
+    In open-loop mode requests already due at the end are still sent for up
+    to `drain` seconds; the rest are reported as UNSENT.
+    """
+    interval = 1.0 / rate if rate > 0 else 0.0
+    start = time.perf_counter() + 0.05
+    measure_from, end = start + warmup, start + warmup + duration
+    next_index = iter(range(sys.maxsize)).__next__  # atomic under the GIL
+    results = []
+
+    def worker():
+        latency, service_time, outcomes = LatencyHistogram(), LatencyHistogram(), Counter()
+        late = 0
+        while True:
+            i = next_index()
+            now = time.perf_counter()
+            due = start + i * interval if interval else now
+            if due >= end:
+                break
+            if now >= end + drain * bool(interval):
+                outcomes['UNSENT'] += due >= measure_from
+                continue
+            if due > now:
+                time.sleep(due - now)
+            sent = time.perf_counter()
+            outcome = send(i)
+            done = time.perf_counter()
+            if due < measure_from:
+                continue
+            outcomes[outcome] += 1
+            service_time.record(done - sent)
+            latency.record(done - due)
+            late += sent - due > 0.001
+        results.append((latency, service_time, outcomes, late))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - measure_from if interval else end - measure_from
+
+    latency, service_time, outcomes = LatencyHistogram(), LatencyHistogram(), Counter()
+    late = 0
+    for worker_latency, worker_service_time, worker_outcomes, worker_late in results:
+        latency.merge(worker_latency)
+        service_time.merge(worker_service_time)
+        outcomes.update(worker_outcomes)
+        late += worker_late
+    return {'latency': latency, 'service_time': service_time, 'outcomes': outcomes, 'late': late,
+            'elapsed': elapsed}
+
+def report(args, result) -> dict:
+    total = result['latency'].total
+    errors = sum(count for outcome, count in result['outcomes'].items() if outcome not in ('OK', 'UNSENT'))
+    elapsed = max(result['elapsed'], 1e-9)
+    report = {
+        'config': {
+            'target': args.target, 'rate': args.rate, 'concurrency': args.concurrency, 'batch': args.batch,
+            'encoding': args.encoding, 'duration_s': args.duration, 'warmup_s': args.warmup,
+            'open_loop': args.rate > 0,
+        },
+        'requests': total,
+        'errors': errors,
+        'outcomes': dict(result['outcomes']),
+        'throughput_rps': round(total / elapsed, 2),
+        'rows_per_s': round(total * args.batch / elapsed, 2),
+        # Measured from the scheduled send time in open-loop mode
+        'latency_ms': result['latency'].summary_ms(),
+        'service_time_ms': result['service_time'].summary_ms(),
+    }
+    if args.rate > 0:
+        report['late_requests'] = result['late']
+        report['achieved_rate_ratio'] = round(total / elapsed / args.rate, 3)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=TARGETS, default='grpc')
+    parser.add_argument('--address', default=os.getenv('GRPC_SERVER_ADDRESS', 'localhost:50051'), help='gRPC target')
+    parser.add_argument('--url', default='http://localhost:8080', help='HTTP target base URL')
+    parser.add_argument('--rate', type=float, default=0.0, help='requests/sec, open-loop; 0 = closed loop')
+    parser.add_argument('--concurrency', type=int, default=8, help='maximum requests in flight')
+    parser.add_argument('--duration', type=float, default=10.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=2.0, help='seconds of load before measuring')
+    parser.add_argument('--batch', type=int, default=1, help='rows per request; >1 uses PredictBatch')
+    parser.add_argument('--encoding', choices=ENCODINGS, default='features', help='gRPC payload encoding')
+    parser.add_argument('--timeout', type=float, default=10.0, help='per-request timeout, seconds')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+    if args.batch < 1 or args.concurrency < 1 or args.duration <= 0:
+        parser.error('--batch and --concurrency must be >= 1 and --duration > 0')
+
+    send, close = {'inproc': inproc_target, 'grpc': grpc_target, 'http': http_target}[args.target](args)
+    try:
+        result = run(send, args.rate, args.concurrency, args.duration, args.warmup, args.timeout)
+    finally:
+        close()
+
+    text = json.dumps(report(args, result), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Microbenchmarks of the inference hot path, one stage at a time
+  proto      parsing PredictRequest / PredictBatchRequest bytes
+  pydantic   parsing the HTTP app's request bodies (app/schemas.py)
+  validate   features_to_dict, request_to_row, batch_to_matrix
+  predict    ModelRunner.predict / predict_many for each model artifact
+             (100 and 200 trees) and inference backend
+for several row counts. Each benchmark loops until one sample takes at least
+--min-time seconds and keeps the fastest of --repeat samples, reported per call.
+Service logging is raised to WARNING so console output is not timed.
+
+Results can be saved and compared against a baseline; the run fails (exit 1)
+when any benchmark is slower than the baseline by more than --threshold.
+Baselines are machine specific: record one on the machine that compares.
+
+Usage: python -m benchmarks.microbench [--filter SUBSTR] [--save [PATH]] [--compare [PATH]] [--threshold 0.1]
+"""
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import numpy as np
+import pydantic
+import sklearn
+
+import model_pb2
+from app.schemas import PredictBatchRequest, PredictRequest
+from client.predictor import FEATURE_NAMES, make_dense_batch_request, make_request
+from server import logger as _logger
+from server.inference import ModelRunner
+from server.validation import batch_to_matrix, features_to_dict, request_to_row
+
+MODELS = ['models/model.pkl', 'models/model_v2.pkl']
+BACKENDS = ['sklearn', 'compiled']
+ROW_COUNTS = [1, 16, 128, 1024]
+BASELINE = 'benchmarks/microbench_baseline.json'
+
+def make_rows(n: int) -> np.ndarray:
+    rng = np.random.default_rng(42)
+    low, high = np.array([4.3, 2.0, 1.0, 0.1]), np.array([7.9, 4.4, 6.9, 2.5])
+    return rng.uniform(low, high, size=(n, len(FEATURE_NAMES))).round(2)
+
+def http_body(rows: np.ndarray) -> bytes:
+    requests = [{'features': [{'name': name, 'value': value} for name, value in zip(FEATURE_NAMES, row)]}
+                for row in rows.tolist()]
+    return json.dumps({'rows': requests}).encode()
+
+def benchmarks() -> dict:
+    """name -> zero-argument callable"""
+    cases = {}
+    one = make_rows(1)
+    request = make_request(one[0].tolist())
+    request_bytes = request.SerializeToString()
+    single_body = json.dumps(json.loads(http_body(one))['rows'][0]).encode()
+
+    cases['proto/PredictRequest'] = lambda: model_pb2.PredictRequest.FromString(request_bytes)
+    cases['pydantic/PredictRequest'] = lambda: PredictRequest.model_validate_json(single_body)
+    cases['validate/features_to_dict'] = lambda: features_to_dict(request.features)
+
+    schema_runner = ModelRunner(MODELS[0])
+    schema = schema_runner.schema
+    cases['validate/request_to_row'] = lambda: request_to_row(request, schema)
+
+    for n in ROW_COUNTS[1:]:
+        X = make_rows(n)
+        rows_request = model_pb2.PredictBatchRequest(rows=[make_request(row) for row in X.tolist()])
+        dense_request = make_dense_batch_request(X.tolist())
+        rows_bytes, dense_bytes, body = rows_request.SerializeToString(), dense_request.SerializeToString(), http_body(X)
+        cases[f'proto/PredictBatchRequest/rows/n={n}'] = lambda b=rows_bytes: model_pb2.PredictBatchRequest.FromString(b)
+        cases[f'proto/PredictBatchRequest/dense/n={n}'] = lambda b=dense_bytes: model_pb2.PredictBatchRequest.FromString(b)
+        cases[f'pydantic/PredictBatchRequest/n={n}'] = lambda b=body: PredictBatchRequest.model_validate_json(b)
+        cases[f'validate/batch_to_matrix/rows/n={n}'] = lambda r=rows_request: batch_to_matrix(r, schema)
+        cases[f'validate/batch_to_matrix/dense/n={n}'] = lambda r=dense_request: batch_to_matrix(r, schema)
+
+    for path in MODELS:
+        for backend in BACKENDS:
+            runner = ModelRunner(path, backend=backend)
+            prefix = f'predict/{path.rsplit("/", 1)[-1]}/{backend}'
+            cases[f'{prefix}/predict'] = lambda r=runner: r.predict(one[0], True)
+            for n in ROW_COUNTS:
+                X = make_rows(n)
+                cases[f'{prefix}/predict_many/n={n}'] = lambda r=runner, X=X: r.predict_many(X, True)
+    return cases
+
+def measure(fn, min_time: float, repeat: int) -> float:
+    """Seconds per call: fastest of `repeat` samples of `loops` calls each"""
+    fn()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best
+
+def environment() -> dict:
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'sklearn': sklearn.__version__,
+            'pydantic': pydantic.__version__, 'machine': platform.machine(), 'processor': platform.processor()}
+
+def format_time(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f'{seconds * 1e3:.3f} ms'
+    return f'{seconds * 1e6:.2f} us'
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Print a comparison table; return the names of regressed benchmarks"""
+    regressions = []
+    print(f"\n{'benchmark':<52} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f'{name:<52} {"-":>12} {format_time(seconds):>12} {"new":>8}')
+            continue
+        change = seconds / before - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:<52} {format_time(before):>12} {format_time(seconds):>12} {change:>+7.1%}{flag}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', default='', help='run only benchmarks whose name contains this')
+    parser.add_argument('--min-time', type=float, default=0.05, help='seconds per sample')
+    parser.add_argument('--repeat', type=int, default=5, help='samples per benchmark')
+    parser.add_argument('--save', nargs='?', const=BASELINE, metavar='PATH', help=f'save results (default {BASELINE})')
+    parser.add_argument('--compare', nargs='?', const=BASELINE, metavar='PATH', help=f'compare with a baseline (default {BASELINE})')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown, 0.10 = 10%%')
+    args = parser.parse_args()
+
+    _logger.service_logger.setLevel(logging.WARNING)
+    cases = {name: fn for name, fn in benchmarks().items() if args.filter in name}
+    results = {}
+    for name, fn in cases.items():
+        results[name] = measure(fn, args.min_time, args.repeat)
+        if not args.compare:
+            print(f'{name:<52} {format_time(results[name]):>12}')
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            exit_code = 1
+        else:
+            print(f"\nNo regressions above {args.threshold:.0%}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+            f.write('\n')
+        print(f"Results saved to {args.save}")
+    sys.exit(exit_code)
+
+if __name__ == '__main__':
+    main()
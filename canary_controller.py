@@ -0,0 +1,357 @@
+"""
+Automated canary analysis: advance, hold or roll back a canary from Prometheus metrics.
+
+Every --interval seconds the controller reads the cumulative counters of
+both versions (prediction_duration_seconds histogram, errors_total) and
+compares the traffic since the current stage started:
+  latency     Mann-Whitney U test on the histogram buckets (one-sided,
+              canary slower) plus the p50/p99 ratio estimated like
+              histogram_quantile()
+  errors      exact conditional binomial test (canary error rate higher)
+  throughput  binomial z-test of the canary's share of requests against
+              its configured weight
+A difference fails the canary only when it is both significant and larger
+than its tolerance. A stage is tested every interval, so --alpha is split
+evenly over the analyses a stage can get (Bonferroni) to keep the chance of
+rolling back a healthy canary per stage below --alpha. Failing rolls back right away. Passing
+advances to the next stage once the stage has run --min-stage seconds
+with at least --min-requests canary requests. Anything else holds the
+stage. A stage still held after --max-stage seconds rolls back: the
+canary never reaches 100% without evidence that it is no slower.
+
+Stages are applied with canary_deploy.sh (Envoy weights, --apply script),
+SetTrafficSplit on an in-process split (--apply grpc) or only logged
+(--apply none).
+
+tests/test_canary_controller.py runs the controller against synthetic
+metrics of healthy, slower, erroring and starved canaries.
+
+Usage: python canary_controller.py --prometheus http://localhost:9090 --apply script
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+from typing import NamedTuple
+
+import numpy as np
+
+import server.logger as _logger
+
+logger = _logger.service_logger
+
+ADVANCE, HOLD, ROLLBACK = "advance", "hold", "rollback"
+SCRIPT_STAGES = (10, 50, 90, 100)
+
+
+class Snapshot(NamedTuple):
+    """Cumulative counters of one version at one point in time."""
+    bounds: tuple       # histogram upper bounds, +Inf last
+    buckets: np.ndarray  # cumulative count per bound
+    errors: float
+
+    @property
+    def requests(self) -> float:
+        return float(self.buckets[-1]) if len(self.buckets) else 0.0
+
+    def since(self, start: "Snapshot") -> "Snapshot":
+        """Counts between ``start`` and this snapshot; a counter reset restarts the window."""
+        if start is None or start.bounds != self.bounds or (self.buckets < start.buckets).any() \
+                or self.errors < start.errors:
+            return self
+        return Snapshot(self.bounds, self.buckets - start.buckets, self.errors - start.errors)
+
+
+class Thresholds(NamedTuple):
+    alpha: float = 0.01
+    # Largest tolerated P(canary request slower than baseline request); 0.5 means no difference
+    max_slower_probability: float = 0.55
+    max_p50_ratio: float = 1.25
+    max_p99_ratio: float = 1.5
+    # Absolute error rate increase tolerated, e.g. 0.005 = +0.5 percentage points
+    max_error_rate_increase: float = 0.005
+    # Lowest tolerated canary share of requests relative to its weight
+    min_throughput_ratio: float = 0.8
+    min_requests: int = 500
+
+
+class Verdict(NamedTuple):
+    decision: str
+    reasons: list
+    stats: dict
+
+
+def _normal_sf(z: float) -> float:
+    """P(Z > z) for a standard normal Z."""
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def mann_whitney_binned(baseline: np.ndarray, canary: np.ndarray) -> tuple[float, float]:
+    """One-sided Mann-Whitney U test that canary values tend to be larger, on per-bucket counts.
+
+    Values in one bucket are ties and get the bucket's mid-rank. Returns the
+    p-value (normal approximation with tie correction) and the probability
+    that a canary value exceeds a baseline value, ties counted as half.
+    """
+    n1, n2 = baseline.sum(), canary.sum()
+    if n1 == 0 or n2 == 0:
+        return 1.0, 0.5
+    totals = baseline + canary
+    midranks = np.cumsum(totals) - (totals - 1) / 2.0
+    u = float((canary * midranks).sum()) - n2 * (n2 + 1) / 2.0
+    n = n1 + n2
+    tie_term = float((totals ** 3 - totals).sum()) / (n * (n - 1))
+    variance = n1 * n2 / 12.0 * ((n + 1) - tie_term)
+    if variance <= 0:
+        return 1.0, u / (n1 * n2)
+    z = (u - n1 * n2 / 2.0) / math.sqrt(variance)
+    return _normal_sf(z), u / (n1 * n2)
+
+
+def binomial_upper_tail(k: int, n: int, p: float) -> float:
+    """P(X >= k) for X ~ Binomial(n, p)."""
+    if k <= 0:
+        return 1.0
+    if p <= 0:
+        return 0.0
+    if p >= 1:
+        return 1.0
+    log_p, log_q = math.log(p), math.log1p(-p)
+    terms = [math.lgamma(n + 1) - math.lgamma(i + 1) - math.lgamma(n - i + 1) + i * log_p + (n - i) * log_q
+             for i in range(k, n + 1)]
+    top = max(terms)
+    return min(1.0, math.exp(top) * sum(math.exp(t - top) for t in terms))
+
+
+def error_rate_test(errors_a: float, total_a: float, errors_b: float, total_b: float) -> float:
+    """One-sided p-value that the error rate of b exceeds that of a.
+
+    Exact conditional test: given the errors of both, under equal rates the
+    errors of b follow Binomial(errors, total_b / (total_a + total_b)). Errors
+    are rare, where the normal approximation would reject far too often.
+    """
+    if total_a == 0 or total_b == 0:
+        return 1.0
+    return binomial_upper_tail(int(errors_b), int(errors_a + errors_b), total_b / (total_a + total_b))
+
+
+def binomial_lower_test(successes: float, total: float, expected: float) -> float:
+    """One-sided p-value that the success probability is below ``expected``."""
+    if total == 0 or expected <= 0 or expected >= 1:
+        return 1.0
+    z = (successes - total * expected) / math.sqrt(total * expected * (1 - expected))
+    return _normal_sf(-z)
+
+
+def histogram_quantile(q: float, bounds: tuple, cumulative: np.ndarray) -> float:
+    """Quantile from cumulative bucket counts, interpolated like Prometheus' histogram_quantile()."""
+    total = cumulative[-1]
+    if total == 0:
+        return float("nan")
+    rank = q * total
+    i = int(np.searchsorted(cumulative, rank))
+    if i >= len(bounds) - 1:
+        return bounds[-2]  # the +Inf bucket: highest finite bound, as Prometheus does
+    lower = bounds[i - 1] if i > 0 else 0.0
+    below = cumulative[i - 1] if i > 0 else 0.0
+    in_bucket = cumulative[i] - below
+    return lower + (bounds[i] - lower) * ((rank - below) / in_bucket if in_bucket else 1.0)
+
+
+def analyze(baseline: Snapshot, canary: Snapshot, canary_weight: float, thresholds: Thresholds) -> Verdict:
+    """Compare the windows of both versions; ADVANCE means enough evidence that the canary is fine."""
+    t = thresholds
+    stats = {"baseline_requests": baseline.requests, "canary_requests": canary.requests}
+    if canary.requests < t.min_requests or baseline.requests < t.min_requests:
+        return Verdict(HOLD, [f"waiting for {t.min_requests} requests per version"], stats)
+
+    failures, doubts = [], []
+    base_counts = np.diff(baseline.buckets, prepend=0.0)
+    canary_counts = np.diff(canary.buckets, prepend=0.0)
+    p_latency, slower = mann_whitney_binned(base_counts, canary_counts)
+    stats.update(latency_p_value=p_latency, slower_probability=slower)
+    for q, limit in ((0.5, t.max_p50_ratio), (0.99, t.max_p99_ratio)):
+        base_q = histogram_quantile(q, baseline.bounds, baseline.buckets)
+        canary_q = histogram_quantile(q, canary.bounds, canary.buckets)
+        ratio = canary_q / base_q if base_q > 0 else 1.0
+        name = f"p{int(q * 100)}"
+        stats.update({f"baseline_{name}_s": base_q, f"canary_{name}_s": canary_q, f"{name}_ratio": ratio})
+        if ratio > limit:
+            (failures if p_latency < t.alpha else doubts).append(f"{name} {ratio:.2f}x baseline (limit {limit}x)")
+    if slower > t.max_slower_probability:
+        (failures if p_latency < t.alpha else doubts).append(
+            f"canary slower in {slower:.0%} of request pairs (p={p_latency:.2g})")
+
+    base_rate = baseline.errors / baseline.requests
+    canary_rate = canary.errors / canary.requests
+    p_errors = error_rate_test(baseline.errors, baseline.requests, canary.errors, canary.requests)
+    stats.update(baseline_error_rate=base_rate, canary_error_rate=canary_rate, errors_p_value=p_errors)
+    if canary_rate - base_rate > t.max_error_rate_increase:
+        (failures if p_errors < t.alpha else doubts).append(
+            f"error rate {canary_rate:.2%} vs {base_rate:.2%} (p={p_errors:.2g})")
+
+    if 0 < canary_weight < 100:
+        expected = canary_weight / 100.0
+        total = canary.requests + baseline.requests
+        share = canary.requests / total
+        p_share = binomial_lower_test(canary.requests, total, expected)
+        stats.update(canary_share=share, expected_share=expected, throughput_p_value=p_share)
+        if share < expected * t.min_throughput_ratio:
+            (failures if p_share < t.alpha else doubts).append(
+                f"canary served {share:.1%} of requests, expected {expected:.0%} (p={p_share:.2g})")
+
+    if failures:
+        return Verdict(ROLLBACK, failures, stats)
+    if doubts:
+        return Verdict(HOLD, doubts, stats)
+    return Verdict(ADVANCE, [], stats)
+
+
+class PrometheusSource:
+    """Reads the counters of a model version through the Prometheus HTTP API."""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _query(self, expr: str) -> list:
+        query = urllib.parse.urlencode({"query": expr})
+        with urllib.request.urlopen(f"{self.url}/api/v1/query?{query}", timeout=self.timeout) as response:
+            body = json.load(response)
+        if body.get("status") != "success":
+            raise RuntimeError(f"Prometheus query {expr!r} failed: {body.get('error')}")
+        return body["data"]["result"]
+
+    def snapshot(self, version: str) -> Snapshot:
+        selector = f'model_version="{version}"'
+        buckets = {float(r["metric"]["le"]): float(r["value"][1])
+                   for r in self._query(f"sum by (le) (prediction_duration_seconds_bucket{{{selector}}})")}
+        errors = self._query(f"sum(errors_total{{{selector}}})")
+        bounds = tuple(sorted(buckets))
+        return Snapshot(bounds, np.array([buckets[b] for b in bounds]), float(errors[0]["value"][1]) if errors else 0.0)
+
+
+class ScriptApplier:
+    """Applies stages with canary_deploy.sh (Envoy cluster weights)."""
+
+    def __init__(self, script: str = "./canary_deploy.sh"):
+        self.script = script
+
+    def __call__(self, canary_weight: float):
+        stage = "rollback" if canary_weight == 0 else str(int(canary_weight))
+        subprocess.run([self.script, stage], check=True)
+
+
+class GrpcApplier:
+    """Applies stages with SetTrafficSplit on a server serving both versions in process."""
+
+    def __init__(self, address: str, baseline: str, canary: str):
+        import grpc
+        import model_pb2, model_pb2_grpc
+        self._pb2 = model_pb2
+        self._stub = model_pb2_grpc.PredictionServiceStub(grpc.insecure_channel(address))
+        self.baseline, self.canary = baseline, canary
+
+    def __call__(self, canary_weight: float):
+        weights = {self.baseline: 100.0 - canary_weight, self.canary: canary_weight}
+        self._stub.SetTrafficSplit(self._pb2.TrafficSplit(weights=weights), timeout=10,
+                                   metadata=[("x-admin-token", os.getenv("ADMIN_TOKEN", ""))])
+
+
+class CanaryController:
+    def __init__(self, source, apply, baseline: str, canary: str, stages=SCRIPT_STAGES,
+                 thresholds: Thresholds = Thresholds(), interval_s: float = 60.0, min_stage_s: float = 300.0,
+                 max_stage_s: float = 1800.0, sleep=time.sleep, clock=time.monotonic):
+        self.source = source
+        self.apply = apply
+        self.baseline, self.canary = baseline, canary
+        self.stages = list(stages)
+        self.thresholds = thresholds
+        self.interval_s = interval_s
+        self.min_stage_s = min_stage_s
+        self.max_stage_s = max_stage_s
+        self.sleep = sleep
+        self.clock = clock
+        looks = max(1, math.ceil(max_stage_s / interval_s))
+        self._per_look = thresholds._replace(alpha=thresholds.alpha / looks)
+
+    def run(self) -> tuple[str, float]:
+        """Walk the stages; returns ("promoted" | "rolled_back", last canary weight)."""
+        for weight in self.stages:
+            logger.info(f"Canary {self.canary}: stage {weight:g}%")
+            self.apply(weight)
+            if weight >= 100:
+                return "promoted", weight
+            started = self.clock()
+            start = {v: self.source.snapshot(v) for v in (self.baseline, self.canary)}
+            while True:
+                self.sleep(self.interval_s)
+                elapsed = self.clock() - started
+                verdict = analyze(self.source.snapshot(self.baseline).since(start[self.baseline]),
+                                  self.source.snapshot(self.canary).since(start[self.canary]),
+                                  weight, self._per_look)
+                stats = ", ".join(f"{k}={v:.4g}" for k, v in verdict.stats.items())
+                logger.info(f"Stage {weight:g}% after {elapsed:.0f}s: {verdict.decision}"
+                            f"{' (' + '; '.join(verdict.reasons) + ')' if verdict.reasons else ''}. {stats}")
+                if verdict.decision == ROLLBACK:
+                    return self._rollback(weight, verdict.reasons)
+                if verdict.decision == ADVANCE and elapsed >= self.min_stage_s:
+                    break
+                if elapsed >= self.max_stage_s:
+                    return self._rollback(weight, [f"stage not passed within {self.max_stage_s:.0f}s"]
+                                          + verdict.reasons)
+        return "promoted", self.stages[-1]
+
+    def _rollback(self, weight: float, reasons: list) -> tuple[str, float]:
+        logger.warning(f"Rolling back canary {self.canary} at {weight:g}%: {'; '.join(reasons)}")
+        self.apply(0)
+        return "rolled_back", weight
+
+
+def main():
+    DEFAULTS = Thresholds._field_defaults
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prometheus", default=os.getenv("PROMETHEUS_URL", "http://localhost:9090"))
+    parser.add_argument("--baseline", default="v1.0.0")
+    parser.add_argument("--canary", default="v2.0.0")
+    parser.add_argument("--stages", type=lambda s: [float(x) for x in s.split(",")], default=list(SCRIPT_STAGES),
+                        help="canary weights in percent, comma-separated (default 10,50,90,100)")
+    parser.add_argument("--apply", choices=("script", "grpc", "none"), default="script")
+    parser.add_argument("--grpc-server", default=os.getenv("GRPC_SERVER", "localhost:50051"),
+                        help="with --apply grpc: server holding both versions")
+    parser.add_argument("--interval", type=float, default=60.0, help="seconds between analyses")
+    parser.add_argument("--min-stage", type=float, default=300.0, help="seconds every stage runs at least")
+    parser.add_argument("--max-stage", type=float, default=1800.0, help="seconds after which a held stage rolls back")
+    parser.add_argument("--alpha", type=float, default=DEFAULTS['alpha'])
+    parser.add_argument("--min-requests", type=int, default=DEFAULTS['min_requests'])
+    parser.add_argument("--max-p50-ratio", type=float, default=DEFAULTS['max_p50_ratio'])
+    parser.add_argument("--max-p99-ratio", type=float, default=DEFAULTS['max_p99_ratio'])
+    parser.add_argument("--max-error-rate-increase", type=float, default=DEFAULTS['max_error_rate_increase'])
+    args = parser.parse_args()
+
+    thresholds = Thresholds(alpha=args.alpha, min_requests=args.min_requests, max_p50_ratio=args.max_p50_ratio,
+                            max_p99_ratio=args.max_p99_ratio, max_error_rate_increase=args.max_error_rate_increase)
+    if args.apply == "script":
+        if any(stage not in SCRIPT_STAGES for stage in args.stages):
+            parser.error(f"canary_deploy.sh only knows the stages {SCRIPT_STAGES}; use --apply grpc")
+        apply = ScriptApplier()
+    elif args.apply == "grpc":
+        apply = GrpcApplier(args.grpc_server, args.baseline, args.canary)
+    else:
+        apply = lambda weight: logger.info(f"Would set the canary weight to {weight:g}%")
+
+    controller = CanaryController(PrometheusSource(args.prometheus), apply, args.baseline, args.canary,
+                                  args.stages, thresholds, args.interval, args.min_stage, args.max_stage)
+    outcome, weight = controller.run()
+    print(f"Canary {args.canary} {outcome.replace('_', ' ')} at {weight:g}%")
+    sys.exit(0 if outcome == "promoted" else 2)
+
+
+if __name__ == "__main__":
+    main()
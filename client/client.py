@@ -1,50 +1,40 @@
+import argparse
 import os
-from pyexpat import features
 import sys
+import threading
 import grpc
-import logger as _logger
 import time
-import model_pb2, model_pb2_grpc
 
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
-from protos import model_pb2, model_pb2_grpc
+import model_pb2
+import server.logger as _logger
+from client.predictor import PredictionClient, make_request
 
 logger = _logger.service_logger
 
-def create_channel_with_retry(server_address, max_retries=15, retry_delay=2):
-    """Create gRPC channel with retry logic to handle server startup time."""
+# Example predictions
+TEST_CASES = [
+    [5.1, 3.5, 1.4, 0.2],  # Example 1
+    [6.7, 3.0, 5.2, 2.3],  # Example 2
+    [1.0, 2.0, 3.0, 4.0],  # Example 3
+]
+
+def connect(server_address, timeout=60.0) -> PredictionClient:
+    """Open a pooled client and wait until the server accepts connections.
+
+    The channels reconnect with backoff on their own, so there is no retry loop here.
+    """
     logger.info(f"Attempting to connect to {server_address}")
-    
-    for attempt in range(1, max_retries + 1):
-        try:
-            logger.info(f"Connection attempt {attempt}/{max_retries}...")
-            channel = grpc.insecure_channel(server_address)
-            
-            # Wait for channel to be ready (with timeout)
-            grpc.channel_ready_future(channel).result(timeout=5)
-            
-            logger.info(f"✓ Successfully connected to {server_address}")
-            return channel
-            
-        except grpc.FutureTimeoutError:
-            logger.warning(f"Connection timeout on attempt {attempt}")
-            if attempt < max_retries:
-                logger.info(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                logger.error(f"Failed to connect after {max_retries} attempts")
-                raise Exception(f"Could not connect to gRPC server at {server_address}")
-                
-        except Exception as e:
-            logger.warning(f"Connection attempt {attempt} failed: {e}")
-            if attempt < max_retries:
-                logger.info(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                logger.error(f"Failed to connect after {max_retries} attempts")
-                raise
+    client = PredictionClient(server_address)
+    try:
+        client.wait_ready(timeout)
+    except grpc.FutureTimeoutError:
+        client.close()
+        raise Exception(f"Could not connect to gRPC server at {server_address} within {timeout:.0f}s")
+    logger.info(f"✓ Successfully connected to {server_address}")
+    return client
 
 
 def run_health_check(stub):
@@ -68,21 +58,8 @@ def run_health_check(stub):
 def run_prediction(stub, features: list):
     """Get prediction"""
     try:
-        # Expected features input:
-        # [
-        #     {"name": "sepal_length", "value": 10.1},
-        #     {"name": "sepal_width",  "value": 3.5},
-        #     {"name": "petal_length", "value": 4.4},
-        #     {"name": "petal_width",  "value": 1.2}
-        # ]
-        features_names = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
-        features_dicts = []
-        for name, value in zip(features_names, features):
-            feature_dict = model_pb2.Feature(name=name, value=value)
-            features_dicts.append(feature_dict)
-        
         logger.info(f"Sending Predict request with features: {features}")
-        request = model_pb2.PredictRequest(features=features_dicts)
+        request = make_request(features)
         response = stub.Predict(request)
         
         print("\n=== Prediction ===")
@@ -97,21 +74,131 @@ def run_prediction(stub, features: list):
         raise
 
 
+def run_stream(stub, rows: list, max_inflight: int = 1024):
+    """Score rows over one PredictStream call, responses in request order.
+
+    At most max_inflight requests are sent ahead of the server's acks.
+    """
+    acked = 0
+    window_open = threading.Condition()
+
+    def requests():
+        for i, features in enumerate(rows):
+            with window_open:
+                window_open.wait_for(lambda: i - acked < max_inflight)
+            yield make_request(features, request_id=str(i))
+
+    responses = [None] * len(rows)
+    for response in stub.PredictStream(requests()):
+        if response.error:
+            logger.error(f"Stream request {response.request_id} failed: {response.error}")
+        responses[int(response.request_id)] = response
+        with window_open:
+            acked = response.acked
+            window_open.notify()
+    return responses
+
+
+def run_benchmark(client, num_rows: int):
+    """Compare rows/sec of sequential and pipelined Predict, PredictBatch and PredictStream"""
+    rows = [TEST_CASES[i % len(TEST_CASES)] for i in range(num_rows)]
+    stub = client.stub
+
+    start = time.perf_counter()
+    for features in rows:
+        stub.Predict(make_request(features))
+    unary = num_rows / (time.perf_counter() - start)
+
+    results = {}
+    for name, score in (("Pipelined Predict", lambda: client.predict_many(rows, max_inflight=64)),
+                        ("PredictBatch", lambda: client.predict_many(rows, max_inflight=8, batch_size=256)),
+                        ("PredictStream", lambda: run_stream(stub, rows))):
+        start = time.perf_counter()
+        score()
+        results[name] = num_rows / (time.perf_counter() - start)
+
+    print(f"\n=== Benchmark ({num_rows} rows) ===")
+    print(f"Unary Predict: {unary:.1f} rows/sec")
+    for name, rate in results.items():
+        print(f"{name}: {rate:.1f} rows/sec ({rate / unary:.1f}x)")
+    print("=" * 40)
+
+
+def run_traffic_split(stub, spec: str = None, shadow_version: str = "", shadow_fraction: float = None):
+    """Show the server's traffic split, or replace it when ``spec`` ("v1.0.0=90,v2.0.0=10") is given
+
+    Without ``shadow_fraction`` the shadow version scores every request.
+    """
+    try:
+        if spec is None:
+            response = stub.GetTrafficSplit(model_pb2.GetTrafficSplitRequest())
+        else:
+            weights = {}
+            for item in filter(None, (part.strip() for part in spec.split(","))):
+                version, _, weight = item.partition("=")
+                weights[version.strip()] = float(weight)
+            request = model_pb2.TrafficSplit(weights=weights, shadow_version=shadow_version,
+                                             shadow_fraction=shadow_fraction)
+            metadata = [("x-admin-token", os.getenv("ADMIN_TOKEN", ""))]
+            response = stub.SetTrafficSplit(request, metadata=metadata)
+
+        print("\n=== Traffic Split ===")
+        for version, weight in sorted(response.weights.items()):
+            print(f"{version}: {weight:g}")
+        if response.shadow_version:
+            print(f"Shadow: {response.shadow_version} ({response.shadow_fraction:.0%} of requests)")
+        print("=" * 40)
+
+        return response
+    except grpc.RpcError as e:
+        logger.error(f"Traffic split request failed: {e.code()} - {e.details()}")
+        raise
+
+
+def run_reload(stub, version: str = ""):
+    """Ask the server to reload a model version from its file"""
+    try:
+        metadata = [("x-admin-token", os.getenv("ADMIN_TOKEN", ""))]
+        response = stub.ReloadModel(model_pb2.ReloadModelRequest(model_version=version), metadata=metadata)
+
+        print("\n=== Reload ===")
+        print(f"Model Version: {response.model_version}")
+        print(f"Duration: {response.duration_seconds:.3f}s")
+        print("=" * 40)
+
+        return response
+    except grpc.RpcError as e:
+        logger.error(f"Reload failed: {e.code()} - {e.details()}")
+        raise
+
+
 def main():
     """Main client function"""
+    parser = argparse.ArgumentParser(description="ML gRPC service client")
+    parser.add_argument("--benchmark", type=int, metavar="ROWS",
+                        help="compare unary and streaming throughput for ROWS rows and exit")
+    parser.add_argument("--traffic-split", nargs="?", const="", metavar="SPEC",
+                        help='show the traffic split, or set it, e.g. "v1.0.0=90,v2.0.0=10", and exit')
+    parser.add_argument("--shadow", default="", metavar="VERSION",
+                        help="with --traffic-split SPEC: also score requests with VERSION and compare")
+    parser.add_argument("--shadow-fraction", type=float, default=None, metavar="F",
+                        help="with --shadow: share of requests to shadow-score (default: all)")
+    parser.add_argument("--reload", nargs="?", const="", metavar="VERSION",
+                        help="reload VERSION (default: the server's default version) from its file and exit")
+    args = parser.parse_args()
+
     server_address = os.getenv('GRPC_SERVER', 'localhost:50051')
     
     logger.info(f"Starting gRPC client for server: {server_address}")
     
-    # Create channel with retry logic
     try:
-        channel = create_channel_with_retry(server_address)
+        client = connect(server_address)
     except Exception as e:
         logger.error(f"Could not establish connection: {e}")
         sys.exit(1)
     
     try:
-        stub = model_pb2_grpc.PredictionServiceStub(channel)
+        stub = client.stub
         
         # Health check
         try:
@@ -119,15 +206,26 @@ def main():
         except Exception as e:
             logger.error(f"Health check error: {e}")
             return
+
+        if args.benchmark:
+            run_benchmark(client, args.benchmark)
+            return
+
+        if args.reload is not None:
+            try:
+                run_reload(stub, args.reload)
+            except grpc.RpcError:
+                sys.exit(1)
+            return
+
+        if args.traffic_split is not None:
+            try:
+                run_traffic_split(stub, args.traffic_split or None, args.shadow, args.shadow_fraction)
+            except grpc.RpcError:
+                sys.exit(1)
+            return
         
-        # Example predictions
-        test_cases = [
-            [5.1, 3.5, 1.4, 0.2],  # Example 1
-            [6.7, 3.0, 5.2, 2.3],  # Example 2
-            [1.0, 2.0, 3.0, 4.0],  # Example 3
-        ]
-        
-        for i, features in enumerate(test_cases, 1):
+        for i, features in enumerate(TEST_CASES, 1):
             print(f"\nTest {i}:")
             try:
                 run_prediction(stub, features)
@@ -151,8 +249,8 @@ def main():
                 logger.error(f"Error: {e}")
     
     finally:
-        # Close channel
-        channel.close()
+        # Close channels
+        client.close()
         logger.info("Connection closed")
 
 
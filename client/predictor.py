@@ -0,0 +1,442 @@
+"""Client library for PredictionService.
+
+``PredictionClient`` (threads, futures) and ``AsyncPredictionClient``
+(grpc.aio) spread calls round-robin over a pool of channels, each with its
+own HTTP/2 connection, so one connection's stream limit and the single
+thread that reads it are not the bottleneck. Behind a server started with
+several worker processes (SO_REUSEPORT) the connections also land on
+different workers. Retries of idempotent calls and keepalive pings are
+handled by gRPC itself through the channel's service config.
+
+``predict_many`` keeps up to ``max_inflight`` calls in flight and, with
+``batch_size``, sends rows as dense PredictBatch requests; servers without
+PredictBatch (UNIMPLEMENTED) get single-row Predict calls instead. Rows of
+calls a server sheds (RESOURCE_EXHAUSTED) come back with ``error`` set, so
+one refused call does not fail the rest.
+``BatchingClient`` coalesces concurrent single-row ``predict`` calls from
+many threads into PredictBatch requests.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional, Sequence
+
+import grpc
+
+import numpy as np
+
+import model_pb2
+import model_pb2_grpc
+
+# Standard logging: the client library does not depend on the server package
+logger = logging.getLogger(__name__)
+
+FEATURE_NAMES = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
+SERVICE_NAME = model_pb2.DESCRIPTOR.services_by_name['PredictionService'].full_name
+MAX_MESSAGE_LENGTH = 50 * 1024 * 1024
+
+
+def make_request(features: list, request_id: str = "", names: Sequence[str] = FEATURE_NAMES) -> model_pb2.PredictRequest:
+    """Build PredictRequest from feature values ordered as ``names``"""
+    # Expected features input:
+    # [
+    #     {"name": "sepal_length", "value": 10.1},
+    #     {"name": "sepal_width",  "value": 3.5},
+    #     {"name": "petal_length", "value": 4.4},
+    #     {"name": "petal_width",  "value": 1.2}
+    # ]
+    features_dicts = []
+    for name, value in zip(names, features):
+        feature_dict = model_pb2.Feature(name=name, value=value)
+        features_dicts.append(feature_dict)
+    return model_pb2.PredictRequest(features=features_dicts, request_id=request_id)
+
+
+def make_dense_batch_request(rows: list, return_probabilities: bool = False,
+                             names: Sequence[str] = FEATURE_NAMES) -> model_pb2.PredictBatchRequest:
+    """Build PredictBatchRequest with all rows packed as little-endian float64"""
+    values = np.asarray(rows, dtype="<f8").reshape(len(rows), len(names))
+    dense = model_pb2.DenseFeatures(names=names, num_rows=len(rows), raw_values=values.tobytes())
+    return model_pb2.PredictBatchRequest(dense=dense, return_probabilities=return_probabilities)
+
+
+def service_config(max_attempts: int = 4, initial_backoff_s: float = 0.05, max_backoff_s: float = 1.0) -> str:
+    """Service config JSON: retries for the idempotent methods and round-robin over resolved addresses.
+
+    UNAVAILABLE (connection lost, server restarting) is retried with
+    jittered exponential backoff. RESOURCE_EXHAUSTED is not: a server
+    shedding load (see server/admission.py) refuses in microseconds, so
+    retries would come back within the same overload; the caller should
+    slow down instead. ``retryThrottling`` stops retrying while more than
+    ~10% of calls fail. Admin methods and PredictStream are never retried.
+    """
+    return json.dumps({
+        "loadBalancingConfig": [{"round_robin": {}}],
+        "methodConfig": [{
+            "name": [{"service": SERVICE_NAME, "method": method} for method in ("Health", "Predict", "PredictBatch")],
+            "retryPolicy": {
+                "maxAttempts": max_attempts,
+                "initialBackoff": f"{initial_backoff_s}s",
+                "maxBackoff": f"{max_backoff_s}s",
+                "backoffMultiplier": 2,
+                "retryableStatusCodes": ["UNAVAILABLE"],
+            },
+        }],
+        "retryThrottling": {"maxTokens": 10, "tokenRatio": 0.1},
+    })
+
+
+def channel_options(keepalive_s: float = 30.0, keepalive_timeout_s: float = 10.0, retries: bool = True) -> list:
+    options = [
+        ("grpc.max_send_message_length", MAX_MESSAGE_LENGTH),
+        ("grpc.max_receive_message_length", MAX_MESSAGE_LENGTH),
+        # Ping idle connections too, so a dead one is noticed before a request is sent on it
+        ("grpc.keepalive_time_ms", int(keepalive_s * 1000)),
+        ("grpc.keepalive_timeout_ms", int(keepalive_timeout_s * 1000)),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+        # Channels with equal arguments share connections unless each keeps its own subchannels
+        ("grpc.use_local_subchannel_pool", 1),
+        ("grpc.enable_retries", int(retries)),
+    ]
+    if retries:
+        options.append(("grpc.service_config", service_config()))
+    return options
+
+
+def _prepare(request, model_version: str, return_probabilities: bool):
+    request.model_version = model_version
+    request.return_probabilities = return_probabilities
+    return request
+
+
+def _copy_outcome(call: grpc.Future, future: Future):
+    try:
+        future.set_result(call.result())
+    except grpc.RpcError as e:
+        future.set_exception(e)
+
+
+def _chunks(rows: Sequence, size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _shed(error: grpc.RpcError) -> bool:
+    return error.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+
+
+def _refused(error: grpc.RpcError, n: int) -> list:
+    """PredictResponses carrying the server's refusal for the ``n`` rows of a shed call"""
+    message = f"{error.code().name}: {error.details()}"
+    return [model_pb2.PredictResponse(error=message) for _ in range(n)]
+
+
+def _responses(results: list, sizes: list) -> list:
+    """Flatten per-call results (PredictResponses or lists of them) into rows; shed calls give RpcErrors"""
+    responses = []
+    for result, n in zip(results, sizes):
+        if isinstance(result, grpc.RpcError):
+            responses.extend(_refused(result, n))
+        elif isinstance(result, model_pb2.PredictResponse):
+            responses.append(result)
+        else:
+            responses.extend(result)
+    return responses
+
+
+class PredictionClient:
+    """Thread-safe client over ``pool_size`` channels to ``target``.
+
+    Rows are sequences of feature values ordered as ``feature_names``.
+    Every call takes ``timeout`` seconds (default ``self.timeout``).
+    """
+
+    def __init__(self, target: str, pool_size: int = 4, timeout: float = 5.0,
+                 feature_names: Sequence[str] = FEATURE_NAMES, options: Optional[list] = None):
+        self.target = target
+        self.timeout = timeout
+        self.feature_names = list(feature_names)
+        options = channel_options() if options is None else options
+        self._channels = [grpc.insecure_channel(target, options=options) for _ in range(max(1, pool_size))]
+        self._stubs = [model_pb2_grpc.PredictionServiceStub(channel) for channel in self._channels]
+        self._next_stub = itertools.cycle(self._stubs)
+        self._batch_supported = True
+
+    @property
+    def stub(self) -> model_pb2_grpc.PredictionServiceStub:
+        """The next stub in round-robin order; use it for calls the client does not wrap."""
+        return next(self._next_stub)
+
+    def _disable_batches(self):
+        self._batch_supported = False
+        logger.warning(f"{self.target} does not implement PredictBatch, sending rows one by one")
+
+    def wait_ready(self, timeout: float = 30.0):
+        """Block until every channel is connected; raises grpc.FutureTimeoutError."""
+        deadline = time.monotonic() + timeout
+        for channel in self._channels:
+            grpc.channel_ready_future(channel).result(timeout=max(0.0, deadline - time.monotonic()))
+
+    def close(self):
+        for channel in self._channels:
+            channel.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def health(self, timeout: float = None) -> model_pb2.HealthResponse:
+        return self.stub.Health(model_pb2.HealthRequest(), timeout=timeout or self.timeout)
+
+    def predict(self, features: Sequence[float], model_version: str = "", return_probabilities: bool = False,
+                timeout: float = None) -> model_pb2.PredictResponse:
+        request = _prepare(make_request(features, names=self.feature_names), model_version, return_probabilities)
+        return self.stub.Predict(request, timeout=timeout or self.timeout)
+
+    def predict_future(self, features: Sequence[float], model_version: str = "", return_probabilities: bool = False,
+                       timeout: float = None) -> grpc.Future:
+        """Send Predict without waiting; the returned future resolves to a PredictResponse."""
+        request = _prepare(make_request(features, names=self.feature_names), model_version, return_probabilities)
+        return self.stub.Predict.future(request, timeout=timeout or self.timeout)
+
+    def predict_batch(self, rows: Sequence[Sequence[float]], model_version: str = "",
+                      return_probabilities: bool = False, timeout: float = None) -> list:
+        """Score rows with one dense PredictBatch call; PredictResponses in row order."""
+        request = make_dense_batch_request(rows, return_probabilities, names=self.feature_names)
+        request.model_version = model_version
+        return list(self.stub.PredictBatch(request, timeout=timeout or self.timeout).predictions)
+
+    def predict_batch_future(self, rows: Sequence[Sequence[float]], model_version: str = "",
+                             return_probabilities: bool = False, timeout: float = None) -> grpc.Future:
+        request = make_dense_batch_request(rows, return_probabilities, names=self.feature_names)
+        request.model_version = model_version
+        return self.stub.PredictBatch.future(request, timeout=timeout or self.timeout)
+
+    def predict_many(self, rows: Sequence[Sequence[float]], model_version: str = "",
+                     return_probabilities: bool = False, max_inflight: int = 16, batch_size: int = 0,
+                     timeout: float = None) -> list:
+        """Score many rows with up to ``max_inflight`` calls in flight; PredictResponses in row order.
+
+        With ``batch_size`` > 1 rows are sent ``batch_size`` per PredictBatch
+        call. Rows of a call the server shed (RESOURCE_EXHAUSTED) get a
+        response with ``error`` set; any other failed call raises its
+        grpc.RpcError. The default ``max_inflight`` stays below the
+        server's initial admission limit (server/admission.py).
+        """
+        if batch_size > 1 and self._batch_supported:
+            try:
+                chunks = list(_chunks(rows, batch_size))
+                batches = self._pipeline(
+                    [lambda chunk=chunk: self.predict_batch_future(chunk, model_version, return_probabilities, timeout)
+                     for chunk in chunks], max_inflight)
+                return _responses([batch if isinstance(batch, grpc.RpcError) else batch.predictions
+                                   for batch in batches], [len(chunk) for chunk in chunks])
+            except grpc.RpcError as e:
+                if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                    raise
+                self._disable_batches()
+        results = self._pipeline(
+            [lambda row=row: self.predict_future(row, model_version, return_probabilities, timeout) for row in rows],
+            max_inflight)
+        return _responses(results, [1] * len(results))
+
+    @staticmethod
+    def _pipeline(calls: list, max_inflight: int) -> list:
+        """Start calls (zero-argument functions returning a future) with at most ``max_inflight`` pending.
+
+        A shed call gives its grpc.RpcError in place of a result.
+        """
+        window = threading.BoundedSemaphore(max(1, max_inflight))
+        futures = []
+        try:
+            for call in calls:
+                window.acquire()
+                future = call()
+                future.add_done_callback(lambda _: window.release())
+                futures.append(future)
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except grpc.RpcError as e:
+                    if not _shed(e):
+                        raise
+                    results.append(e)
+            return results
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+class BatchingClient:
+    """Coalesces concurrent single-row predictions into PredictBatch calls.
+
+    ``submit`` queues a row and returns a Future of its PredictResponse. A
+    background thread sends a batch once it holds ``max_batch_size`` rows
+    or ``max_delay_ms`` after its first row arrived; batches are sent
+    asynchronously, so several can be in flight. Rows with a different
+    model version or probability flag go into separate batches.
+    """
+
+    _STOP = object()
+
+    def __init__(self, client: PredictionClient, max_batch_size: int = 64, max_delay_ms: float = 2.0):
+        self.client = client
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_delay = max(0.0, max_delay_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="client-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, features: Sequence[float], model_version: str = "", return_probabilities: bool = False) -> Future:
+        future = Future()
+        self._queue.put(((model_version, return_probabilities), features, future))
+        return future
+
+    def predict(self, features: Sequence[float], model_version: str = "",
+                return_probabilities: bool = False) -> model_pb2.PredictResponse:
+        return self.submit(features, model_version, return_probabilities).result()
+
+    def close(self):
+        """Send the rows already queued and stop the batching thread."""
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is self._STOP:
+                break
+            items = [first]
+            deadline = time.perf_counter() + self.max_delay
+            while len(items) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                items.append(item)
+            groups = {}
+            for key, features, future in items:
+                groups.setdefault(key, []).append((features, future))
+            for (model_version, return_probabilities), group in groups.items():
+                self._send(model_version, return_probabilities, group)
+
+    def _send(self, model_version: str, return_probabilities: bool, group: list):
+        if not self.client._batch_supported:
+            self._send_rows(model_version, return_probabilities, group)
+            return
+        call = self.client.predict_batch_future([features for features, _ in group], model_version,
+                                                return_probabilities)
+        call.add_done_callback(lambda call: self._batch_done(call, model_version, return_probabilities, group))
+
+    def _batch_done(self, call: grpc.Future, model_version: str, return_probabilities: bool, group: list):
+        try:
+            predictions = call.result().predictions
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.UNIMPLEMENTED:
+                self.client._disable_batches()
+                self._send_rows(model_version, return_probabilities, group)
+                return
+            for _, future in group:
+                future.set_exception(e)
+            return
+        for (_, future), prediction in zip(group, predictions):
+            future.set_result(prediction)
+
+    def _send_rows(self, model_version: str, return_probabilities: bool, group: list):
+        for features, future in group:
+            call = self.client.predict_future(features, model_version, return_probabilities)
+            call.add_done_callback(lambda call, future=future: _copy_outcome(call, future))
+
+
+class AsyncPredictionClient:
+    """grpc.aio counterpart of PredictionClient; create it inside the event loop that uses it."""
+
+    def __init__(self, target: str, pool_size: int = 4, timeout: float = 5.0,
+                 feature_names: Sequence[str] = FEATURE_NAMES, options: Optional[list] = None):
+        self.target = target
+        self.timeout = timeout
+        self.feature_names = list(feature_names)
+        options = channel_options() if options is None else options
+        self._channels = [grpc.aio.insecure_channel(target, options=options) for _ in range(max(1, pool_size))]
+        self._stubs = [model_pb2_grpc.PredictionServiceStub(channel) for channel in self._channels]
+        self._next_stub = itertools.cycle(self._stubs)
+        self._batch_supported = True
+
+    @property
+    def stub(self) -> model_pb2_grpc.PredictionServiceStub:
+        return next(self._next_stub)
+
+    _disable_batches = PredictionClient._disable_batches
+
+    async def wait_ready(self, timeout: float = 30.0):
+        """Wait until every channel is connected; raises asyncio.TimeoutError."""
+        await asyncio.wait_for(asyncio.gather(*(channel.channel_ready() for channel in self._channels)), timeout)
+
+    async def close(self):
+        await asyncio.gather(*(channel.close() for channel in self._channels))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def health(self, timeout: float = None) -> model_pb2.HealthResponse:
+        return await self.stub.Health(model_pb2.HealthRequest(), timeout=timeout or self.timeout)
+
+    async def predict(self, features: Sequence[float], model_version: str = "", return_probabilities: bool = False,
+                      timeout: float = None) -> model_pb2.PredictResponse:
+        request = _prepare(make_request(features, names=self.feature_names), model_version, return_probabilities)
+        return await self.stub.Predict(request, timeout=timeout or self.timeout)
+
+    async def predict_batch(self, rows: Sequence[Sequence[float]], model_version: str = "",
+                            return_probabilities: bool = False, timeout: float = None) -> list:
+        request = make_dense_batch_request(rows, return_probabilities, names=self.feature_names)
+        request.model_version = model_version
+        response = await self.stub.PredictBatch(request, timeout=timeout or self.timeout)
+        return list(response.predictions)
+
+    async def predict_many(self, rows: Sequence[Sequence[float]], model_version: str = "",
+                           return_probabilities: bool = False, max_inflight: int = 16, batch_size: int = 0,
+                           timeout: float = None) -> list:
+        """Same as PredictionClient.predict_many, as concurrent tasks on the event loop."""
+        window = asyncio.Semaphore(max(1, max_inflight))
+
+        async def bounded(call):
+            async with window:
+                try:
+                    return await call
+                except grpc.RpcError as e:
+                    if not _shed(e):
+                        raise
+                    return e
+
+        if batch_size > 1 and self._batch_supported:
+            try:
+                chunks = list(_chunks(rows, batch_size))
+                batches = await asyncio.gather(*(
+                    bounded(self.predict_batch(chunk, model_version, return_probabilities, timeout))
+                    for chunk in chunks))
+                return _responses(batches, [len(chunk) for chunk in chunks])
+            except grpc.RpcError as e:
+                if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                    raise
+                self._disable_batches()
+        results = await asyncio.gather(*(
+            bounded(self.predict(row, model_version, return_probabilities, timeout)) for row in rows))
+        return _responses(results, [1] * len(results))
@@ -24,23 +24,45 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0bmodel.proto\x12\x0cmlservice.v1\"\x0f\n\rHealthRequest\"7\n\x0eHealthResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x15\n\rmodel_version\x18\x02 \x01(\t\"&\n\x07\x46\x65\x61ture\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01\"9\n\x0ePredictRequest\x12\'\n\x08\x66\x65\x61tures\x18\x01 \x03(\x0b\x32\x15.mlservice.v1.Feature\"P\n\x0fPredictResponse\x12\x12\n\nprediction\x18\x01 \x01(\t\x12\x12\n\nconfidence\x18\x02 \x01(\x01\x12\x15\n\rmodel_version\x18\x03 \x01(\t2\xa0\x01\n\x11PredictionService\x12\x43\n\x06Health\x12\x1b.mlservice.v1.HealthRequest\x1a\x1c.mlservice.v1.HealthResponse\x12\x46\n\x07Predict\x12\x1c.mlservice.v1.PredictRequest\x1a\x1d.mlservice.v1.PredictResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0bmodel.proto\x12\x0cmlservice.v1\"\x0f\n\rHealthRequest\"7\n\x0eHealthResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x15\n\rmodel_version\x18\x02 \x01(\t\"&\n\x07\x46\x65\x61ture\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01\"T\n\rDenseFeatures\x12\r\n\x05names\x18\x01 \x03(\t\x12\x10\n\x08num_rows\x18\x02 \x01(\r\x12\x0e\n\x06values\x18\x03 \x03(\x01\x12\x12\n\nraw_values\x18\x04 \x01(\x0c\"\xae\x01\n\x0ePredictRequest\x12\'\n\x08\x66\x65\x61tures\x18\x01 \x03(\x0b\x32\x15.mlservice.v1.Feature\x12\x1c\n\x14return_probabilities\x18\x02 \x01(\x08\x12\x12\n\nrequest_id\x18\x03 \x01(\t\x12*\n\x05\x64\x65nse\x18\x04 \x01(\x0b\x32\x1b.mlservice.v1.DenseFeatures\x12\x15\n\rmodel_version\x18\x05 \x01(\t\"\x81\x02\n\x0fPredictResponse\x12\x12\n\nprediction\x18\x01 \x01(\t\x12\x12\n\nconfidence\x18\x02 \x01(\x01\x12\x15\n\rmodel_version\x18\x03 \x01(\t\x12G\n\rprobabilities\x18\x04 \x03(\x0b\x32\x30.mlservice.v1.PredictResponse.ProbabilitiesEntry\x12\x12\n\nrequest_id\x18\x05 \x01(\t\x12\r\n\x05\x61\x63ked\x18\x06 \x01(\x04\x12\r\n\x05\x65rror\x18\x07 \x01(\t\x1a\x34\n\x12ProbabilitiesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01:\x02\x38\x01\"\xa2\x01\n\x13PredictBatchRequest\x12*\n\x04rows\x18\x01 \x03(\x0b\x32\x1c.mlservice.v1.PredictRequest\x12*\n\x05\x64\x65nse\x18\x02 \x01(\x0b\x32\x1b.mlservice.v1.DenseFeatures\x12\x1c\n\x14return_probabilities\x18\x03 \x01(\x08\x12\x15\n\rmodel_version\x18\x04 \x01(\t\"J\n\x14PredictBatchResponse\x12\x32\n\x0bpredictions\x18\x01 \x03(\x0b\x32\x1d.mlservice.v1.PredictResponse\"\x18\n\x16GetTrafficSplitRequest\"\xc2\x01\n\x0cTrafficSplit\x12\x38\n\x07weights\x18\x01 \x03(\x0b\x32\'.mlservice.v1.TrafficSplit.WeightsEntry\x12\x16\n\x0eshadow_version\x18\x02 \x01(\t\x12\x1c\n\x0fshadow_fraction\x18\x03 \x01(\x01H\x00\x88\x01\x01\x1a.\n\x0cWeightsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01:\x02\x38\x01\x42\x12\n\x10_shadow_fraction\"+\n\x12ReloadModelRequest\x12\x15\n\rmodel_version\x18\x01 \x01(\t\"F\n\x13ReloadModelResponse\x12\x15\n\rmodel_version\x18\x01 \x01(\t\x12\x18\n\x10\x64uration_seconds\x18\x02 \x01(\x01\x32\xbd\x04\n\x11PredictionService\x12\x43\n\x06Health\x12\x1b.mlservice.v1.HealthRequest\x1a\x1c.mlservice.v1.HealthResponse\x12\x46\n\x07Predict\x12\x1c.mlservice.v1.PredictRequest\x1a\x1d.mlservice.v1.PredictResponse\x12U\n\x0cPredictBatch\x12!.mlservice.v1.PredictBatchRequest\x1a\".mlservice.v1.PredictBatchResponse\x12P\n\rPredictStream\x12\x1c.mlservice.v1.PredictRequest\x1a\x1d.mlservice.v1.PredictResponse(\x01\x30\x01\x12S\n\x0fGetTrafficSplit\x12$.mlservice.v1.GetTrafficSplitRequest\x1a\x1a.mlservice.v1.TrafficSplit\x12I\n\x0fSetTrafficSplit\x12\x1a.mlservice.v1.TrafficSplit\x1a\x1a.mlservice.v1.TrafficSplit\x12R\n\x0bReloadModel\x12 .mlservice.v1.ReloadModelRequest\x1a!.mlservice.v1.ReloadModelResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'model_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
+  _globals['_PREDICTRESPONSE_PROBABILITIESENTRY']._loaded_options = None
+  _globals['_PREDICTRESPONSE_PROBABILITIESENTRY']._serialized_options = b'8\001'
+  _globals['_TRAFFICSPLIT_WEIGHTSENTRY']._loaded_options = None
+  _globals['_TRAFFICSPLIT_WEIGHTSENTRY']._serialized_options = b'8\001'
   _globals['_HEALTHREQUEST']._serialized_start=29
   _globals['_HEALTHREQUEST']._serialized_end=44
   _globals['_HEALTHRESPONSE']._serialized_start=46
   _globals['_HEALTHRESPONSE']._serialized_end=101
   _globals['_FEATURE']._serialized_start=103
   _globals['_FEATURE']._serialized_end=141
-  _globals['_PREDICTREQUEST']._serialized_start=143
-  _globals['_PREDICTREQUEST']._serialized_end=200
-  _globals['_PREDICTRESPONSE']._serialized_start=202
-  _globals['_PREDICTRESPONSE']._serialized_end=282
-  _globals['_PREDICTIONSERVICE']._serialized_start=285
-  _globals['_PREDICTIONSERVICE']._serialized_end=445
+  _globals['_DENSEFEATURES']._serialized_start=143
+  _globals['_DENSEFEATURES']._serialized_end=227
+  _globals['_PREDICTREQUEST']._serialized_start=230
+  _globals['_PREDICTREQUEST']._serialized_end=404
+  _globals['_PREDICTRESPONSE']._serialized_start=407
+  _globals['_PREDICTRESPONSE']._serialized_end=664
+  _globals['_PREDICTRESPONSE_PROBABILITIESENTRY']._serialized_start=612
+  _globals['_PREDICTRESPONSE_PROBABILITIESENTRY']._serialized_end=664
+  _globals['_PREDICTBATCHREQUEST']._serialized_start=667
+  _globals['_PREDICTBATCHREQUEST']._serialized_end=829
+  _globals['_PREDICTBATCHRESPONSE']._serialized_start=831
+  _globals['_PREDICTBATCHRESPONSE']._serialized_end=905
+  _globals['_GETTRAFFICSPLITREQUEST']._serialized_start=907
+  _globals['_GETTRAFFICSPLITREQUEST']._serialized_end=931
+  _globals['_TRAFFICSPLIT']._serialized_start=934
+  _globals['_TRAFFICSPLIT']._serialized_end=1128
+  _globals['_TRAFFICSPLIT_WEIGHTSENTRY']._serialized_start=1062
+  _globals['_TRAFFICSPLIT_WEIGHTSENTRY']._serialized_end=1108
+  _globals['_RELOADMODELREQUEST']._serialized_start=1130
+  _globals['_RELOADMODELREQUEST']._serialized_end=1173
+  _globals['_RELOADMODELRESPONSE']._serialized_start=1175
+  _globals['_RELOADMODELRESPONSE']._serialized_end=1245
+  _globals['_PREDICTIONSERVICE']._serialized_start=1248
+  _globals['_PREDICTIONSERVICE']._serialized_end=1821
 # @@protoc_insertion_point(module_scope)
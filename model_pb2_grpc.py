@@ -44,6 +44,31 @@ class PredictionServiceStub(object):
                 request_serializer=model__pb2.PredictRequest.SerializeToString,
                 response_deserializer=model__pb2.PredictResponse.FromString,
                 _registered_method=True)
+        self.PredictBatch = channel.unary_unary(
+                '/mlservice.v1.PredictionService/PredictBatch',
+                request_serializer=model__pb2.PredictBatchRequest.SerializeToString,
+                response_deserializer=model__pb2.PredictBatchResponse.FromString,
+                _registered_method=True)
+        self.PredictStream = channel.stream_stream(
+                '/mlservice.v1.PredictionService/PredictStream',
+                request_serializer=model__pb2.PredictRequest.SerializeToString,
+                response_deserializer=model__pb2.PredictResponse.FromString,
+                _registered_method=True)
+        self.GetTrafficSplit = channel.unary_unary(
+                '/mlservice.v1.PredictionService/GetTrafficSplit',
+                request_serializer=model__pb2.GetTrafficSplitRequest.SerializeToString,
+                response_deserializer=model__pb2.TrafficSplit.FromString,
+                _registered_method=True)
+        self.SetTrafficSplit = channel.unary_unary(
+                '/mlservice.v1.PredictionService/SetTrafficSplit',
+                request_serializer=model__pb2.TrafficSplit.SerializeToString,
+                response_deserializer=model__pb2.TrafficSplit.FromString,
+                _registered_method=True)
+        self.ReloadModel = channel.unary_unary(
+                '/mlservice.v1.PredictionService/ReloadModel',
+                request_serializer=model__pb2.ReloadModelRequest.SerializeToString,
+                response_deserializer=model__pb2.ReloadModelResponse.FromString,
+                _registered_method=True)
 
 
 class PredictionServiceServicer(object):
@@ -61,6 +86,38 @@ class PredictionServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def PredictBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def PredictStream(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetTrafficSplit(self, request, context):
+        """Admin: in-process traffic split between loaded model versions
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SetTrafficSplit(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ReloadModel(self, request, context):
+        """Admin: load a version's model file again and swap it in without downtime
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_PredictionServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -74,6 +131,31 @@ def add_PredictionServiceServicer_to_server(servicer, server):
                     request_deserializer=model__pb2.PredictRequest.FromString,
                     response_serializer=model__pb2.PredictResponse.SerializeToString,
             ),
+            'PredictBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.PredictBatch,
+                    request_deserializer=model__pb2.PredictBatchRequest.FromString,
+                    response_serializer=model__pb2.PredictBatchResponse.SerializeToString,
+            ),
+            'PredictStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.PredictStream,
+                    request_deserializer=model__pb2.PredictRequest.FromString,
+                    response_serializer=model__pb2.PredictResponse.SerializeToString,
+            ),
+            'GetTrafficSplit': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetTrafficSplit,
+                    request_deserializer=model__pb2.GetTrafficSplitRequest.FromString,
+                    response_serializer=model__pb2.TrafficSplit.SerializeToString,
+            ),
+            'SetTrafficSplit': grpc.unary_unary_rpc_method_handler(
+                    servicer.SetTrafficSplit,
+                    request_deserializer=model__pb2.TrafficSplit.FromString,
+                    response_serializer=model__pb2.TrafficSplit.SerializeToString,
+            ),
+            'ReloadModel': grpc.unary_unary_rpc_method_handler(
+                    servicer.ReloadModel,
+                    request_deserializer=model__pb2.ReloadModelRequest.FromString,
+                    response_serializer=model__pb2.ReloadModelResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'mlservice.v1.PredictionService', rpc_method_handlers)
@@ -138,3 +220,138 @@ class PredictionService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def PredictBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/mlservice.v1.PredictionService/PredictBatch',
+            model__pb2.PredictBatchRequest.SerializeToString,
+            model__pb2.PredictBatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def PredictStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/mlservice.v1.PredictionService/PredictStream',
+            model__pb2.PredictRequest.SerializeToString,
+            model__pb2.PredictResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetTrafficSplit(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/mlservice.v1.PredictionService/GetTrafficSplit',
+            model__pb2.GetTrafficSplitRequest.SerializeToString,
+            model__pb2.TrafficSplit.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def SetTrafficSplit(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/mlservice.v1.PredictionService/SetTrafficSplit',
+            model__pb2.TrafficSplit.SerializeToString,
+            model__pb2.TrafficSplit.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ReloadModel(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/mlservice.v1.PredictionService/ReloadModel',
+            model__pb2.ReloadModelRequest.SerializeToString,
+            model__pb2.ReloadModelResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
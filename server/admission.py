@@ -0,0 +1,181 @@
+"""Admission control: skip requests that cannot meet their deadline and shed load above an adaptive limit.
+
+Two checks protect the latency of the requests a server accepts:
+
+- deadline: right before scoring, a request whose deadline has passed
+  (``expired``), or is closer than the observed service time of its method
+  for that many rows, fails with DEADLINE_EXCEEDED instead of being scored
+  for a client that has given up.
+- concurrency: on arrival, a request finding ``limit`` requests already in
+  the server fails fast with RESOURCE_EXHAUSTED instead of queueing.
+  GradientLimit moves the limit with the latency of admitted requests.
+"""
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+from prometheus_client import Counter, Gauge
+
+ADMISSION_REJECTED = Counter('admission_rejected_total', 'Requests refused before scoring', ['method', 'reason'])
+ADMISSION_EXPIRED = Counter('admission_expired_total', 'Requests whose deadline passed before scoring started',
+                            ['method'])
+ADMISSION_LIMIT = Gauge('admission_concurrency_limit', 'Adaptive limit of requests in the server',
+                        multiprocess_mode='livesum')
+
+
+class GradientLimit:
+    """Concurrency limit following the latency gradient (after Netflix' Gradient2).
+
+    Compares a short-term average of request latency with a long-term one.
+    While they agree within ``tolerance`` the limit grows by about its square
+    root per sample; when latency rises it shrinks in proportion (at most
+    halving). A request finishing after its deadline, or refused because
+    it could not meet it, cuts the limit by ``backoff``. The limit only
+    grows while at least half of it is used.
+    """
+
+    def __init__(self, initial: int = 20, min_limit: int = 2, max_limit: int = 500, tolerance: float = 1.5,
+                 smoothing: float = 0.2, backoff: float = 0.9, short_window: int = 10, long_window: int = 600):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.backoff = backoff
+        self._short_alpha = 2.0 / (short_window + 1)
+        self._long_alpha = 2.0 / (long_window + 1)
+        self._short = self._long = None
+        self._limit = float(min(max(initial, min_limit), max_limit))
+        self._lock = threading.Lock()
+        ADMISSION_LIMIT.set(self._limit)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def update(self, latency_s: float, inflight: int, dropped: bool = False):
+        with self._lock:
+            if self._short is None:
+                self._short = self._long = latency_s
+            else:
+                self._short += self._short_alpha * (latency_s - self._short)
+                self._long += self._long_alpha * (latency_s - self._long)
+            # Let the long-term average catch up quickly once latency has dropped
+            if self._long > 2 * self._short:
+                self._long *= 0.95
+            limit = self._limit
+            if dropped:
+                target = limit * self.backoff
+            elif inflight < limit / 2:
+                return
+            else:
+                gradient = max(0.5, min(1.0, self.tolerance * self._long / self._short))
+                target = limit * gradient + math.sqrt(limit)
+            self._limit = min(max(limit * (1 - self.smoothing) + target * self.smoothing, self.min_limit),
+                              self.max_limit)
+            ADMISSION_LIMIT.set(self._limit)
+
+
+class AdmissionController:
+    """Deadline and concurrency checks for a set of methods.
+
+    ``deadline_margin`` scales the service time estimate a deadline has to
+    leave (0 turns the deadline check off); ``limit`` is a GradientLimit or
+    None for no concurrency limit. Times are ``time.perf_counter()`` values.
+    """
+
+    def __init__(self, methods, deadline_margin: float = 1.0, limit: GradientLimit = None, smoothing: float = 0.1):
+        self.methods = frozenset(methods)
+        self.deadline_margin = deadline_margin
+        self.limit = limit
+        self.smoothing = smoothing
+        # method -> average seconds per row; written under the GIL, a lost update only delays the average
+        self._row_seconds = {}
+
+    def admit(self, method: str, inflight: int) -> bool:
+        """Whether a request arriving with ``inflight`` others in the server may enter."""
+        if self.limit is None or inflight < self.limit.limit:
+            return True
+        ADMISSION_REJECTED.labels(method=method, reason="limit").inc()
+        return False
+
+    def run(self, method: str, rows: int, inflight: int, arrived: float, deadline: float, fn):
+        """Call ``fn()`` unless the deadline cannot be met; returns (result, refusal details or None).
+
+        ``inflight`` is the count the request was admitted with; ``deadline``
+        may be None for requests without one.
+        """
+        started = time.perf_counter()
+        if deadline is not None and self.deadline_margin > 0:
+            remaining = deadline - started
+            estimate = self._row_seconds.get(method, 0.0) * rows * self.deadline_margin
+            refusal = None
+            if remaining <= 0:
+                ADMISSION_EXPIRED.labels(method=method).inc()
+                refusal = "Deadline passed before the request could be scored"
+            elif remaining < estimate:
+                ADMISSION_REJECTED.labels(method=method, reason="deadline").inc()
+                refusal = f"{remaining * 1000:.1f}ms left, scoring takes about {estimate * 1000:.1f}ms"
+            if refusal is not None:
+                # Waiting ate the deadline: the server holds more requests than it can serve in time
+                if self.limit is not None:
+                    self.limit.update(started - arrived, inflight, dropped=True)
+                return None, refusal
+        result = fn()
+        finished = time.perf_counter()
+        per_row = (finished - started) / max(rows, 1)
+        average = self._row_seconds.get(method)
+        self._row_seconds[method] = per_row if average is None else average + self.smoothing * (per_row - average)
+        if self.limit is not None:
+            self.limit.update(finished - arrived, inflight,
+                              dropped=deadline is not None and finished > deadline)
+        return result, None
+
+
+class AdmissionInterceptor(grpc.ServerInterceptor):
+    """Applies an AdmissionController to the unary methods of a grpc.server.
+
+    Handlers are looked up on the server's polling thread when a call
+    arrives, before it queues for a worker thread, so this is where the
+    concurrency limit applies. ``inflight()`` returns the calls queued or
+    running in the server's executor, which also covers calls gRPC drops
+    unscored after their client cancelled. ``rows(request)`` sizes the
+    service time estimate. Rejections are sent from a thread of their own
+    (gRPC's ``experimental_thread_pool``), so they neither wait behind
+    queued requests nor count as in the executor.
+    """
+
+    def __init__(self, admission: AdmissionController, inflight, rows):
+        self.admission = admission
+        self.inflight = inflight
+        self.rows = rows
+        self._reject_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="admission-reject")
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        method = handler_call_details.method.rsplit("/", 1)[-1]
+        if handler is None or handler.unary_unary is None or method not in self.admission.methods:
+            return handler
+        arrived = time.perf_counter()
+        inflight = self.inflight()
+        if not self.admission.admit(method, inflight):
+            limit = self.admission.limit.limit
+
+            def reject(request, context):
+                context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, f"Server overloaded (concurrency limit {limit})")
+
+            reject.experimental_thread_pool = self._reject_pool
+            return handler._replace(unary_unary=reject)
+
+        behavior = handler.unary_unary
+
+        def admitted(request, context):
+            deadline = time.perf_counter() + context.time_remaining()
+            response, refusal = self.admission.run(method, self.rows(request), inflight, arrived, deadline,
+                                                   lambda: behavior(request, context))
+            if refusal is not None:
+                context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, refusal)
+            return response
+
+        return handler._replace(unary_unary=admitted)
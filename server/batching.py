@@ -0,0 +1,155 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+import numpy as np
+from prometheus_client import Histogram
+
+from server.inference import ModelRunner
+from server.metrics import BATCH_SIZE_BUCKETS, LATENCY_BUCKETS
+import server.logger as _logger
+
+BATCH_SIZE = Histogram(
+    'microbatch_size', 'Rows scored per micro-batch', ['model_version'],
+    buckets=BATCH_SIZE_BUCKETS,
+)
+BATCH_QUEUE_WAIT = Histogram(
+    'microbatch_queue_wait_seconds', 'Time a request waits in the micro-batch queue', ['model_version'],
+    buckets=LATENCY_BUCKETS,
+)
+
+logger = _logger.service_logger
+
+_STOP = object()
+
+
+def collect_window(source: queue.Queue, first, max_items: int, max_delay: float, stop=_STOP,
+                   items: list = None) -> tuple[list, bool]:
+    """Gather ``first`` plus up to ``max_items - 1`` more items from ``source``.
+
+    Waits at most ``max_delay`` seconds for more items. Returns the items and
+    whether ``stop`` was seen, in which case the consumer should finish after
+    handling them. Items are appended to ``items`` (which should hold
+    ``first``) when given, so the caller sees them even if this raises.
+    """
+    items = [first] if items is None else items
+    deadline = time.perf_counter() + max_delay
+    while len(items) < max_items:
+        timeout = deadline - time.perf_counter()
+        try:
+            item = source.get_nowait() if timeout <= 0 else source.get(timeout=timeout)
+        except queue.Empty:
+            break
+        if item is stop:
+            return items, True
+        items.append(item)
+    return items, False
+
+
+class MicroBatcher:
+    """Collects concurrent single-row predictions and scores them together.
+
+    A batch is closed when it reaches ``max_batch_size`` rows or when
+    ``max_batch_delay_ms`` has passed since its first row was dequeued.
+    The wait is adaptive: while recent batches hold a single row (no
+    concurrent load) the batcher dispatches immediately instead of
+    sleeping, so an idle server pays no extra latency. Rows for different
+    models share the queue and are scored per runner.
+
+    If the batching thread dies, the rows waiting for it fail with its
+    error and later ``submit`` calls fail at once instead of waiting forever.
+    """
+
+    def __init__(self, max_batch_size: int = 32, max_batch_delay_ms: float = 2.0):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_delay = max(0.0, max_batch_delay_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._avg_batch_size = 1.0
+        self._error = None  # set once the thread has stopped; later rows fail with it
+        self._batch = []
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Micro-batching enabled: max_batch_size={self.max_batch_size}, "
+                    f"max_batch_delay_ms={max_batch_delay_ms}")
+
+    def submit(self, runner: ModelRunner, row: np.ndarray, with_probabilities: bool = False) -> Future:
+        future = Future()
+        if self._error is not None or not self._thread.is_alive():
+            future.set_exception(self._error or RuntimeError("Micro-batcher thread is not running"))
+            return future
+        self._queue.put((runner, row, with_probabilities, future, time.perf_counter()))
+        # The thread may have stopped between the check and the put
+        if self._error is not None:
+            self._fail_queued()
+        return future
+
+    def predict(self, runner: ModelRunner, row: np.ndarray, with_probabilities: bool = False,
+                deadline: float = None) -> tuple[str, float, Optional[dict[str, float]]]:
+        """Score one row; ``deadline`` is a ``time.perf_counter()`` value, None waits until scored."""
+        future = self.submit(runner, row, with_probabilities)
+        timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+        return future.result(timeout)
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        try:
+            self._loop()
+            error = RuntimeError("Micro-batcher is closed")
+        except BaseException as e:
+            logger.error(f"Micro-batcher thread failed: {e}")
+            error = RuntimeError(f"Micro-batcher thread failed: {e}")
+        self._error = error
+        for item in self._batch:
+            if not item[3].done():
+                item[3].set_exception(error)
+        self._fail_queued()
+
+    def _fail_queued(self):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP and not item[3].done():
+                item[3].set_exception(self._error)
+
+    def _loop(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            self._batch = [first]
+            delay = self.max_batch_delay if self._avg_batch_size >= 1.5 else 0.0
+            _, stopping = collect_window(self._queue, first, self.max_batch_size, delay, items=self._batch)
+            self._avg_batch_size = 0.8 * self._avg_batch_size + 0.2 * len(self._batch)
+            by_runner = {}
+            for item in self._batch:
+                by_runner.setdefault(item[0], []).append(item)
+            for runner, items in by_runner.items():
+                self._score(runner, items)
+            self._batch = []
+
+    def _score(self, runner: ModelRunner, batch: list):
+        version = runner.version
+        now = time.perf_counter()
+        for _, _, _, _, enqueued in batch:
+            BATCH_QUEUE_WAIT.labels(model_version=version).observe(now - enqueued)
+        BATCH_SIZE.labels(model_version=version).observe(len(batch))
+
+        try:
+            results = runner.predict_rows(
+                [row for _, row, _, _, _ in batch],
+                with_probabilities=any(wanted for _, _, wanted, _, _ in batch),
+            )
+        except Exception as e:
+            for _, _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, _, wanted, future, _), (pred, conf, probabilities) in zip(batch, results):
+            future.set_result((pred, conf, probabilities if wanted else None))
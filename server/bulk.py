@@ -0,0 +1,358 @@
+"""
+Offline scoring of CSV or Parquet files with ModelRunner in a process pool.
+
+The input is read in chunks of --chunk-rows rows. Worker processes
+validate the feature columns, score the chunk and format its output. The
+main process writes finished chunks in input order, so at most
+2 x --workers chunks are held at a time and memory does not grow with
+the file.
+
+Output columns: the --keep columns of the input (e.g. an id), prediction,
+confidence, proba_<class> with --probabilities, and error. Features are
+validated like online requests (server/validation.py). Rows with an empty
+or non-numeric feature are not scored: their error column names them. A .csv output is a single file. A .parquet
+output is a directory of part-NNNNN.parquet files in input order, which
+pandas and pyarrow read as one table.
+
+Progress is committed after every chunk to OUTPUT.progress.json. Running
+the same command again after an interruption drops any uncommitted output
+and continues after the last committed row. Once the run is complete,
+running it again does nothing; --overwrite starts over.
+
+Usage: python -m server.bulk data.csv scores.csv --model models/model.pkl --keep id --workers 4
+"""
+import argparse
+import json
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import multiprocessing.connection
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import server.logger as _logger
+from server.inference import ModelRunner, BACKENDS
+from server.validation import ValidationError, frame_to_matrix
+
+PARQUET_SUFFIXES = (".parquet", ".pq")
+PART_NAME = re.compile(r"part-(\d{5,})\.parquet(\.tmp)?")
+
+logger = _logger.service_logger
+
+_runner = None  # ModelRunner of a worker process
+
+
+def _exit_with_parent():
+    # Pool workers hold their own task queue open, so they would wait forever for a killed main process
+    multiprocessing.connection.wait([multiprocessing.parent_process().sentinel])
+    os._exit(1)
+
+
+def _init_worker(model_path: str, version: str, backend: str):
+    global _runner
+    # Ctrl-C interrupts the main process, which stops the pool and keeps the committed progress
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    threading.Thread(target=_exit_with_parent, name="parent-watch", daemon=True).start()
+    _runner = ModelRunner(model_path, version=version, backend=backend)
+
+
+def score_chunk(runner: ModelRunner, chunk: pd.DataFrame, features: list, keep: list,
+                probabilities: bool) -> tuple[pd.DataFrame, int]:
+    """Output rows of one input chunk and how many of them could not be scored."""
+    X, errors = frame_to_matrix(chunk[features], runner.schema)
+    good = np.ones(len(X), dtype=bool)
+    good[list(errors)] = False
+    out = chunk[keep].reset_index(drop=True)
+    prediction = np.full(len(X), "", dtype=object)
+    confidence = np.full(len(X), np.nan)
+    proba = None
+    if good.any():
+        labels, confidences, proba = runner.score(X[good])
+        prediction[good] = labels.astype(str)
+        confidence[good] = confidences
+    out["prediction"] = prediction
+    out["confidence"] = confidence
+    if probabilities:
+        for j, label in enumerate(runner.model.classes_):
+            column = np.full(len(X), np.nan)
+            if proba is not None:
+                column[good] = proba[:, j]
+            out[f"proba_{label}"] = column
+    error = np.full(len(X), "", dtype=object)
+    for i, message in errors.items():
+        error[i] = message
+    out["error"] = error
+    return out, len(errors)
+
+
+def _score_part(chunk: pd.DataFrame, features: list, keep: list, probabilities: bool, part_path: str):
+    """Worker task: score a chunk into CSV bytes, or into ``part_path`` + ".tmp" for Parquet output."""
+    out, n_bad = score_chunk(_runner, chunk, features, keep, probabilities)
+    if part_path is None:
+        return out.to_csv(index=False, header=False, lineterminator="\n").encode(), len(out), n_bad
+    out.to_parquet(part_path + ".tmp", index=False, compression="zstd")
+    return None, len(out), n_bad
+
+
+def is_parquet(path: str) -> bool:
+    return Path(path).suffix.lower() in PARQUET_SUFFIXES
+
+
+def input_columns(path: str) -> list:
+    if is_parquet(path):
+        import pyarrow.parquet
+        return list(pyarrow.parquet.ParquetFile(path).schema_arrow.names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_chunks(path: str, columns: list, keep: list, chunk_rows: int, skip_rows: int = 0):
+    """Yield DataFrames of at most ``chunk_rows`` rows, starting after the first ``skip_rows``."""
+    if is_parquet(path):
+        import pyarrow.parquet
+        parquet = pyarrow.parquet.ParquetFile(path)
+        # Skip whole row groups without reading them
+        groups, start = [], 0
+        for i in range(parquet.num_row_groups):
+            n = parquet.metadata.row_group(i).num_rows
+            if not groups and start + n <= skip_rows:
+                start += n
+            else:
+                groups.append(i)
+        skip = skip_rows - start
+        for batch in parquet.iter_batches(batch_size=chunk_rows, row_groups=groups, columns=columns):
+            if skip >= batch.num_rows:
+                skip -= batch.num_rows
+                continue
+            yield batch.slice(skip).to_pandas()
+            skip = 0
+    else:
+        # Kept columns are copied verbatim: an id like 007 stays 007. A callable skips rows
+        # without building the set of their numbers that a range would turn into.
+        reader = pd.read_csv(path, usecols=columns, chunksize=chunk_rows, dtype={name: str for name in keep},
+                             keep_default_na=False, na_values=[""],
+                             skiprows=(lambda i: 0 < i <= skip_rows) if skip_rows else None)
+        for chunk in reader:
+            if len(chunk):
+                yield chunk
+
+
+class Progress:
+    """Committed state of a run in OUTPUT.progress.json, replaced atomically."""
+
+    def __init__(self, output: str, run: dict):
+        self.path = output + ".progress.json"
+        self.run = run
+        self.state = {"rows": 0, "errors": 0, "bytes": 0, "parts": 0, "complete": False}
+
+    def load(self) -> bool:
+        """Read a previous run's state; False if there is none. Raises ValueError for a different run."""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            saved = json.load(f)
+        changed = [key for key, value in self.run.items() if saved.get("run", {}).get(key) != value]
+        if changed:
+            raise ValueError(f"{self.path} belongs to a different run (changed: {', '.join(changed)}). "
+                             f"Use --overwrite to start over.")
+        self.state = saved["state"]
+        return True
+
+    def commit(self, **state):
+        self.state.update(state)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"run": self.run, "state": self.state}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def score_file(input_path: str, output_path: str, model_path: str, version: str = "v1.0.0",
+               backend: str = "sklearn", workers: int = 1, chunk_rows: int = 50_000, keep=(),
+               probabilities: bool = False, overwrite: bool = False, stop: threading.Event = None) -> dict:
+    """Score ``input_path`` into ``output_path``; returns the final progress state.
+
+    Setting ``stop`` ends the run at the next chunk, with the state not complete.
+    """
+    stop = stop if stop is not None else threading.Event()
+    runner = ModelRunner(model_path, version=version, backend=backend)
+    if runner.model is None:
+        raise ValueError(f"Could not load a model from {model_path}")
+    keep = list(keep)
+    columns = input_columns(input_path)
+    missing = [name for name in keep if name not in columns]
+    if missing:
+        raise ValidationError(f"Missing columns to keep: {', '.join(missing)}")
+    if runner.schema is not None:
+        features = list(runner.schema.names)
+        missing = [name for name in features if name not in columns]
+        if missing:
+            raise ValidationError(f"Missing features: {', '.join(missing)}")
+    else:
+        # Without a schema, like requests, the features keep the order of the input
+        features = [name for name in columns if name not in keep]
+    header = keep + ["prediction", "confidence"]
+    if probabilities:
+        header += [f"proba_{label}" for label in runner.model.classes_]
+    header.append("error")
+
+    parquet_output = is_parquet(output_path)
+    stat, model_stat = os.stat(input_path), os.stat(model_path)
+    progress = Progress(output_path, {
+        "input": os.path.abspath(input_path), "input_size": stat.st_size, "input_mtime": stat.st_mtime,
+        "model": os.path.abspath(model_path), "model_mtime": model_stat.st_mtime, "model_version": version,
+        "columns": header})
+    resumed = not overwrite and progress.load()
+    if resumed and progress.state["complete"]:
+        logger.info(f"{output_path} is already complete: {progress.state['rows']} rows")
+        return progress.state
+    if not resumed and not overwrite and os.path.exists(output_path):
+        raise ValueError(f"{output_path} exists without progress of this run. Use --overwrite to replace it.")
+
+    if parquet_output:
+        os.makedirs(output_path, exist_ok=True)
+        # Parts past the committed ones were written after the last commit
+        for name in os.listdir(output_path):
+            match = PART_NAME.fullmatch(name)
+            if match and (match.group(2) or int(match.group(1)) >= progress.state["parts"]):
+                os.remove(os.path.join(output_path, name))
+        out = None
+    elif resumed:
+        out = open(output_path, "r+b")
+        out.truncate(progress.state["bytes"])
+        out.seek(0, os.SEEK_END)
+    else:
+        out = open(output_path, "wb")
+        out.write(pd.DataFrame(columns=header).to_csv(index=False, lineterminator="\n").encode())
+        out.flush()
+    if resumed:
+        logger.info(f"Resuming {output_path} after {progress.state['rows']} rows")
+    else:
+        progress.commit(bytes=out.tell() if out is not None else 0)
+
+    start_time, start_rows = time.time(), progress.state["rows"]
+
+    def commit(payload, n_rows: int, n_bad: int, part_path: str):
+        if part_path is None:
+            out.write(payload)
+            out.flush()
+            os.fsync(out.fileno())
+            progress.commit(rows=progress.state["rows"] + n_rows, errors=progress.state["errors"] + n_bad,
+                            bytes=out.tell())
+        else:
+            os.replace(part_path + ".tmp", part_path)
+            progress.commit(rows=progress.state["rows"] + n_rows, errors=progress.state["errors"] + n_bad,
+                            parts=progress.state["parts"] + 1)
+        done = progress.state["rows"] - start_rows
+        logger.info(f"Scored {progress.state['rows']} rows ({done / max(time.time() - start_time, 1e-9):.0f} rows/s)")
+
+    chunks = read_chunks(input_path, features + [name for name in keep if name not in features], keep,
+                         chunk_rows, progress.state["rows"])
+    part = progress.state["parts"]
+
+    def part_path() -> str:
+        nonlocal part
+        if not parquet_output:
+            return None
+        part += 1
+        return os.path.join(output_path, f"part-{part - 1:05d}.parquet")
+
+    try:
+        if workers <= 0:
+            global _runner
+            _runner = runner
+            for chunk in chunks:
+                if stop.is_set():
+                    break
+                path = part_path()
+                commit(*_score_part(chunk, features, keep, probabilities, path), path)
+        else:
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["server.inference", "pandas", "joblib", "sklearn.ensemble"])
+            with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(model_path, version, backend)) as executor:
+                # Chunks are committed in input order; waiting on the oldest bounds the chunks held
+                pending = deque()
+                try:
+                    for chunk in chunks:
+                        if stop.is_set():
+                            break
+                        path = part_path()
+                        pending.append((executor.submit(_score_part, chunk, features, keep, probabilities, path),
+                                        path))
+                        while pending and (len(pending) >= 2 * workers or pending[0][0].done()):
+                            future, path = pending.popleft()
+                            commit(*future.result(), path)
+                    while pending:
+                        future, path = pending.popleft()
+                        commit(*future.result(), path)
+                except BaseException:
+                    for future, _ in pending:
+                        future.cancel()
+                    raise
+        if not stop.is_set():
+            progress.commit(complete=True)
+    finally:
+        if out is not None:
+            out.close()
+
+    elapsed = time.time() - start_time
+    if stop.is_set():
+        logger.info(f"Stopped {output_path} after {progress.state['rows']} rows")
+        return progress.state
+    logger.info(f"Finished {output_path}: {progress.state['rows']} rows, {progress.state['errors']} not scored, "
+                f"{progress.state['rows'] - start_rows} rows in {elapsed:.1f}s")
+    return progress.state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV (.csv, .csv.gz) or Parquet (.parquet, .pq) file with a header")
+    parser.add_argument("output", help=".csv file or .parquet directory")
+    parser.add_argument("--model", default=os.getenv("MODEL_PATH", "models/model.pkl"))
+    parser.add_argument("--model-version", default=os.getenv("MODEL_VERSION", "v1.0.0"))
+    parser.add_argument("--backend", choices=BACKENDS, default=os.getenv("INFERENCE_BACKEND", "sklearn"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="scoring processes; 0 scores in this process (default: number of CPUs)")
+    parser.add_argument("--chunk-rows", type=int, default=50_000, help="rows per chunk (default 50000)")
+    parser.add_argument("--keep", default="", help="comma-separated input columns copied to the output, e.g. id")
+    parser.add_argument("--probabilities", action="store_true", help="add a proba_<class> column per class")
+    parser.add_argument("--overwrite", action="store_true", help="start over instead of resuming")
+    args = parser.parse_args()
+    if args.chunk_rows <= 0:
+        parser.error("--chunk-rows must be positive")
+
+    keep = [name.strip() for name in args.keep.split(",") if name.strip()]
+    # Ctrl-C or a scheduler's SIGTERM stops at the next chunk; a second signal stops at once
+    stop = threading.Event()
+
+    def handle_stop(signum, frame):
+        if stop.is_set():
+            raise KeyboardInterrupt
+        logger.info("Stopping after the chunks in progress...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, handle_stop)
+    signal.signal(signal.SIGTERM, handle_stop)
+    try:
+        state = score_file(args.input, args.output, args.model, args.model_version, args.backend, args.workers,
+                           args.chunk_rows, keep, args.probabilities, args.overwrite, stop)
+    except (ValidationError, ValueError, OSError) as e:
+        sys.exit(f"Bulk scoring failed: {e}")
+    except KeyboardInterrupt:
+        sys.exit("Interrupted. Run the same command again to resume.")
+    if not state["complete"]:
+        sys.exit(f"Stopped after {state['rows']} rows. Run the same command again to resume.")
+    print(f"{args.output}: {state['rows']} rows, {state['errors']} not scored")
+
+
+if __name__ == "__main__":
+    main()
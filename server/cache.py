@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from prometheus_client import Counter
+
+import server.logger as _logger
+
+CACHE_HITS = Counter('prediction_cache_hits_total', 'Prediction cache hits', ['model_version'])
+CACHE_MISSES = Counter('prediction_cache_misses_total', 'Prediction cache misses', ['model_version'])
+CACHE_EVICTIONS = Counter('prediction_cache_evictions_total', 'Prediction cache evictions', ['reason'])
+
+logger = _logger.service_logger
+
+
+class PredictionCache:
+    """Thread-safe LRU cache of predictions keyed on quantized feature rows.
+
+    Feature values are rounded to ``precision`` decimals, so rows that only
+    differ below that precision share an entry. Entries are evicted when the
+    cache holds more than ``max_entries`` or when they are older than
+    ``ttl_seconds``. Entries are scoped to the model version that produced
+    them, so several versions share one cache; ``invalidate`` drops the
+    entries of a version that is unloaded or replaced.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300.0, precision: int = 6):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.precision = precision
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        logger.info(f"Prediction cache enabled: max_entries={max_entries}, "
+                    f"ttl_seconds={ttl_seconds}, precision={precision}")
+
+    def key(self, row: np.ndarray) -> bytes:
+        # Adding 0.0 turns -0.0 into 0.0 so both hash the same.
+        return (np.round(row, self.precision) + 0.0).tobytes()
+
+    def get(self, version: str, key: bytes) -> Optional[tuple]:
+        key = (version, key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    CACHE_HITS.labels(model_version=version).inc()
+                    return value
+                del self._entries[key]
+                CACHE_EVICTIONS.labels(reason="ttl").inc()
+        CACHE_MISSES.labels(model_version=version).inc()
+        return None
+
+    def put(self, version: str, key: bytes, value: tuple):
+        key = (version, key)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                CACHE_EVICTIONS.labels(reason="size").inc()
+
+    def invalidate(self, version: str) -> int:
+        """Drop every entry of ``version`` and return how many were dropped."""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == version]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            CACHE_EVICTIONS.labels(reason="model_change").inc(len(stale))
+            logger.info(f"Model {version} changed. Flushed {len(stale)} cached predictions.")
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,194 @@
+"""Capture of scored rows (features + prediction) to columnar files for drift analysis and retraining."""
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+from prometheus_client import Counter, Gauge
+
+import server.logger as _logger
+
+CAPTURE_ROWS_WRITTEN = Counter('capture_rows_written_total', 'Captured rows written to files')
+CAPTURE_ROWS_DROPPED = Counter('capture_rows_dropped_total', 'Captured rows lost', ['reason'])
+CAPTURE_BUFFERED_ROWS = Gauge('capture_buffered_rows', 'Captured rows waiting to be written',
+                              multiprocess_mode='livesum')
+CAPTURE_FILES_TOTAL = Counter('capture_files_total', 'Capture files completed')
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+COMPRESSION = "zstd"
+
+logger = _logger.service_logger
+
+
+class CaptureSink:
+    """Buffers (features, prediction) rows and writes them from a background thread.
+
+    ``capture`` never waits for the disk: it checks for room and appends
+    under a lock held only for that, so the buffer never exceeds
+    ``buffer_rows``; rows that do not fit are dropped and counted. The
+    writer thread flushes the buffer every ``flush_interval_s`` or once it
+    holds ``flush_rows`` rows, into zstd-compressed Parquet or Arrow IPC
+    files in ``directory``. A file is completed (renamed from
+    ``.tmp``) after ``rotate_rows`` rows, after ``rotate_s`` seconds or when
+    the feature set changes. Needs pyarrow; raises ImportError without it.
+    """
+
+    def __init__(self, directory: str, sample_rate: float = 1.0, buffer_rows: int = 100_000,
+                 flush_interval_s: float = 5.0, rotate_rows: int = 1_000_000, rotate_s: float = 3600.0,
+                 file_format: str = "parquet"):
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown capture format {file_format!r}. Supported: {', '.join(FORMATS)}")
+        # Imported here rather than on the first flush, where the import would hold the GIL mid-traffic
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+        pyarrow.array(np.zeros(1))  # converting NumPy arrays lazily imports pandas
+        self._pa = pyarrow
+        self.directory = directory
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.buffer_rows = buffer_rows
+        self.flush_interval_s = flush_interval_s
+        self.flush_rows = max(1, min(buffer_rows // 4, 10_000))
+        self.rotate_rows = rotate_rows
+        self.rotate_s = rotate_s
+        self.file_format = file_format
+        os.makedirs(directory, exist_ok=True)
+
+        self._buffer = deque()
+        # Held to check for room and append together; the writer pops without it, which only adds room
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._file = None  # (writer, tmp path, final path, feature names, opened at, rows)
+        self._sequence = 0
+        self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+        self._thread.start()
+        logger.info(f"Prediction capture enabled: dir={directory}, format={file_format}, "
+                    f"sample_rate={self.sample_rate}, buffer_rows={buffer_rows}")
+
+    def capture(self, version: str, feature_names, X, request_ids, labels, confidences):
+        """Queue sampled rows of one scored request; never blocks.
+
+        ``X`` is a matrix or a list of rows; ``request_ids`` may be None.
+        """
+        n = len(labels)
+        if n == 0 or self.sample_rate == 0.0:
+            return
+        if self.sample_rate >= 1.0:
+            selected = range(n)
+        elif n == 1:
+            selected = range(1) if random.random() < self.sample_rate else range(0)
+        else:
+            selected = np.flatnonzero(np.random.random(n) < self.sample_rate).tolist()
+        if not selected:
+            return
+        if len(self._buffer) >= self.buffer_rows:
+            # Full already: do not copy rows that cannot fit
+            CAPTURE_ROWS_DROPPED.labels(reason="buffer_full").inc(len(selected))
+            return
+        # Copy the rows so the buffer does not keep whole request payloads alive
+        rows = np.array([X[i] for i in selected], dtype=np.float64)
+        ts = time.time()
+        names = tuple(feature_names)
+        items = [(ts, version, request_ids[i] if request_ids else "", names, row, labels[i], float(confidences[i]))
+                 for row, i in zip(rows, selected)]
+        with self._lock:
+            room = max(self.buffer_rows - len(self._buffer), 0)
+            self._buffer.extend(items[:room])
+            buffered = len(self._buffer)
+        if room < len(items):
+            CAPTURE_ROWS_DROPPED.labels(reason="buffer_full").inc(len(items) - room)
+        if buffered >= self.flush_rows:
+            self._wakeup.set()
+
+    def close(self):
+        """Write out everything buffered and complete the current file."""
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval_s)
+            self._wakeup.clear()
+            self._flush()
+        self._flush()
+        self._complete_file()
+
+    def _flush(self):
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(len(self._buffer), self.flush_rows))]
+            CAPTURE_BUFFERED_ROWS.set(len(self._buffer))
+            try:
+                self._write(batch)
+            except Exception as e:
+                CAPTURE_ROWS_DROPPED.labels(reason="write_error").inc(len(batch))
+                logger.error(f"Could not write {len(batch)} captured rows: {e}")
+                self._complete_file()
+        CAPTURE_BUFFERED_ROWS.set(len(self._buffer))
+        if self._file is not None and time.time() - self._file[4] >= self.rotate_s:
+            self._complete_file()
+
+    def _write(self, batch: list):
+        # Rows of model versions with different feature sets go to different files
+        groups = {}
+        for item in batch:
+            groups.setdefault(item[3], []).append(item)
+        for names, items in groups.items():
+            table = self._table(names, items)
+            if self._file is not None and self._file[3] != names:
+                self._complete_file()
+            if self._file is None:
+                self._open_file(names, table.schema)
+            writer, tmp_path, path, names, opened, rows = self._file
+            if self.file_format == "parquet":
+                writer.write_table(table)
+            else:
+                writer.write(table)
+            self._file = (writer, tmp_path, path, names, opened, rows + len(items))
+            CAPTURE_ROWS_WRITTEN.inc(len(items))
+            if self._file[5] >= self.rotate_rows:
+                self._complete_file()
+
+    def _table(self, names: tuple, items: list):
+        pa = self._pa
+        features = np.stack([item[4] for item in items])
+        columns = {
+            "ts": pa.array(np.array([item[0] * 1e6 for item in items], dtype="int64"), pa.timestamp("us", tz="UTC")),
+            "model_version": pa.array([item[1] for item in items], pa.string()),
+            "request_id": pa.array([item[2] for item in items], pa.string()),
+        }
+        for j, name in enumerate(names):
+            columns[name] = pa.array(features[:, j])
+        columns["prediction"] = pa.array([item[5] for item in items], pa.string())
+        columns["confidence"] = pa.array([item[6] for item in items], pa.float64())
+        return pa.table(columns)
+
+    def _open_file(self, names: tuple, schema):
+        self._sequence += 1
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(self.directory, f"capture-{stamp}-{os.getpid()}-{self._sequence:04d}"
+                                            f"{FORMATS[self.file_format]}")
+        tmp_path = path + ".tmp"
+        if self.file_format == "parquet":
+            writer = self._pa.parquet.ParquetWriter(tmp_path, schema, compression=COMPRESSION)
+        else:
+            options = self._pa.ipc.IpcWriteOptions(compression=COMPRESSION)
+            writer = self._pa.ipc.new_file(tmp_path, schema, options=options)
+        self._file = (writer, tmp_path, path, names, time.time(), 0)
+
+    def _complete_file(self):
+        if self._file is None:
+            return
+        writer, tmp_path, path, _, _, rows = self._file
+        self._file = None
+        try:
+            writer.close()
+            os.replace(tmp_path, path)
+            CAPTURE_FILES_TOTAL.inc()
+            logger.info(f"Capture file completed: {path} ({rows} rows)")
+        except Exception as e:
+            logger.error(f"Could not complete capture file {path}: {e}")
@@ -1,37 +1,332 @@
-import joblib
-import pandas as pd
+import json
+import numpy as np
 from pathlib import Path
 import os
+from typing import Optional
+from server.validation import FeatureSchema
 import server.logger as _logger
 
 logger = _logger.service_logger
 
+FALLBACK_PREDICTION = ("fallback_prediction", 1.0, None)
+BACKENDS = ("sklearn", "compiled")
+# Memory-mapped forest artifacts (see CompiledForest.save) are recognized by this suffix.
+MAPPED_SUFFIX = ".forest"
+
+def with_feature_names(model, X: np.ndarray):
+    """Wrap X in a DataFrame when ``model`` was fitted on one, so sklearn gets the names it checks.
+
+    Rows are already ordered by the feature schema, which for such models
+    is ``feature_names_in_``. Models fitted on arrays get X unchanged.
+    """
+    names = getattr(model, "feature_names_in_", None)
+    if names is None:
+        return X
+    # Imported here: only models fitted on a DataFrame need it
+    import pandas as pd
+    return pd.DataFrame(X, columns=names, copy=False)
+
+def schema_path_for(model_path: str) -> Path:
+    """Sidecar file listing the model's feature names, e.g. models/model.features.json."""
+    return Path(model_path).with_suffix(".features.json")
+
+def load_feature_schema(model, model_path: str) -> Optional[FeatureSchema]:
+    names = getattr(model, "feature_names_in_", None)
+    if names is not None:
+        return FeatureSchema(str(name) for name in names)
+    sidecar = schema_path_for(model_path)
+    if sidecar.exists():
+        with open(sidecar) as f:
+            return FeatureSchema(json.load(f))
+    return None
+
+class CompiledForest:
+    """Tree ensemble flattened into contiguous NumPy arrays.
+
+    All trees of a fitted ``RandomForestClassifier`` (or any classifier
+    ensemble of sklearn decision trees) are concatenated into one node table
+    with normalized leaf probabilities. Small batches, the serving hot path,
+    move every (row, tree) pair one level down per step, so the whole forest
+    is traversed in ``max_depth`` vectorized steps. Large batches find leaves
+    with each tree's compiled ``apply`` instead, which is cheaper once the
+    per-tree call overhead is amortized. Either way a single pass yields both
+    the label and the probability. ``save`` and ``load`` store the arrays in
+    a file that is memory-mapped instead of unpickled.
+    """
+
+    # Above this many rows per-tree ``apply`` beats the vectorized traversal.
+    VECTORIZED_MAX_ROWS = 128
+    # File layout written by save(): MAGIC, the JSON header length as
+    # little-endian uint64, the JSON header, then the arrays. The data section
+    # and every array in it start at an ALIGNMENT-byte boundary; array offsets
+    # in the header are relative to the data section.
+    MAGIC = b"FOREST1\n"
+    ALIGNMENT = 64
+    ARRAYS = ("offsets", "feature", "threshold", "children", "value", "classes_")
+
+    def __init__(self, model):
+        self.trees = [est.tree_ for est in model.estimators_]
+        if any(tree.n_outputs != 1 for tree in self.trees):
+            raise ValueError("Only single-output classifiers can be compiled")
+
+        self.offsets = np.cumsum([0] + [tree.node_count for tree in self.trees])[:-1].astype(np.intp)
+        self.max_depth = max(tree.max_depth for tree in self.trees)
+        self.n_features = model.n_features_in_
+        self.classes_ = model.classes_
+
+        feature, threshold, children, value = [], [], [], []
+        for tree, offset in zip(self.trees, self.offsets):
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            # Leaves point at themselves, so extra traversal steps are no-ops.
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left = np.where(is_leaf, nodes, tree.children_left) + offset
+            right = np.where(is_leaf, nodes, tree.children_right) + offset
+            children.append(np.stack([left, right], axis=1))
+            leaf_value = tree.value[:, 0, :]
+            value.append(leaf_value / leaf_value.sum(axis=1, keepdims=True))
+
+        self.feature = np.ascontiguousarray(np.concatenate(feature), dtype=np.intp)
+        self.threshold = np.ascontiguousarray(np.concatenate(threshold), dtype=np.float64)
+        # children[2 * node] is the left child, children[2 * node + 1] the right one.
+        self.children = np.ascontiguousarray(np.concatenate(children).ravel(), dtype=np.intp)
+        self.value = np.ascontiguousarray(np.concatenate(value), dtype=np.float64)
+        names = getattr(model, "feature_names_in_", None)
+        self.feature_names_in_ = None if names is None else np.asarray(names, dtype=str)
+        self._model = model
+
+    @property
+    def n_features_in_(self) -> int:
+        return self.n_features
+
+    def save(self, path: str):
+        """Write the flattened arrays uncompressed to one file for ``load``.
+
+        The file is written next to ``path`` and renamed into place, so a
+        server watching ``path`` never sees it half-written.
+        """
+        arrays = {name: np.ascontiguousarray(getattr(self, name)) for name in self.ARRAYS}
+        if arrays["classes_"].dtype == object:
+            arrays["classes_"] = arrays["classes_"].astype(str)
+        layout, offset = {}, 0
+        for name, array in arrays.items():
+            layout[name] = {"dtype": array.dtype.newbyteorder("<").str, "shape": list(array.shape), "offset": offset}
+            offset = self._aligned(offset + array.nbytes)
+        header = json.dumps({
+            "n_features": int(self.n_features),
+            "max_depth": int(self.max_depth),
+            "feature_names": None if self.feature_names_in_ is None else [str(n) for n in self.feature_names_in_],
+            "arrays": layout,
+        }).encode()
+        data_start = self._aligned(len(self.MAGIC) + 8 + len(header))
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for name, array in arrays.items():
+                f.write(b"\0" * (data_start + layout[name]["offset"] - f.tell()))
+                f.write(array.astype(layout[name]["dtype"], copy=False).tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledForest":
+        """Memory-map a file written by ``save``.
+
+        Nothing is unpickled or copied: the arrays are read-only views of
+        the mapping, so every process serving the file shares the same page
+        cache pages. Without the sklearn trees large batches also use the
+        vectorized traversal.
+        """
+        with open(path, "rb") as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError(f"{path} is not a compiled forest file")
+            header_size = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_size))
+        data_start = cls._aligned(len(cls.MAGIC) + 8 + header_size)
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+
+        forest = cls.__new__(cls)
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"]))
+            array = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + spec["offset"])
+            setattr(forest, name, array.reshape(spec["shape"]))
+        forest.trees = None
+        forest.n_features = header["n_features"]
+        forest.max_depth = header["max_depth"]
+        names = header["feature_names"]
+        forest.feature_names_in_ = None if names is None else np.asarray(names, dtype=str)
+        forest._model = None
+        forest._buffer = buffer
+        return forest
+
+    @classmethod
+    def _aligned(cls, offset: int) -> int:
+        return -(-offset // cls.ALIGNMENT) * cls.ALIGNMENT
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.offsets)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        if np.isnan(X).any():
+            # Missing-value routing is rare here; keep sklearn's exact semantics.
+            if self._model is None:
+                raise ValueError("Input contains NaN")
+            return self._model.predict_proba(with_feature_names(self._model, X))
+        # sklearn trees compare float32 inputs against float64 thresholds.
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if len(X) <= self.VECTORIZED_MAX_ROWS:
+            return self._traverse(X)
+        if self.trees is None:
+            step = self.VECTORIZED_MAX_ROWS
+            return np.concatenate([self._traverse(X[i:i + step]) for i in range(0, len(X), step)])
+        return self._apply(X)
+
+    def _traverse(self, X: np.ndarray) -> np.ndarray:
+        flat = X.astype(np.float64).ravel()
+        row_base = (np.arange(len(X)) * self.n_features)[:, None]
+        node = np.broadcast_to(self.offsets, (len(X), self.n_trees))
+        for _ in range(self.max_depth):
+            go_right = flat[row_base + self.feature[node]] > self.threshold[node]
+            node = self.children[2 * node + go_right]
+        return self.value[node].sum(axis=1) / self.n_trees
+
+    def _apply(self, X: np.ndarray) -> np.ndarray:
+        proba = np.zeros((len(X), self.value.shape[1]))
+        for tree, offset in zip(self.trees, self.offsets):
+            proba += self.value[tree.apply(X) + offset]
+        return proba / self.n_trees
+
+    def predict(self, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return labels and their probabilities from one traversal."""
+        proba = self.predict_proba(X)
+        best = proba.argmax(axis=1)
+        return self.classes_[best], proba[np.arange(len(proba)), best]
+
 class ModelRunner:
-    def __init__(self, model_path: str, version: str = "v1.0.0"):
+    def __init__(self, model_path: str, version: str = "v1.0.0", backend: str = "sklearn"):
         self.model = None
+        self.engine = None
+        self.schema = None
         self.version = version
         try:
             if os.path.exists(model_path):
-                self.model = joblib.load(model_path)
-                logger.info(f"Model successfully loaded from {model_path}")
+                if Path(model_path).suffix == MAPPED_SUFFIX:
+                    # A compiled forest stands in for the sklearn model: it has
+                    # classes_, n_features_in_ and predict_proba.
+                    self.model = self.engine = CompiledForest.load(model_path)
+                    logger.info(f"Memory-mapped model loaded from {model_path}: {self.engine.n_trees} trees")
+                else:
+                    # Imported here: joblib and the sklearn modules it unpickles are
+                    # only needed for pickled models, not for .forest files.
+                    import joblib
+                    self.model = joblib.load(model_path)
+                    logger.info(f"Model successfully loaded from {model_path}")
+                self.schema = load_feature_schema(self.model, model_path)
+                if self.schema is not None:
+                    logger.info(f"Feature schema: {list(self.schema.names)}")
+                else:
+                    logger.warning("No feature schema found. Features are used in request order.")
+                if backend == "compiled" and self.engine is None:
+                    self._compile()
+                elif backend not in BACKENDS:
+                    logger.warning(f"Unknown inference backend {backend!r}. Expected one of {BACKENDS}.")
             else:
                 logger.warning(f"Model not found at {model_path}. Using fallback.")
         except Exception as e:
             logger.error(f"Error loading model: {e}")
 
-    def predict(self, features: dict[str, float]) -> tuple[str, float]:
+    def _compile(self):
         try:
-            df = pd.DataFrame([features])
-            y = self.model.predict(df)[0]
+            self.engine = CompiledForest(self.model)
+            logger.info(f"Compiled inference backend enabled: {self.engine.n_trees} trees, "
+                        f"{len(self.engine.feature)} nodes")
+        except Exception as e:
+            logger.warning(f"Model cannot be compiled ({e}). Using sklearn backend.")
 
-            if hasattr(self.model, 'predict_proba'):
-                proba = float(max(self.model.predict_proba(df)[0]))
-            else:
-                proba = 0.95
-            logger.info(f"Prediction: {y}, Confidence: {proba:.4f}")
+    def score(self, X: np.ndarray) -> tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """Run the model once and return labels, confidences and the probability matrix.
+
+        Labels come from the argmax over ``classes_``, so estimators with
+        ``predict_proba`` are never run a second time through ``predict``.
+        The probability matrix is None for estimators without ``predict_proba``.
+        Unlike ``predict_many`` this raises when the model cannot score.
+        """
+        if self.engine is not None:
+            proba = self.engine.predict_proba(X)
+        elif hasattr(self.model, 'predict_proba'):
+            proba = self.model.predict_proba(with_feature_names(self.model, X))
+        else:
+            return self.model.predict(with_feature_names(self.model, X)), np.full(len(X), 0.95), None
+        best = proba.argmax(axis=1)
+        return self.model.classes_[best], proba[np.arange(len(X)), best], proba
+
+    def warm_up(self, n_rows: int = 8):
+        """Score a few dummy rows through every inference path.
+
+        Unlike ``predict`` this raises when the model cannot score, so it
+        doubles as a check of a freshly loaded artifact.
+        """
+        if self.model is None:
+            raise RuntimeError("No model loaded")
+        n_features = len(self.schema) if self.schema is not None else getattr(self.model, "n_features_in_", None)
+        if n_features is None:
+            return
+        X = np.zeros((n_rows, n_features))
+        self.score(X[:1])
+        self.score(X)
+        if isinstance(self.engine, CompiledForest):
+            self.engine.predict_proba(np.zeros((self.engine.VECTORIZED_MAX_ROWS + 1, n_features)))
+
+    def class_probabilities(self, proba: np.ndarray) -> dict[str, float]:
+        return {str(c): float(p) for c, p in zip(self.model.classes_, proba)}
+
+    def predict(self, row: np.ndarray, with_probabilities: bool = False) -> tuple[str, float, Optional[dict[str, float]]]:
+        probabilities = None
+        try:
+            labels, confidences, proba = self.score(row.reshape(1, -1))
+            y, conf = labels[0], float(confidences[0])
+            if with_probabilities and proba is not None:
+                probabilities = self.class_probabilities(proba[0])
+            logger.info("Prediction: %s, Confidence: %.4f", y, conf, extra={"event": "prediction"})
         except Exception:
-            proba = 1.0
-            y = "fallback_prediction"
-            logger.info(f"Using fallback. Prediction: {y}, Confidence: {proba:.4f}")
+            y, conf, probabilities = FALLBACK_PREDICTION
+            logger.info("Using fallback. Prediction: %s, Confidence: %.4f", y, conf, extra={"event": "fallback"})
+
+        return str(y), conf, probabilities
+
+    def predict_many(self, X: np.ndarray, with_probabilities: bool = False) -> list[tuple[str, float, Optional[dict[str, float]]]]:
+        """Score all rows of a (n_rows, n_features) array with a single model call."""
+        if len(X) == 0:
+            return []
+        try:
+            labels, confidences, proba = self.score(X)
+            logger.info("Batch prediction: %d rows", len(X), extra={"event": "batch_prediction"})
+            if with_probabilities and proba is not None:
+                return [(str(y), float(c), self.class_probabilities(p)) for y, c, p in zip(labels, confidences, proba)]
+            return [(str(y), float(c), None) for y, c in zip(labels, confidences)]
+        except Exception:
+            logger.info("Using fallback for batch of %d rows", len(X), extra={"event": "fallback"})
+            return [FALLBACK_PREDICTION] * len(X)
+
+    def predict_rows(self, rows: list[np.ndarray], with_probabilities: bool = False) -> list[tuple[str, float, Optional[dict[str, float]]]]:
+        """Score separately validated 1-D rows together, results in input order.
 
-        return str(y), proba
\ No newline at end of file
+        Rows validated against a schema share one width and go through a
+        single ``predict_many`` call. Without a schema clients may send
+        different feature counts, so rows are grouped by width.
+        """
+        widths = {len(row) for row in rows}
+        if len(widths) <= 1:
+            return self.predict_many(np.vstack(rows) if rows else np.empty((0, 0)), with_probabilities)
+        results = [None] * len(rows)
+        for width in widths:
+            positions = [i for i, row in enumerate(rows) if len(row) == width]
+            scored = self.predict_many(np.vstack([rows[i] for i in positions]), with_probabilities)
+            for i, result in zip(positions, scored):
+                results[i] = result
+        return results
@@ -1,7 +1,109 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+from datetime import datetime, timezone
+
+from prometheus_client import Counter
+
+# "sync": text lines written by the calling thread; "async": JSON lines written
+# by a background thread, records dropped when the queue is full
+LOG_MODE = os.getenv("LOG_MODE", "sync")
+# Maximum records waiting for the background writer in async mode
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fraction of records to keep per event, e.g. "prediction=0.01,predict_request=0.1"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+LOG_RECORDS_DROPPED = Counter('log_records_dropped_total', 'Log records not written', ['reason'])
+_SAMPLED_OUT = LOG_RECORDS_DROPPED.labels(reason="sampled")
+_QUEUE_FULL = LOG_RECORDS_DROPPED.labels(reason="queue_full")
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        event, sep, rate = part.partition("=")
+        try:
+            rates[event.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            raise ValueError(f"Invalid LOG_SAMPLE_RATES entry {part!r}: expected event=rate") from None
+        if not sep or not event.strip():
+            raise ValueError(f"Invalid LOG_SAMPLE_RATES entry {part!r}: expected event=rate")
+    return rates
+
+
+class EventSampler(logging.Filter):
+    """Keep only a fraction of the records tagged with ``extra={"event": ...}``.
+
+    Records without an event, or with an event that has no rate, always pass.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(getattr(record, "event", None))
+        if rate is None or rate >= 1.0:
+            return True
+        if rate > 0.0 and random.random() < rate:
+            return True
+        _SAMPLED_OUT.inc()
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra`` fields become top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller and leaves formatting to the listener.
+
+    The stock handler formats the message in the calling thread; here the
+    record is enqueued as is, so ``msg % args`` and JSON encoding happen on
+    the listener thread. Records are dropped and counted when the queue is full.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # Tracebacks hold frames that may change once the caller returns
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _QUEUE_FULL.inc()
+
 
 service_logger = logging.getLogger(__name__)
 service_logger.setLevel(logging.INFO)
+service_logger.addFilter(EventSampler(parse_sample_rates(LOG_SAMPLE_RATES)))
 
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
@@ -9,4 +111,36 @@ console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO)
 console_handler.setFormatter(formatter)
 
-service_logger.addHandler(console_handler)
\ No newline at end of file
+_listener = None
+
+
+def _start_async_logging():
+    """(Re)create the queue and its writer thread.
+
+    Also runs in forked worker processes, where the parent's writer thread
+    does not exist and its queue may have been copied mid-operation.
+    """
+    global _listener
+    for handler in list(service_logger.handlers):
+        service_logger.removeHandler(handler)
+    console_handler.setFormatter(JsonFormatter())
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    service_logger.addHandler(NonBlockingQueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, console_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Write out queued records; call before the process exits."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+if LOG_MODE == "async":
+    _start_async_logging()
+    atexit.register(stop_logging)
+    os.register_at_fork(after_in_child=_start_async_logging)
+else:
+    service_logger.addHandler(console_handler)
@@ -0,0 +1,147 @@
+"""Prometheus instrumentation shared by the gRPC server and the HTTP app.
+
+Besides the end-to-end prediction metrics, every request is split into
+stages (``deserialize``, ``validate``, ``model``, ``respond``, ``serialize``)
+recorded in one histogram, so a p99 regression can be traced to the stage
+that caused it. Latency histograms share one bucket layout.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from server.validation import ValidationError
+
+DEFAULT_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                           0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def parse_buckets(spec: str, default: tuple) -> tuple:
+    """Parse "0.001,0.01,0.1" into sorted bucket bounds; empty means ``default``."""
+    if not spec.strip():
+        return default
+    try:
+        bounds = sorted({float(part) for part in spec.split(",") if part.strip()})
+    except ValueError:
+        raise ValueError(f"Invalid histogram buckets {spec!r}: expected comma-separated numbers")
+    if not bounds or bounds[0] <= 0:
+        raise ValueError(f"Invalid histogram buckets {spec!r}: bounds must be positive")
+    return tuple(bounds)
+
+
+# Bucket bounds (seconds) of all request latency histograms, comma-separated
+LATENCY_BUCKETS = parse_buckets(os.getenv("METRICS_LATENCY_BUCKETS", ""), DEFAULT_LATENCY_BUCKETS)
+# Bucket bounds (rows) of batch size histograms
+BATCH_SIZE_BUCKETS = parse_buckets(os.getenv("METRICS_BATCH_SIZE_BUCKETS", ""), DEFAULT_BATCH_SIZE_BUCKETS)
+
+PREDICTIONS_TOTAL = Counter('predictions_total', 'Total predictions', ['model_version'])
+PREDICTION_DURATION = Histogram('prediction_duration_seconds', 'Prediction duration', ['model_version'],
+                                buckets=LATENCY_BUCKETS)
+ERRORS_TOTAL = Counter('errors_total', 'Total errors', ['model_version', 'error_type'])
+STAGE_DURATION = Histogram('prediction_stage_duration_seconds', 'Time spent in one stage of handling a request',
+                           ['frontend', 'method', 'stage'], buckets=LATENCY_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge('requests_in_flight', 'Requests being handled', ['frontend', 'method'],
+                           multiprocess_mode='livesum')
+EXECUTOR_QUEUE_DEPTH = Gauge('executor_queue_depth', 'Tasks waiting for a free thread', ['pool'],
+                             multiprocess_mode='livesum')
+EXECUTOR_BUSY_THREADS = Gauge('executor_busy_threads', 'Threads running a task', ['pool'],
+                              multiprocess_mode='livesum')
+EXECUTOR_QUEUE_WAIT = Histogram('executor_queue_wait_seconds', 'Time a task waits for a free thread', ['pool'],
+                                buckets=LATENCY_BUCKETS)
+
+
+@contextmanager
+def stage(frontend: str, method: str, name: str):
+    """Time the enclosed block as one stage of a request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(frontend=frontend, method=method, stage=name).observe(time.perf_counter() - start)
+
+
+def timed(fn, frontend: str, method: str, name: str):
+    """Wrap a one-argument callable (e.g. a protobuf (de)serializer) as a timed stage."""
+    histogram = STAGE_DURATION.labels(frontend=frontend, method=method, stage=name)
+
+    def wrapper(arg):
+        start = time.perf_counter()
+        try:
+            return fn(arg)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+@contextmanager
+def in_flight(frontend: str, method: str):
+    gauge = REQUESTS_IN_FLIGHT.labels(frontend=frontend, method=method)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+@contextmanager
+def track_prediction(model_version: str, start_time: float = None):
+    """Observe PREDICTION_DURATION, failed requests included, and count errors by type."""
+    start_time = time.time() if start_time is None else start_time
+    try:
+        yield
+    except ValidationError:
+        ERRORS_TOTAL.labels(model_version=model_version, error_type="validation").inc()
+        raise
+    except Exception:
+        ERRORS_TOTAL.labels(model_version=model_version, error_type="internal").inc()
+        raise
+    finally:
+        PREDICTION_DURATION.labels(model_version=model_version).observe(time.time() - start_time)
+
+
+class InstrumentedThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor reporting its queue depth, busy threads and queue wait as ``pool``."""
+
+    def __init__(self, pool: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._queued = EXECUTOR_QUEUE_DEPTH.labels(pool=pool)
+        self._busy = EXECUTOR_BUSY_THREADS.labels(pool=pool)
+        self._wait = EXECUTOR_QUEUE_WAIT.labels(pool=pool)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Tasks queued or running."""
+        return self._pending
+
+    def _add_pending(self, n: int):
+        with self._pending_lock:
+            self._pending += n
+
+    def submit(self, fn, /, *args, **kwargs):
+        enqueued = time.perf_counter()
+
+        def run():
+            self._queued.dec()
+            self._wait.observe(time.perf_counter() - enqueued)
+            self._busy.inc()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._busy.dec()
+                self._add_pending(-1)
+
+        self._queued.inc()
+        self._add_pending(1)
+        try:
+            return super().submit(run)
+        except BaseException:
+            self._queued.dec()
+            self._add_pending(-1)
+            raise
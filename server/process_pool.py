@@ -0,0 +1,381 @@
+"""
+Process-pool inference: one gRPC front end, models scored in worker processes.
+
+Every worker process loads the models it is asked for and scores feature
+batches outside the front end's GIL. Rows and probabilities are not pickled:
+each worker owns a shared memory block split into ``slots`` slots, and a
+request copies its rows into a free slot, sends the worker a small
+(token, slot, version, shape) tuple over a pipe and reads the probability
+matrix back from the same slot. Batches larger than a slot are split into
+chunks that are scored on several workers in parallel.
+
+A worker that dies (or exceeds ``timeout_s``) is restarted and the chunks
+it held are sent again, up to MAX_ATTEMPTS times in total, so a row that
+crashes every worker ends in an error instead of a restart loop.
+
+Plugs into the existing code as a runner factory for ModelRegistry: the
+front end still loads each model for its schema and classes, but scoring
+goes to the pool through ``PoolEngine``, which stands in for a
+CompiledForest as ``ModelRunner.engine``.
+"""
+
+import atexit
+import itertools
+import multiprocessing
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+import numpy as np
+from prometheus_client import Counter, Gauge
+
+from server.inference import ModelRunner
+import server.logger as _logger
+
+WORKER_BUSY_SECONDS = Counter('inference_worker_busy_seconds_total', 'Time a worker process spent scoring',
+                              ['worker'])
+WORKER_ROWS = Counter('inference_worker_rows_total', 'Rows scored by a worker process', ['worker'])
+WORKER_SLOTS_IN_USE = Gauge('inference_worker_slots_in_use', 'Shared memory slots holding a request',
+                            ['worker'], multiprocess_mode='livesum')
+WORKER_RESTARTS = Counter('inference_worker_restarts_total', 'Worker processes restarted after dying', ['worker'])
+POOL_RETRIES = Counter('inference_pool_retries_total', 'Chunks sent again after their worker died')
+
+logger = _logger.service_logger
+
+MAX_ATTEMPTS = 3
+RESTART_DELAY_S = 1.0
+FLOAT_SIZE = np.dtype(np.float64).itemsize
+
+
+class WorkerLost(Exception):
+    pass
+
+
+def _score_slot(runner: ModelRunner, buffer, offset: int, n_rows: int, n_features: int, n_classes: int):
+    X = np.ndarray((n_rows, n_features), np.float64, buffer, offset)
+    proba = runner.score(X)[2]
+    if proba is None or proba.shape != (n_rows, n_classes):
+        raise RuntimeError(f"Model {runner.version} does not return {n_classes} class probabilities")
+    np.ndarray((n_rows, n_classes), np.float64, buffer, offset + X.nbytes)[:] = proba
+
+
+def _worker_main(index: int, shm_name: str, slot_bytes: int, conn, backend: str):
+    """Worker process: load models on request and score batches found in its slots."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    runners = {}  # version -> (generation, ModelRunner)
+
+    def runner_for(version: str, path: str, generation: int) -> ModelRunner:
+        current = runners.get(version)
+        if current is None or current[0] < generation:
+            runner = ModelRunner(path, version=version, backend=backend)
+            if runner.model is None:
+                raise RuntimeError(f"Worker {index} could not load model {version} from {path}")
+            runner.warm_up()
+            current = runners[version] = (generation, runner)
+        return current[1]
+
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            token, slot, version, path, generation, n_rows, n_features, n_classes = message
+            start = time.perf_counter()
+            try:
+                runner = runner_for(version, path, generation)
+                if slot is not None:
+                    _score_slot(runner, shm.buf, slot * slot_bytes, n_rows, n_features, n_classes)
+                error = None
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            conn.send((token, error, time.perf_counter() - start))
+    finally:
+        shm.close()
+
+
+class _Worker:
+    def __init__(self, index: int, slots: int, slot_bytes: int):
+        self.index = index
+        self.label = str(index)
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.slots = slots
+        self.process = None
+        self.conn = None
+        self.send_lock = threading.Lock()
+        self.pending = {}  # token -> Future
+        self.free = []
+        self.incarnation = 0
+        self.alive = False
+
+
+class InferencePool:
+    """Pool of ``processes`` model-scoring worker processes; see the module docstring.
+
+    ``slots`` requests can be outstanding per worker, each holding up to
+    ``slot_bytes`` of rows plus probabilities.
+    """
+
+    def __init__(self, processes: int, backend: str = "sklearn", slots: int = 4, slot_bytes: int = 1 << 20,
+                 timeout_s: float = 30.0):
+        self.backend = backend
+        self.slot_bytes = slot_bytes - slot_bytes % FLOAT_SIZE
+        self.timeout_s = timeout_s
+        # Workers are forked from a clean server process started now, never from
+        # the front end once gRPC threads are running. Modules imported there are
+        # inherited, so a restarted worker does not import sklearn again.
+        self._context = multiprocessing.get_context("forkserver")
+        self._context.set_forkserver_preload(["server.inference", "joblib", "sklearn.ensemble"])
+        self._tokens = itertools.count()
+        self._generations = itertools.count(1)
+        self._models = {}  # version -> (path, generation), replayed to restarted workers
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._closed = False
+        self._workers = [_Worker(index, max(1, slots), self.slot_bytes) for index in range(max(1, processes))]
+        for worker in self._workers:
+            self._start(worker)
+        atexit.register(self.close)
+        logger.info(f"Inference pool started: {len(self._workers)} processes, backend={backend}, "
+                    f"{slots} slots of {self.slot_bytes // 1024} KiB each")
+
+    def runner(self, model_path: str, version: str = "v1.0.0", backend: str = "sklearn") -> ModelRunner:
+        """ModelRegistry runner factory: a front-end runner whose scoring runs in the pool.
+
+        The front end loads the model without compiling it; the workers load
+        it with the pool's backend before the runner is returned.
+        """
+        runner = ModelRunner(model_path, version=version)
+        if runner.model is None or not hasattr(runner.model, "predict_proba"):
+            logger.warning(f"Model {version} is scored in the front-end process")
+            return runner
+        generation = next(self._generations)
+        self._load(self._workers, version, model_path, generation)
+        with self._lock:
+            self._models[version] = (model_path, generation)
+        runner.engine = PoolEngine(self, version, model_path, generation, len(runner.model.classes_))
+        return runner
+
+    def predict_proba(self, version: str, path: str, generation: int, X: np.ndarray, n_classes: int) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        n_rows, n_features = X.shape
+        rows_per_slot = self.slot_bytes // ((n_features + n_classes) * FLOAT_SIZE)
+        if rows_per_slot == 0:
+            raise ValueError(f"A row of {n_features} features does not fit a {self.slot_bytes}-byte slot")
+        chunks = [X[start:start + rows_per_slot] for start in range(0, max(n_rows, 1), rows_per_slot)]
+        # Only wait for a free slot while holding none: a caller that blocks with
+        # slots in hand could wait forever on callers that hold the rest. Chunks
+        # lost with their worker go back to ``queued`` and take the same path.
+        queued = deque((index, chunk, 1) for index, chunk in enumerate(chunks))
+        inflight, results = deque(), [None] * len(chunks)
+        try:
+            while queued or inflight:
+                if queued:
+                    index, chunk, attempt = queued[0]
+                    call = self._submit(chunk, version, path, generation, n_classes, wait=not inflight)
+                    if call is not None:
+                        queued.popleft()
+                        inflight.append((call, index, chunk, attempt))
+                        continue
+                call, index, chunk, attempt = inflight.popleft()
+                result = self._result(call, chunk, n_classes, attempt)
+                if result is None:
+                    queued.appendleft((index, chunk, attempt + 1))
+                else:
+                    results[index] = result
+        finally:
+            # After an error, chunks still in flight keep their slots until their worker answers
+            for (worker, _, incarnation, slot, future), *_ in inflight:
+                future.add_done_callback(lambda _, w=worker, i=incarnation, s=slot: self._release(w, i, s))
+        return np.concatenate(results)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._slot_freed.notify_all()
+        for worker in self._workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+            worker.shm.close()
+            worker.shm.unlink()
+
+    def _start(self, worker: _Worker):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, name=f"inference-worker-{worker.index}",
+                                        args=(worker.index, worker.shm.name, self.slot_bytes, child_conn,
+                                              self.backend), daemon=True)
+        process.start()
+        child_conn.close()
+        worker.process, worker.conn = process, parent_conn
+        threading.Thread(target=self._read, args=(worker, parent_conn), name=f"inference-reader-{worker.index}",
+                         daemon=True).start()
+        with self._lock:
+            models = dict(self._models)
+        for version, (path, generation) in models.items():
+            try:
+                self._load([worker], version, path, generation)
+            except Exception as e:
+                # Requests for the version retry the load and fail on their own
+                logger.error(f"Inference worker {worker.index} could not load model {version}: {e}")
+        with self._lock:
+            worker.incarnation += 1
+            worker.free = list(range(worker.slots))
+            worker.alive = True
+            self._slot_freed.notify_all()
+        logger.info(f"Inference worker {worker.index} started (pid {process.pid})")
+
+    def _send(self, worker: _Worker, conn, message: tuple) -> Future:
+        """Send a request over ``conn``; the future resolves to (error, busy seconds) or raises WorkerLost."""
+        future = Future()
+        token = next(self._tokens)
+        worker.pending[token] = future
+        try:
+            with worker.send_lock:
+                conn.send((token,) + message)
+        except (OSError, ValueError):
+            pass
+        # _read closes the pipe before failing the pending requests, so a request
+        # added after that is failed here instead of waiting for its timeout
+        if conn.closed:
+            if worker.pending.pop(token, None) is not None:
+                future.set_exception(WorkerLost(f"Inference worker {worker.index} is not reachable"))
+        return future
+
+    def _load(self, workers: list, version: str, path: str, generation: int):
+        """Have ``workers`` load (or reload) a model version, all at once."""
+        futures = [(worker, self._send(worker, worker.conn, (None, version, path, generation, 0, 0, 0)))
+                   for worker in workers]
+        for worker, future in futures:
+            try:
+                error = future.result(timeout=max(self.timeout_s, 60.0))[0]
+            except FutureTimeoutError:
+                worker.process.kill()
+                raise WorkerLost(f"Inference worker {worker.index} did not load model {version}")
+            except WorkerLost:
+                continue  # the restarted worker loads every known model
+            if error:
+                raise RuntimeError(error)
+
+    def _read(self, worker: _Worker, conn):
+        """Resolve the worker's replies; restart the worker once its pipe closes."""
+        while True:
+            try:
+                token, error, busy = conn.recv()
+            except (EOFError, OSError):
+                conn.close()
+                break
+            WORKER_BUSY_SECONDS.labels(worker=worker.label).inc(busy)
+            future = worker.pending.pop(token, None)
+            if future is not None:
+                future.set_result((error, busy))
+
+        with self._lock:
+            worker.alive = False
+            worker.free = []
+            closed = self._closed
+        WORKER_SLOTS_IN_USE.labels(worker=worker.label).set(0)
+        for token in list(worker.pending):
+            future = worker.pending.pop(token, None)
+            if future is not None:
+                future.set_exception(WorkerLost(f"Inference worker {worker.index} died"))
+        worker.process.join()
+        if closed:
+            return
+        logger.warning(f"Inference worker {worker.index} (pid {worker.process.pid}) exited with code "
+                       f"{worker.process.exitcode}. Restarting.")
+        WORKER_RESTARTS.labels(worker=worker.label).inc()
+        time.sleep(RESTART_DELAY_S)
+        self._start(worker)
+
+    def _acquire(self, wait: bool = True):
+        """Take a free slot of the least busy live worker; without ``wait`` return None if there is none."""
+        deadline = time.monotonic() + self.timeout_s
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Inference pool is closed")
+                candidates = [w for w in self._workers if w.alive and w.free]
+                if candidates:
+                    worker = max(candidates, key=lambda w: len(w.free))
+                    slot = worker.free.pop()
+                    WORKER_SLOTS_IN_USE.labels(worker=worker.label).inc()
+                    return worker, worker.conn, worker.incarnation, slot
+                if not wait:
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No inference worker was free within {self.timeout_s}s")
+                self._slot_freed.wait(remaining)
+
+    def _release(self, worker: _Worker, incarnation: int, slot: int):
+        with self._lock:
+            # Slots of a dead worker were reset when it was restarted
+            if worker.incarnation == incarnation and worker.alive:
+                worker.free.append(slot)
+                WORKER_SLOTS_IN_USE.labels(worker=worker.label).dec()
+                self._slot_freed.notify()
+
+    def _submit(self, chunk: np.ndarray, version: str, path: str, generation: int, n_classes: int,
+                wait: bool = True):
+        acquired = self._acquire(wait)
+        if acquired is None:
+            return None
+        worker, conn, incarnation, slot = acquired
+        offset = slot * self.slot_bytes
+        np.ndarray(chunk.shape, np.float64, worker.shm.buf, offset)[:] = chunk
+        future = self._send(worker, conn, (slot, version, path, generation, len(chunk), chunk.shape[1], n_classes))
+        return worker, conn, incarnation, slot, future
+
+    def _result(self, call: tuple, chunk: np.ndarray, n_classes: int, attempt: int):
+        """Probabilities of a submitted chunk, or None if its worker was lost and it should be sent again."""
+        worker, _, incarnation, slot, future = call
+        try:
+            try:
+                error, _ = future.result(timeout=self.timeout_s)
+            except FutureTimeoutError:
+                logger.error(f"Inference worker {worker.index} did not answer within {self.timeout_s}s. "
+                             f"Killing it.")
+                worker.process.kill()
+                raise WorkerLost(f"Inference worker {worker.index} timed out")
+            if error:
+                raise RuntimeError(error)
+            WORKER_ROWS.labels(worker=worker.label).inc(len(chunk))
+            offset = slot * self.slot_bytes + chunk.nbytes
+            return np.ndarray((len(chunk), n_classes), np.float64, worker.shm.buf, offset).copy()
+        except WorkerLost as e:
+            if attempt >= MAX_ATTEMPTS:
+                raise RuntimeError(f"{e}; giving up after {MAX_ATTEMPTS} attempts") from e
+            POOL_RETRIES.inc()
+            logger.warning(f"{e}. Retrying {len(chunk)} rows (attempt {attempt + 1}/{MAX_ATTEMPTS})")
+            return None
+        finally:
+            self._release(worker, incarnation, slot)
+
+
+class PoolEngine:
+    """``ModelRunner.engine`` that scores one model version in an InferencePool."""
+
+    def __init__(self, pool: InferencePool, version: str, path: str, generation: int, n_classes: int):
+        self.pool = pool
+        self.version = version
+        self.path = path
+        self.generation = generation
+        self.n_classes = n_classes
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        return self.pool.predict_proba(self.version, self.path, self.generation, X, self.n_classes)
@@ -0,0 +1,271 @@
+"""
+Model registry: several model versions served side by side from one process.
+
+Versions are configured as ``version=path`` pairs, e.g.
+``MODEL_REGISTRY="v1.0.0=models/model.pkl,v2.0.0=models/model_v2.pkl"``.
+Each version is loaded into its own ModelRunner on first use (or up front by
+``preload``). With a memory budget, loading a version evicts the least
+recently used models that have no request in flight; the default version is
+never evicted. ``reload`` replaces a version's model without a serving gap.
+"""
+
+import os
+import threading
+import time
+from collections import Counter as _Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from server.inference import CompiledForest, ModelRunner
+import server.logger as _logger
+
+MODEL_LOADED = Gauge('model_registry_loaded', 'Whether a model version is loaded', ['model_version'],
+                     multiprocess_mode='livemax')
+MODEL_MEMORY_BYTES = Gauge('model_registry_memory_bytes', 'Estimated memory held by a loaded model version',
+                           ['model_version'], multiprocess_mode='livemax')
+MODEL_LOADS_TOTAL = Counter('model_registry_loads_total', 'Model versions loaded', ['model_version'])
+MODEL_EVICTIONS_TOTAL = Counter('model_registry_evictions_total', 'Model versions unloaded', ['model_version'])
+MODEL_LOAD_DURATION = Histogram('model_registry_load_duration_seconds', 'Time to load and warm up a model version',
+                                ['model_version'])
+MODEL_RELOAD_DURATION = Histogram('model_reload_duration_seconds',
+                                  'Time to load, validate and warm up a replacement model', ['model_version'],
+                                  buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+MODEL_RELOADS_TOTAL = Counter('model_reloads_total', 'Model reload attempts', ['model_version', 'outcome'])
+
+logger = _logger.service_logger
+
+
+class ModelLoadError(Exception):
+    pass
+
+
+class UnknownModelVersion(LookupError):
+    def __init__(self, version: str, known):
+        super().__init__(f"Unknown model version: {version}. Available: {', '.join(known)}")
+        self.version = version
+
+
+def parse_model_registry(spec: str) -> dict[str, str]:
+    """Parse ``"v1=path1,v2=path2"`` into ``{"v1": "path1", "v2": "path2"}``."""
+    models = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        version, sep, path = item.partition("=")
+        version, path = version.strip(), path.strip()
+        if not sep or not version or not path:
+            raise ValueError(f"Invalid model registry entry {item!r}, expected version=path")
+        if version in models:
+            raise ValueError(f"Model version {version} is listed twice")
+        models[version] = path
+    return models
+
+
+def estimate_model_bytes(runner: ModelRunner, model_path: str) -> int:
+    """Rough resident size of a loaded model.
+
+    A joblib pickle of a tree ensemble is mostly the raw node arrays, so its
+    size on disk is close to what the unpickled model occupies. The compiled
+    backend's flattened arrays come on top.
+    """
+    size = os.path.getsize(model_path) if os.path.exists(model_path) else 0
+    engine = runner.engine
+    # A memory-mapped forest is the file itself; its pages are shared page cache.
+    if isinstance(engine, CompiledForest) and engine is not runner.model:
+        size += engine.feature.nbytes + engine.threshold.nbytes + engine.children.nbytes + engine.value.nbytes
+    return size
+
+
+class ModelRegistry:
+    def __init__(self, models: dict[str, str], default_version: str = None,
+                 backend: str = "sklearn", memory_budget_bytes: int = 0,
+                 runner_factory: Callable[..., ModelRunner] = ModelRunner):
+        if not models:
+            raise ValueError("Model registry needs at least one model")
+        self.paths = dict(models)
+        self.default_version = default_version if default_version in self.paths else next(iter(self.paths))
+        self.backend = backend
+        self.memory_budget_bytes = memory_budget_bytes
+        # Called as runner_factory(path, version=..., backend=...), e.g. InferencePool.runner
+        self.runner_factory = runner_factory
+        # Loaded runners in least recently used first order.
+        self._runners = OrderedDict()
+        self._sizes = {}
+        self._inflight = _Counter()
+        self._listeners = []
+        self._lock = threading.Lock()
+        # Serializes loads without blocking lookups of models already loaded.
+        self._load_lock = threading.Lock()
+
+    @property
+    def versions(self) -> list[str]:
+        return list(self.paths)
+
+    @property
+    def loaded_versions(self) -> list[str]:
+        with self._lock:
+            return list(self._runners)
+
+    @property
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def on_change(self, callback: Callable[[str], None]):
+        """Call ``callback(version)`` whenever a version's model is unloaded or replaced."""
+        self._listeners.append(callback)
+
+    def resolve(self, version: str = "") -> str:
+        """Map an empty selector to the default version and reject unknown ones."""
+        if not version:
+            return self.default_version
+        if version not in self.paths:
+            raise UnknownModelVersion(version, self.paths)
+        return version
+
+    def get(self, version: str = "") -> ModelRunner:
+        version = self.resolve(version)
+        with self._lock:
+            runner = self._runners.get(version)
+            if runner is not None:
+                self._runners.move_to_end(version)
+                return runner
+        with self._load_lock:
+            with self._lock:
+                runner = self._runners.get(version)
+                if runner is not None:
+                    self._runners.move_to_end(version)
+                    return runner
+            return self._load(version)
+
+    def is_current(self, runner: ModelRunner) -> bool:
+        """Whether ``runner`` is still the one served for its version."""
+        return self._runners.get(runner.version) is runner
+
+    @contextmanager
+    def use(self, version: str = "") -> Iterator[ModelRunner]:
+        """Hold a runner for the duration of a request, so it cannot be evicted meanwhile."""
+        version = self.resolve(version)
+        with self._lock:
+            self._inflight[version] += 1
+        try:
+            yield self.get(version)
+        finally:
+            with self._lock:
+                self._inflight[version] -= 1
+
+    def preload(self):
+        """Load the default version and then every other one the budget allows."""
+        self.get(self.default_version)
+        for version in self.paths:
+            if version == self.default_version:
+                continue
+            if self.memory_budget_bytes and self.memory_bytes >= self.memory_budget_bytes:
+                logger.info(f"Memory budget reached. Version {version} will be loaded on first use.")
+                break
+            self.get(version)
+
+    def unload(self, version: str) -> bool:
+        with self._lock:
+            unloaded = self._remove(version)
+        if unloaded:
+            self._notify([version])
+        return unloaded
+
+    def reload(self, version: str = "") -> ModelRunner:
+        """Load ``version`` again from its path and swap it in.
+
+        The replacement is loaded, checked and warmed up while the current
+        model keeps serving; requests that already hold the old runner finish
+        on it. On any failure the current model stays and ModelLoadError is
+        raised.
+        """
+        version = self.resolve(version)
+        path = self.paths[version]
+        start_time = time.time()
+        with self._load_lock:
+            try:
+                runner = self.runner_factory(path, version=version, backend=self.backend)
+                if runner.model is None:
+                    raise ModelLoadError(f"Could not load model {version} from {path}")
+                runner.warm_up()
+            except Exception as e:
+                MODEL_RELOADS_TOTAL.labels(model_version=version, outcome="failure").inc()
+                logger.error(f"Reload of model {version} failed, keeping the current model: {e}")
+                if isinstance(e, ModelLoadError):
+                    raise
+                raise ModelLoadError(f"Model {version} from {path} failed validation: {e}") from e
+            size = estimate_model_bytes(runner, path)
+
+            with self._lock:
+                self._sizes.pop(version, None)
+                evicted = self._evict_for(size, keep=version)
+                self._runners[version] = runner
+                self._runners.move_to_end(version)
+                self._sizes[version] = size
+        duration = time.time() - start_time
+        MODEL_RELOAD_DURATION.labels(model_version=version).observe(duration)
+        MODEL_RELOADS_TOTAL.labels(model_version=version, outcome="success").inc()
+        MODEL_LOADED.labels(model_version=version).set(1)
+        MODEL_MEMORY_BYTES.labels(model_version=version).set(size)
+        logger.info(f"Model {version} reloaded from {path} in {duration:.3f}s")
+        self._notify([version] + evicted)
+        return runner
+
+    def _load(self, version: str) -> ModelRunner:
+        path = self.paths[version]
+        start_time = time.time()
+        runner = self.runner_factory(path, version=version, backend=self.backend)
+        if runner.model is not None:
+            try:
+                runner.warm_up()
+            except Exception as e:
+                logger.warning(f"Warm-up of model {version} failed: {e}")
+        size = estimate_model_bytes(runner, path)
+        MODEL_LOAD_DURATION.labels(model_version=version).observe(time.time() - start_time)
+        MODEL_LOADS_TOTAL.labels(model_version=version).inc()
+
+        with self._lock:
+            evicted = self._evict_for(size)
+            self._runners[version] = runner
+            self._sizes[version] = size
+            loaded = list(self._runners)
+        MODEL_LOADED.labels(model_version=version).set(1)
+        MODEL_MEMORY_BYTES.labels(model_version=version).set(size)
+        logger.info(f"Model {version} loaded from {path} (~{size / 2**20:.1f} MiB). "
+                    f"Loaded versions: {loaded}")
+        self._notify(evicted)
+        return runner
+
+    def _evict_for(self, size: int, keep: str = None) -> list[str]:
+        """Unload idle versions, least recently used first, until ``size`` more bytes fit the budget."""
+        evicted = []
+        if not self.memory_budget_bytes:
+            return evicted
+        while sum(self._sizes.values()) + size > self.memory_budget_bytes:
+            idle = [v for v in self._runners if v not in (self.default_version, keep) and not self._inflight[v]]
+            if not idle:
+                logger.warning(f"Memory budget of {self.memory_budget_bytes} bytes exceeded, "
+                               f"but no loaded model is idle. Loaded versions: {list(self._runners)}")
+                break
+            self._remove(idle[0])
+            evicted.append(idle[0])
+        return evicted
+
+    def _remove(self, version: str) -> bool:
+        if self._runners.pop(version, None) is None:
+            return False
+        self._sizes.pop(version, None)
+        MODEL_EVICTIONS_TOTAL.labels(model_version=version).inc()
+        MODEL_LOADED.labels(model_version=version).set(0)
+        MODEL_MEMORY_BYTES.labels(model_version=version).set(0)
+        logger.info(f"Model {version} unloaded")
+        return True
+
+    def _notify(self, versions: list[str]):
+        for version in versions:
+            for callback in self._listeners:
+                callback(version)
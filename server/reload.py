@@ -0,0 +1,104 @@
+"""
+Hot model reload: replace a served model when its file changes or when a
+reload is requested, without restarting the server.
+
+ModelWatcher polls the path of every loaded version. A changed file is
+reloaded once it has stayed unchanged for one more poll, so a model that
+is still being copied is not picked up half-written. Reload requests made
+through ``ModelWatcher.reload`` bump a counter in shared memory created
+before the server forks, and the other worker processes reload on their
+next poll.
+"""
+
+import multiprocessing
+import os
+import threading
+from typing import Optional
+
+from server.inference import ModelRunner
+from server.registry import ModelRegistry, ModelLoadError
+import server.logger as _logger
+
+logger = _logger.service_logger
+
+
+def file_signature(path: str) -> Optional[tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ModelWatcher:
+    def __init__(self, registry: ModelRegistry, interval_s: float = 5.0):
+        self.registry = registry
+        self.interval_s = interval_s
+        self.versions = registry.versions
+        self._requested = multiprocessing.RawArray('L', len(self.versions))
+        self._requested_lock = multiprocessing.Lock()
+        self._seen = [0] * len(self.versions)
+        self._signatures = {}
+        self._pending = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start polling in the current process (call after forking)."""
+        self._seen = list(self._requested)
+        self._signatures = {v: file_signature(self.registry.paths[v]) for v in self.versions}
+        if self.interval_s <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching model files for changes every {self.interval_s}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def reload(self, version: str = "") -> ModelRunner:
+        """Reload ``version`` here and ask the other worker processes to follow."""
+        version = self.registry.resolve(version)
+        signature = file_signature(self.registry.paths[version])
+        runner = self.registry.reload(version)
+        i = self.versions.index(version)
+        with self._requested_lock:
+            self._requested[i] += 1
+            self._seen[i] = self._requested[i]
+        self._signatures[version] = signature
+        self._pending.pop(version, None)
+        return runner
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Model watcher error: {e}")
+
+    def poll(self):
+        loaded = set(self.registry.loaded_versions)
+        for i, version in enumerate(self.versions):
+            requested = self._requested[i]
+            signature = file_signature(self.registry.paths[version])
+            changed = signature is not None and signature != self._signatures.get(version)
+            if requested == self._seen[i] and not changed:
+                continue
+            if requested == self._seen[i] and self._pending.get(version) != signature:
+                # Let the file settle for one more interval.
+                self._pending[version] = signature
+                continue
+
+            self._seen[i] = requested
+            self._signatures[version] = signature
+            self._pending.pop(version, None)
+            if version not in loaded:
+                # The next request loads the new file anyway.
+                continue
+            logger.info(f"Reloading model {version}: "
+                        f"{'file changed' if changed else 'requested by another worker'}")
+            try:
+                self.registry.reload(version)
+            except ModelLoadError:
+                # Already logged; the current model keeps serving until the file changes again.
+                pass
@@ -0,0 +1,206 @@
+"""
+In-process canary routing: weighted traffic split between the model versions
+of a ModelRegistry, and shadow scoring of a candidate version.
+
+The split lives in shared memory created before the server forks (see
+server/workers.py), so a SetTrafficSplit call handled by any worker
+process applies to all of them. Readers only take the lock when the
+generation counter says the split changed.
+"""
+
+import multiprocessing
+import random
+import threading
+import time
+import zlib
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+from typing import NamedTuple, Union
+
+import numpy as np
+from prometheus_client import Counter, Gauge, Histogram
+
+from server.inference import FALLBACK_PREDICTION
+from server.metrics import LATENCY_BUCKETS
+from server.registry import ModelRegistry
+from server.validation import ValidationError
+import server.logger as _logger
+
+TRAFFIC_WEIGHT = Gauge('traffic_weight', 'Configured traffic weight of a model version', ['model_version'],
+                       multiprocess_mode='livemax')
+SHADOW_PREDICTIONS_TOTAL = Counter('shadow_predictions_total', 'Rows scored by the shadow model',
+                                   ['primary_version', 'shadow_version', 'outcome'])
+SHADOW_DROPPED_TOTAL = Counter('shadow_dropped_total', 'Rows not shadow-scored because the shadow queue was full',
+                               ['shadow_version'])
+SHADOW_DURATION = Histogram('shadow_duration_seconds', 'Shadow scoring duration', ['shadow_version'],
+                            buckets=LATENCY_BUCKETS)
+
+logger = _logger.service_logger
+
+
+def parse_weights(spec: str) -> dict[str, float]:
+    """Parse ``"v1.0.0=90,v2.0.0=10"`` into ``{"v1.0.0": 90.0, "v2.0.0": 10.0}``."""
+    weights = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        version, sep, weight = item.partition("=")
+        try:
+            if not sep:
+                raise ValueError
+            weights[version.strip()] = float(weight)
+        except ValueError:
+            raise ValueError(f"Invalid traffic weight {item!r}, expected version=weight") from None
+    return weights
+
+
+class TrafficSplit(NamedTuple):
+    weights: dict[str, float]
+    shadow_version: str
+    shadow_fraction: float
+    # For choose(): versions with a positive weight and their cumulative share
+    routed: tuple
+    bounds: tuple
+
+
+class TrafficRouter:
+    """Picks the model version for requests that do not name one.
+
+    With no weights every request goes to the registry's default version.
+    A routing key such as the request id always maps to the same version
+    for a given split, so retries land on the model that answered first.
+    """
+
+    def __init__(self, versions: list[str], weights: dict[str, float] = None,
+                 shadow_version: str = "", shadow_fraction: float = 1.0):
+        self.versions = list(versions)
+        n = len(self.versions)
+        # Layout: one weight per version, then the shadow version index (-1 for none)
+        # and the shadow fraction.
+        self._shared = multiprocessing.RawArray('d', n + 2)
+        self._generation = multiprocessing.RawValue('L', 0)
+        self._lock = multiprocessing.Lock()
+        self._cached = (-1, None)
+        self.update(weights or {}, shadow_version, shadow_fraction)
+
+    def update(self, weights: dict[str, float], shadow_version: str = "", shadow_fraction: float = 1.0) -> TrafficSplit:
+        for version in list(weights) + ([shadow_version] if shadow_version else []):
+            if version not in self.versions:
+                raise ValidationError(f"Unknown model version: {version}. Available: {', '.join(self.versions)}")
+        if any(w < 0 for w in weights.values()):
+            raise ValidationError("Traffic weights must not be negative")
+        if weights and not sum(weights.values()) > 0:
+            raise ValidationError("At least one traffic weight must be positive")
+        if not 0.0 <= shadow_fraction <= 1.0:
+            raise ValidationError(f"shadow_fraction must be within [0, 1], got {shadow_fraction}")
+
+        values = [float(weights.get(v, 0.0)) for v in self.versions]
+        values.append(float(self.versions.index(shadow_version)) if shadow_version else -1.0)
+        values.append(float(shadow_fraction))
+        with self._lock:
+            self._shared[:] = values
+            self._generation.value += 1
+        split = self.split()
+        logger.info(f"Traffic split updated: weights={split.weights}, shadow={split.shadow_version or None}, "
+                    f"shadow_fraction={split.shadow_fraction}")
+        return split
+
+    def split(self) -> TrafficSplit:
+        generation, split = self._cached
+        if generation == self._generation.value:
+            return split
+        with self._lock:
+            generation = self._generation.value
+            values = self._shared[:]
+        n = len(self.versions)
+        weights = {v: w for v, w in zip(self.versions, values[:n]) if w > 0}
+        shadow = int(values[n])
+        total = sum(weights.values())
+        split = TrafficSplit(
+            weights=weights,
+            shadow_version=self.versions[shadow] if shadow >= 0 else "",
+            shadow_fraction=values[n + 1],
+            routed=tuple(weights),
+            bounds=tuple(w / total for w in accumulate(weights.values())) if total else (),
+        )
+        self._cached = (generation, split)
+        for version in self.versions:
+            TRAFFIC_WEIGHT.labels(model_version=version).set(weights.get(version, 0.0))
+        return split
+
+    def choose(self, key: str = "") -> str:
+        """Version for one request, or "" for the registry default."""
+        split = self.split()
+        if not split.routed:
+            return ""
+        u = zlib.crc32(key.encode()) / 2**32 if key else random.random()
+        return split.routed[min(bisect_right(split.bounds, u), len(split.routed) - 1)]
+
+    def shadow_for(self, version: str) -> str:
+        """Shadow version to also score a request served by ``version``, or ""."""
+        split = self.split()
+        if not split.shadow_version or split.shadow_version == version:
+            return ""
+        if split.shadow_fraction < 1.0 and random.random() >= split.shadow_fraction:
+            return ""
+        return split.shadow_version
+
+
+class ShadowScorer:
+    """Scores rows with a shadow model on a background thread and counts agreement.
+
+    At most ``max_pending`` submissions wait at a time; beyond that rows are
+    dropped (and counted) rather than slowing down the primary path.
+    """
+
+    def __init__(self, registry: ModelRegistry, max_pending: int = 1000):
+        self.registry = registry
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+
+    def submit(self, shadow_version: str, primary_version: str,
+               X: Union[np.ndarray, list], primary_labels: list[str]) -> bool:
+        """Queue ``X`` (a matrix or a list of rows) for shadow scoring."""
+        if not self._slots.acquire(blocking=False):
+            SHADOW_DROPPED_TOTAL.labels(shadow_version=shadow_version).inc(len(primary_labels))
+            return False
+        try:
+            self._executor.submit(self._score, shadow_version, primary_version, X, primary_labels)
+        except RuntimeError:
+            # Executor already shut down
+            self._slots.release()
+            return False
+        return True
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _score(self, shadow_version: str, primary_version: str, X, primary_labels: list[str]):
+        start_time = time.time()
+        try:
+            with self.registry.use(shadow_version) as runner:
+                if isinstance(X, np.ndarray):
+                    results = runner.predict_many(X)
+                else:
+                    results = runner.predict_rows(X)
+            agree = disagree = errors = 0
+            for primary, (label, _, _) in zip(primary_labels, results):
+                if label == FALLBACK_PREDICTION[0] or primary == FALLBACK_PREDICTION[0]:
+                    errors += 1
+                elif label == primary:
+                    agree += 1
+                else:
+                    disagree += 1
+            counter = SHADOW_PREDICTIONS_TOTAL.labels
+            for outcome, count in (("agree", agree), ("disagree", disagree), ("error", errors)):
+                if count:
+                    counter(primary_version=primary_version, shadow_version=shadow_version, outcome=outcome).inc(count)
+            SHADOW_DURATION.labels(shadow_version=shadow_version).observe(time.time() - start_time)
+        except Exception as e:
+            logger.error(f"Shadow scoring with {shadow_version} failed: {e}")
+            SHADOW_PREDICTIONS_TOTAL.labels(primary_version=primary_version, shadow_version=shadow_version,
+                                            outcome="error").inc(len(primary_labels))
+        finally:
+            self._slots.release()
@@ -1,40 +1,227 @@
-from xml.parsers.expat import model
+import argparse
+import asyncio
+import functools
 import grpc
+import hmac
 import os
-from concurrent import futures
-from grpc_reflection.v1alpha import reflection
+import queue
+import signal
+import threading
 import model_pb2, model_pb2_grpc
 from grpc_health.v1 import health as health_rpc, health_pb2, health_pb2_grpc
-from server.validation import features_to_dict, ValidationError
-from server.inference import ModelRunner
+from server.validation import request_to_row, batch_to_matrix, ValidationError
+from server.inference import ModelRunner, FALLBACK_PREDICTION
+from server.registry import ModelRegistry, ModelLoadError, UnknownModelVersion, parse_model_registry
+from server.reload import ModelWatcher
+from server.routing import TrafficRouter, ShadowScorer, parse_weights
+from server.batching import MicroBatcher, collect_window
+from server.cache import PredictionCache
+from server.capture import CaptureSink
+from server.admission import AdmissionController, AdmissionInterceptor, GradientLimit
+from server import metrics
+from server.metrics import PREDICTIONS_TOTAL, ERRORS_TOTAL, InstrumentedThreadPoolExecutor
 import server.logger as _logger
-from prometheus_client import Counter, Histogram, start_http_server
+from prometheus_client import Counter, start_http_server
 import time
 
 
 MODEL_PATH = os.getenv("MODEL_PATH", "models/model.pkl")
 MODEL_VERSION = os.getenv("MODEL_VERSION", "v1.0.0")
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "sklearn")  # "sklearn" or "compiled"
+# Serve several versions from one process: "v1.0.0=models/model.pkl,v2.0.0=models/model_v2.pkl".
+# Requests pick one with PredictRequest.model_version; MODEL_VERSION is the default.
+# Without MODEL_REGISTRY only MODEL_PATH is served, as MODEL_VERSION.
+MODEL_REGISTRY = os.getenv("MODEL_REGISTRY", "")
+# Idle models are unloaded (least recently used first) above this estimate; 0 means no limit
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+# Loaded model files are polled this often and reloaded when they change; 0 turns the watcher off
+MODEL_WATCH_INTERVAL_S = float(os.getenv("MODEL_WATCH_INTERVAL_S", "5"))
+# Requests without model_version are split by weight, e.g. "v1.0.0=90,v2.0.0=10" (see server/routing.py).
+# SHADOW_VERSION also scores a SHADOW_FRACTION of requests off the response path and records agreement.
+TRAFFIC_WEIGHTS = os.getenv("TRAFFIC_WEIGHTS", "")
+SHADOW_VERSION = os.getenv("SHADOW_VERSION", "")
+SHADOW_FRACTION = float(os.getenv("SHADOW_FRACTION", "1"))
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "1000"))
+# SetTrafficSplit and ReloadModel require it in the "x-admin-token" request metadata; without it they are
+# refused unless ADMIN_ALLOW_UNAUTHENTICATED=1 opens them to any caller (local development only)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+ADMIN_ALLOW_UNAUTHENTICATED = os.getenv("ADMIN_ALLOW_UNAUTHENTICATED", "0") == "1"
 MAX_WORKERS = int(os.getenv("MAX_WORKERS", "4"))
+# Number of server processes sharing PORT; see server/workers.py
+WORKERS = int(os.getenv("WORKERS", "1"))
+SHUTDOWN_GRACE_S = float(os.getenv("SHUTDOWN_GRACE_S", "5"))
+# INFERENCE_PROCESSES > 0 scores in that many worker processes behind this one (see server/process_pool.py);
+# each takes INFERENCE_SLOTS requests at a time of up to INFERENCE_SLOT_KB rows + probabilities
+INFERENCE_PROCESSES = int(os.getenv("INFERENCE_PROCESSES", "0"))
+INFERENCE_SLOTS = int(os.getenv("INFERENCE_SLOTS", "4"))
+INFERENCE_SLOT_KB = int(os.getenv("INFERENCE_SLOT_KB", "1024"))
+# A worker process not answering within INFERENCE_TIMEOUT_S is killed, restarted and its rows retried
+INFERENCE_TIMEOUT_S = float(os.getenv("INFERENCE_TIMEOUT_S", "30"))
+# "sync" (grpc.server + thread pool) or "aio" (grpc.aio on an event loop, see AioPredictionService)
+SERVER_MODE = os.getenv("SERVER_MODE", "sync")
+# aio mode: threads running ModelRunner calls and the in-flight request limit
+AIO_INFERENCE_THREADS = int(os.getenv("AIO_INFERENCE_THREADS", str(MAX_WORKERS)))
+AIO_MAX_INFLIGHT = int(os.getenv("AIO_MAX_INFLIGHT", "1000"))
+# Predict/PredictBatch calls whose deadline has passed, or is nearer than the observed service time times
+# ADMISSION_DEADLINE_MARGIN, fail with DEADLINE_EXCEEDED instead of being scored; 0 turns the check off
+ADMISSION_DEADLINE_MARGIN = float(os.getenv("ADMISSION_DEADLINE_MARGIN", "1"))
+# ADMISSION_ADAPTIVE_LIMIT=1 sheds calls with RESOURCE_EXHAUSTED above a concurrency limit that follows latency,
+# between ADMISSION_MIN_LIMIT and ADMISSION_MAX_LIMIT; ADMISSION_TOLERANCE is the latency rise it accepts.
+# 0 derives the initial and minimum limits from the threads scoring requests (MAX_WORKERS, in aio mode
+# AIO_INFERENCE_THREADS): 5x and 2x, so the limit never leaves threads idle
+ADMISSION_ADAPTIVE_LIMIT = os.getenv("ADMISSION_ADAPTIVE_LIMIT", "0") == "1"
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "0"))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "0"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "500"))
+ADMISSION_TOLERANCE = float(os.getenv("ADMISSION_TOLERANCE", "1.5"))
+# Longer deadlines count as none
+MAX_DEADLINE_S = 24 * 3600.0
 PORT = int(os.getenv("PORT", "50051"))
 METRICS_PORT = int(os.getenv("METRICS_PORT", "8000"))
+# MAX_BATCH_SIZE > 1 turns on server-side micro-batching of concurrent Predict calls
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1"))
+MAX_BATCH_DELAY_MS = float(os.getenv("MAX_BATCH_DELAY_MS", "2"))
+# PredictStream scores up to STREAM_WINDOW_SIZE queued messages per model call,
+# waiting at most STREAM_WINDOW_MS for a window to fill
+STREAM_WINDOW_SIZE = int(os.getenv("STREAM_WINDOW_SIZE", "256"))
+STREAM_WINDOW_MS = float(os.getenv("STREAM_WINDOW_MS", "5"))
+# PREDICTION_CACHE_SIZE > 0 turns on the in-process prediction cache
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "0"))
+PREDICTION_CACHE_TTL_S = float(os.getenv("PREDICTION_CACHE_TTL_S", "300"))
+PREDICTION_CACHE_PRECISION = int(os.getenv("PREDICTION_CACHE_PRECISION", "6"))
+# Synthetic requests scored per loaded model before the server reports SERVING; 0 skips warm-up
+WARMUP_ROUNDS = int(os.getenv("WARMUP_ROUNDS", "8"))
+# CAPTURE_DIR turns on capturing a CAPTURE_SAMPLE_RATE fraction of scored rows to Parquet or Arrow
+# files there (needs pyarrow, see server/capture.py). Rows that do not fit CAPTURE_BUFFER_ROWS are dropped.
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "")
+CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", "1"))
+CAPTURE_BUFFER_ROWS = int(os.getenv("CAPTURE_BUFFER_ROWS", "100000"))
+CAPTURE_FLUSH_INTERVAL_S = float(os.getenv("CAPTURE_FLUSH_INTERVAL_S", "5"))
+CAPTURE_ROTATE_ROWS = int(os.getenv("CAPTURE_ROTATE_ROWS", "1000000"))
+CAPTURE_ROTATE_S = float(os.getenv("CAPTURE_ROTATE_S", "3600"))
+CAPTURE_FORMAT = os.getenv("CAPTURE_FORMAT", "parquet")  # "parquet" or "arrow"
 
-PREDICTIONS_TOTAL = Counter('predictions_total', 'Total predictions', ['model_version'])
-PREDICTION_DURATION = Histogram('prediction_duration_seconds', 'Prediction duration', ['model_version'])
-ERRORS_TOTAL = Counter('errors_total', 'Total errors', ['model_version', 'error_type'])
+INFLIGHT_REJECTED_TOTAL = Counter('inflight_rejected_total', 'Requests rejected because too many were in flight', ['method'])
 
 logger = _logger.service_logger
 
+_STREAM_END = object()
+ADMITTED_METHODS = ("Predict", "PredictBatch")
+
+def load_registry() -> ModelRegistry:
+    models = parse_model_registry(MODEL_REGISTRY) if MODEL_REGISTRY else {MODEL_VERSION: MODEL_PATH}
+    runner_factory = ModelRunner
+    if INFERENCE_PROCESSES > 0:
+        from server.process_pool import InferencePool
+        runner_factory = InferencePool(INFERENCE_PROCESSES, INFERENCE_BACKEND, INFERENCE_SLOTS,
+                                       INFERENCE_SLOT_KB * 1024, INFERENCE_TIMEOUT_S).runner
+    registry = ModelRegistry(models, default_version=MODEL_VERSION, backend=INFERENCE_BACKEND,
+                             memory_budget_bytes=int(MODEL_MEMORY_BUDGET_MB * 2**20), runner_factory=runner_factory)
+    registry.preload()
+    return registry
+
+def load_router(registry: ModelRegistry) -> TrafficRouter:
+    return TrafficRouter(registry.versions, parse_weights(TRAFFIC_WEIGHTS), SHADOW_VERSION, SHADOW_FRACTION)
+
+def load_admission(threads: int):
+    limit = None
+    if ADMISSION_ADAPTIVE_LIMIT:
+        min_limit = ADMISSION_MIN_LIMIT or 2 * threads
+        initial = ADMISSION_INITIAL_LIMIT or max(5 * threads, min_limit)
+        limit = GradientLimit(initial, min_limit, ADMISSION_MAX_LIMIT, ADMISSION_TOLERANCE)
+    if limit is None and ADMISSION_DEADLINE_MARGIN <= 0:
+        return None
+    return AdmissionController(ADMITTED_METHODS, ADMISSION_DEADLINE_MARGIN, limit)
+
+def request_rows(request) -> int:
+    if isinstance(request, model_pb2.PredictBatchRequest):
+        return request.dense.num_rows if request.HasField("dense") else len(request.rows)
+    return 1
+
+def load_shared() -> dict:
+    """State created once before worker processes fork, passed to serve() as keyword arguments."""
+    registry = load_registry()
+    return {"registry": registry, "router": load_router(registry),
+            "watcher": ModelWatcher(registry, MODEL_WATCH_INTERVAL_S)}
+
 class PredictionService(model_pb2_grpc.PredictionServiceServicer):
-    def __init__(self):
-        self.runner = ModelRunner(MODEL_PATH, version=MODEL_VERSION)
-        logger.info(f"Service initialized. Model version: {self.runner.version}")
-        metrics_port = int(os.getenv('METRICS_PORT', '8000'))
-        start_http_server(metrics_port)
-        logger.info(f"Prometheus metrics are available on port: {METRICS_PORT}")
+    def __init__(self, registry: ModelRegistry = None, router: TrafficRouter = None,
+                 watcher: ModelWatcher = None, start_metrics: bool = True, scoring_threads: int = MAX_WORKERS):
+        self.registry = registry if registry is not None else load_registry()
+        self.router = router if router is not None else load_router(self.registry)
+        self.watcher = watcher if watcher is not None else ModelWatcher(self.registry, MODEL_WATCH_INTERVAL_S)
+        self.watcher.start()
+        self.shadow = ShadowScorer(self.registry, SHADOW_MAX_PENDING)
+        self.batcher = None
+        if MAX_BATCH_SIZE > 1:
+            self.batcher = MicroBatcher(MAX_BATCH_SIZE, MAX_BATCH_DELAY_MS)
+        self.cache = None
+        if PREDICTION_CACHE_SIZE > 0:
+            self.cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_S, PREDICTION_CACHE_PRECISION)
+            self.registry.on_change(self.cache.invalidate)
+        self.capture = None
+        if CAPTURE_DIR:
+            try:
+                self.capture = CaptureSink(CAPTURE_DIR, CAPTURE_SAMPLE_RATE, CAPTURE_BUFFER_ROWS, CAPTURE_FLUSH_INTERVAL_S,
+                                           CAPTURE_ROTATE_ROWS, CAPTURE_ROTATE_S, CAPTURE_FORMAT)
+            except ImportError as e:
+                raise RuntimeError(f"CAPTURE_DIR is set but pyarrow is not installed ({e}); "
+                                   f"install it from requirements.txt or unset CAPTURE_DIR") from e
+        self.admission = load_admission(scoring_threads)
+        logger.info(f"Service initialized. Default model version: {self.registry.default_version}, "
+                    f"available versions: {self.registry.versions}")
+        if start_metrics:
+            metrics_port = int(os.getenv('METRICS_PORT', '8000'))
+            start_http_server(metrics_port)
+            logger.info(f"Prometheus metrics are available on port: {METRICS_PORT}")
+
+    @property
+    def runner(self) -> ModelRunner:
+        """Runner of the default model version."""
+        return self.registry.get()
+
+    def warm_up(self, rounds: int = WARMUP_ROUNDS):
+        """Run synthetic requests through validation and every loaded model.
+
+        Called before the server reports SERVING, so lazy initialization in
+        NumPy, sklearn and protobuf is paid here and not by the first real
+        request. Metrics and the prediction cache are left untouched.
+        """
+        if rounds <= 0:
+            return
+        start_time = time.time()
+        for version in self.registry.loaded_versions:
+            runner = self.registry.get(version)
+            if runner.schema is not None:
+                names = list(runner.schema.names)
+            else:
+                n_features = getattr(runner.model, "n_features_in_", None)
+                if n_features is None:
+                    continue
+                names = [f"f{i}" for i in range(n_features)]
+            request = model_pb2.PredictRequest(features=[model_pb2.Feature(name=name, value=0.0) for name in names])
+            dense = model_pb2.DenseFeatures(names=names, num_rows=rounds, values=[0.0] * (rounds * len(names)))
+            try:
+                for _ in range(rounds):
+                    pred, conf, probabilities = self._score_row(runner, request_to_row(request, runner.schema), True)
+                    model_pb2.PredictResponse(prediction=pred, confidence=conf, model_version=version,
+                                              probabilities=probabilities).SerializeToString()
+                runner.predict_many(batch_to_matrix(model_pb2.PredictBatchRequest(dense=dense), runner.schema), True)
+            except Exception as e:
+                logger.warning(f"Warm-up of model {version} failed: {e}")
+        logger.info(f"Warm-up finished in {time.time() - start_time:.3f}s")
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+        self.shadow.close()
+        self.watcher.stop()
+        if self.capture is not None:
+            self.capture.close()
 
     def Health(self, request, context):
         try:
-            logger.info("Starting health check...")
+            logger.info("Starting health check...", extra={"event": "health_check"})
             return model_pb2.HealthResponse(status="ok", model_version=self.runner.version)
         except Exception as e:
             logger.error(f"Error in Health: {e}")
@@ -43,72 +230,556 @@ class PredictionService(model_pb2_grpc.PredictionServiceServicer):
             return model_pb2.HealthResponse()
 
     def Predict(self, request, context):
-        start_time = time.time()
+        with metrics.in_flight("grpc", "Predict"):
+            handler = functools.partial(self._predict, deadline=self._deadline(context))
+            return self._respond(context, self._invoke("Predict", handler, request, model_pb2.PredictResponse))
 
-        try:
-            feats = features_to_dict(request.features)
+    def PredictBatch(self, request, context):
+        with metrics.in_flight("grpc", "PredictBatch"):
+            return self._respond(context, self._invoke("PredictBatch", self._predict_batch, request,
+                                                       model_pb2.PredictBatchResponse))
 
-            features = list(request.features)
-            logger.info(f"Predict request received. Number of features: {len(features)}")
-            PREDICTIONS_TOTAL.labels(model_version=self.runner.version).inc()
-            
-            if not features:
-                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
-                context.set_details("Features list cannot be empty")
-                return model_pb2.PredictResponse()
+    def GetTrafficSplit(self, request, context):
+        return self._traffic_split_message(self.router.split())
 
-            pred, conf = self.runner.predict(feats)
+    def SetTrafficSplit(self, request, context):
+        if not self._is_admin(context):
+            context.abort(grpc.StatusCode.PERMISSION_DENIED, "SetTrafficSplit requires a valid x-admin-token")
+        return self._respond(context, self._invoke("SetTrafficSplit", self._set_traffic_split, request, model_pb2.TrafficSplit))
 
-            PREDICTION_DURATION.labels(model_version=self.runner.version).observe(time.time() - start_time)
+    def ReloadModel(self, request, context):
+        if not self._is_admin(context):
+            context.abort(grpc.StatusCode.PERMISSION_DENIED, "ReloadModel requires a valid x-admin-token")
+        return self._respond(context, self._invoke("ReloadModel", self._reload_model, request, model_pb2.ReloadModelResponse))
 
-            return model_pb2.PredictResponse(
-                prediction=pred, confidence=conf, model_version=self.runner.version
-            )        
+    def PredictStream(self, request_iterator, context):
+        # Messages are read on a separate thread into a bounded queue, so a
+        # slow consumer pushes back on the client through HTTP/2 flow control.
+        pending = queue.Queue(maxsize=STREAM_WINDOW_SIZE * 4)
 
-        except ValidationError as ve:
-            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
-            context.set_details(str(ve))
-            logger.error(f"Validation Error in Predict: {str(ve)}")
-            return model_pb2.PredictResponse()
+        def put(item):
+            # Give up once the RPC is gone, so a cancelled stream cannot leave
+            # this thread blocked on a full queue.
+            while context.is_active():
+                try:
+                    pending.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def read():
+            try:
+                for request in request_iterator:
+                    put(request)
+            except Exception as e:
+                logger.info(f"PredictStream reader stopped: {e}")
+            finally:
+                put(_STREAM_END)
+
+        threading.Thread(target=read, name="predict-stream-reader", daemon=True).start()
+
+        acked = 0
+        try:
+            metrics.REQUESTS_IN_FLIGHT.labels(frontend="grpc", method="PredictStream").inc()
+            while True:
+                first = pending.get()
+                if first is _STREAM_END:
+                    break
+                window, done = collect_window(pending, first, STREAM_WINDOW_SIZE, STREAM_WINDOW_MS / 1000.0, _STREAM_END)
+                yield from self._predict_window(window, acked)
+                acked += len(window)
+                if done:
+                    break
         except Exception as e:
+            logger.error(f"Error in PredictStream: {str(e)}")
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(f"internal error: {e}")
-            logger.error(f"Error in Predict: {str(e)}")
-            return model_pb2.PredictResponse()
-
-def serve():
-    options = [
-        ("grpc.max_send_message_length", 50 * 1024 * 1024),
-        ("grpc.max_receive_message_length", 50 * 1024 * 1024),
-    ]
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=MAX_WORKERS), options=options)
-    model_pb2_grpc.add_PredictionServiceServicer_to_server(PredictionService(), server)
+        finally:
+            metrics.REQUESTS_IN_FLIGHT.labels(frontend="grpc", method="PredictStream").dec()
+
+    # The handler bodies below never touch the gRPC context, so the asyncio
+    # server (AioPredictionService) can run them in an executor thread and
+    # apply the outcome to its context on the event loop.
+
+    def _invoke(self, method: str, handler, request, empty_response):
+        """Run a handler and map its errors to (response, status code, details)."""
+        try:
+            return handler(request), None, None
+        except ValidationError as ve:
+            logger.error(f"Validation Error in {method}: {str(ve)}")
+            return empty_response(), grpc.StatusCode.INVALID_ARGUMENT, str(ve)
+        except UnknownModelVersion as e:
+            logger.error(f"Error in {method}: {str(e)}")
+            # The requested name is client input, so it is not used as a label
+            ERRORS_TOTAL.labels(model_version="unknown", error_type="unknown_model_version").inc()
+            return empty_response(), grpc.StatusCode.NOT_FOUND, str(e)
+        except ModelLoadError as e:
+            logger.error(f"Error in {method}: {str(e)}")
+            ERRORS_TOTAL.labels(model_version=getattr(request, "model_version", "") or "default",
+                                error_type="model_load").inc()
+            return empty_response(), grpc.StatusCode.FAILED_PRECONDITION, f"{e}. The current model is still served."
+        except Exception as e:
+            logger.error(f"Error in {method}: {str(e)}")
+            return empty_response(), grpc.StatusCode.INTERNAL, f"internal error: {e}"
+
+    @staticmethod
+    def _deadline(context):
+        """The call's deadline as a ``time.perf_counter()`` value, None without one."""
+        remaining = context.time_remaining()
+        # grpc.server reports a call without a deadline as due in thousands of years
+        if remaining is None or remaining > MAX_DEADLINE_S:
+            return None
+        return time.perf_counter() + remaining
+
+    @staticmethod
+    def _is_admin(context) -> bool:
+        if not ADMIN_TOKEN:
+            return ADMIN_ALLOW_UNAUTHENTICATED
+        token = dict(context.invocation_metadata()).get("x-admin-token", "")
+        return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+    @staticmethod
+    def _traffic_split_message(split) -> model_pb2.TrafficSplit:
+        return model_pb2.TrafficSplit(weights=split.weights, shadow_version=split.shadow_version,
+                                      shadow_fraction=split.shadow_fraction)
+
+    def _set_traffic_split(self, request):
+        shadow_fraction = request.shadow_fraction if request.HasField("shadow_fraction") else 1.0
+        split = self.router.update(dict(request.weights), request.shadow_version, shadow_fraction)
+        return self._traffic_split_message(split)
+
+    def _reload_model(self, request):
+        start_time = time.time()
+        runner = self.watcher.reload(request.model_version)
+        return model_pb2.ReloadModelResponse(model_version=runner.version, duration_seconds=time.time() - start_time)
+
+    def _shadow(self, version: str, X, labels: list[str]):
+        shadow_version = self.router.shadow_for(version)
+        if shadow_version:
+            self.shadow.submit(shadow_version, version, X, labels)
+
+    def _capture(self, runner: ModelRunner, X, request_ids, results):
+        if self.capture is None:
+            return
+        if runner.schema is not None:
+            names = runner.schema.names
+        else:
+            names = [f"f{i}" for i in range(len(X[0]))]
+        self.capture.capture(runner.version, names, X, request_ids,
+                             [pred for pred, _, _ in results], [conf for _, conf, _ in results])
+
+    @staticmethod
+    def _respond(context, outcome):
+        response, code, details = outcome
+        if code is not None:
+            context.set_code(code)
+            context.set_details(details)
+        return response
+
+    def _predict(self, request, deadline: float = None):
+        start_time = time.time()
+
+        version = request.model_version or self.router.choose(request.request_id)
+        with self.registry.use(version) as runner, metrics.track_prediction(runner.version, start_time):
+            with metrics.stage("grpc", "Predict", "validate"):
+                row = request_to_row(request, runner.schema)
+            logger.info("Predict request received. Number of features: %d", len(row), extra={"event": "predict_request"})
+            PREDICTIONS_TOTAL.labels(model_version=runner.version).inc()
+
+            with metrics.stage("grpc", "Predict", "model"):
+                pred, conf, probabilities = self._predict_row(runner, row, request.return_probabilities, deadline)
+
+            with metrics.stage("grpc", "Predict", "respond"):
+                response = model_pb2.PredictResponse(
+                    prediction=pred, confidence=conf, model_version=runner.version,
+                    probabilities=probabilities,
+                )
+
+        self._shadow(runner.version, [row], [pred])
+        self._capture(runner, [row], [request.request_id], [(pred, conf, None)])
+        return response
+
+    def _predict_window(self, requests: list, acked: int) -> list:
+        """Score one window of streamed requests with a single model call.
+
+        Invalid messages get a response with ``error`` set instead of failing
+        the whole stream. ``acked`` counts the requests consumed before this
+        window and is continued in each response. Requests for different
+        model versions are scored with one call per version.
+        """
+        responses = [None] * len(requests)
+        by_version = {}
+        for i, request in enumerate(requests):
+            version = request.model_version or self.router.choose(request.request_id)
+            by_version.setdefault(version, []).append(i)
+
+        logger.info("PredictStream window received. Requests: %d, versions: %d", len(requests), len(by_version),
+                    extra={"event": "stream_window"})
+        for selector, positions in by_version.items():
+            try:
+                with self.registry.use(selector) as runner:
+                    self._score_window(runner, requests, positions, responses)
+            except UnknownModelVersion as e:
+                for i in positions:
+                    responses[i] = model_pb2.PredictResponse(request_id=requests[i].request_id, error=str(e))
+
+        for n, response in enumerate(responses, 1):
+            response.acked = acked + n
+        return responses
+
+    def _score_window(self, runner: ModelRunner, requests: list, positions: list, responses: list):
+        start_time = time.time()
+        version = runner.version
+        rows, valid = [], []
+        with metrics.stage("grpc", "PredictStream", "validate"):
+            for i in positions:
+                try:
+                    rows.append(request_to_row(requests[i], runner.schema))
+                    valid.append(i)
+                except ValidationError as ve:
+                    ERRORS_TOTAL.labels(model_version=version, error_type="validation").inc()
+                    responses[i] = model_pb2.PredictResponse(request_id=requests[i].request_id, model_version=version,
+                                                             error=str(ve))
+
+        if rows:
+            with metrics.track_prediction(version, start_time):
+                PREDICTIONS_TOTAL.labels(model_version=version).inc(len(rows))
+                wanted = [requests[i].return_probabilities for i in valid]
+                with metrics.stage("grpc", "PredictStream", "model"):
+                    results = runner.predict_rows(rows, with_probabilities=any(wanted))
+                with metrics.stage("grpc", "PredictStream", "respond"):
+                    for i, want, (pred, conf, probabilities) in zip(valid, wanted, results):
+                        responses[i] = model_pb2.PredictResponse(
+                            prediction=pred, confidence=conf, model_version=version,
+                            probabilities=probabilities if want else None,
+                            request_id=requests[i].request_id,
+                        )
+            self._shadow(version, rows, [pred for pred, _, _ in results])
+            self._capture(runner, rows, [requests[i].request_id for i in valid], results)
+
+    def _score_row(self, runner: ModelRunner, row, with_probabilities: bool, deadline: float = None):
+        if self.batcher is not None:
+            return self.batcher.predict(runner, row, with_probabilities, deadline)
+        return runner.predict(row, with_probabilities)
+
+    def _predict_row(self, runner: ModelRunner, row, with_probabilities: bool, deadline: float = None):
+        if self.cache is None:
+            return self._score_row(runner, row, with_probabilities, deadline)
+
+        # Cached entries always carry probabilities so any request can reuse them.
+        version = runner.version
+        key = self.cache.key(row)
+        result = self.cache.get(version, key)
+        if result is None:
+            result = self._score_row(runner, row, True, deadline)
+            # A runner swapped out by a reload meanwhile must not refill the cache.
+            if result[0] != FALLBACK_PREDICTION[0] and self.registry.is_current(runner):
+                self.cache.put(version, key, result)
+        pred, conf, probabilities = result
+        return pred, conf, probabilities if with_probabilities else None
+
+    def _predict_batch(self, request):
+        start_time = time.time()
+
+        with self.registry.use(request.model_version or self.router.choose()) as runner, \
+                metrics.track_prediction(runner.version, start_time):
+            with metrics.stage("grpc", "PredictBatch", "validate"):
+                X = batch_to_matrix(request, runner.schema)
+            logger.info("PredictBatch request received. Number of rows: %d", len(X), extra={"event": "predict_batch_request"})
+            PREDICTIONS_TOTAL.labels(model_version=runner.version).inc(len(X))
+
+            if request.HasField("dense"):
+                with_probabilities = [request.return_probabilities] * len(X)
+            else:
+                with_probabilities = [row.return_probabilities for row in request.rows]
+            with metrics.stage("grpc", "PredictBatch", "model"):
+                results = runner.predict_many(X, with_probabilities=any(with_probabilities))
+
+            with metrics.stage("grpc", "PredictBatch", "respond"):
+                response = model_pb2.PredictBatchResponse(predictions=[
+                    model_pb2.PredictResponse(
+                        prediction=pred, confidence=conf, model_version=runner.version,
+                        probabilities=probabilities if wanted else None,
+                    )
+                    for (pred, conf, probabilities), wanted in zip(results, with_probabilities)
+                ])
+
+        self._shadow(runner.version, X, [pred for pred, _, _ in results])
+        self._capture(runner, X, None if request.HasField("dense") else [row.request_id for row in request.rows],
+                      results)
+        return response
+
+SERVER_OPTIONS = [
+    ("grpc.max_send_message_length", 50 * 1024 * 1024),
+    ("grpc.max_receive_message_length", 50 * 1024 * 1024),
+    # Lets several worker processes bind the same port (see server/workers.py)
+    ("grpc.so_reuseport", 1),
+    # Accept the keepalive pings of pooled client channels (client/predictor.py), idle ones included,
+    # instead of closing the connection for "too many pings"
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.min_recv_ping_interval_without_data_ms", 10_000),
+]
+HEALTH_SERVICE_NAMES = ('', 'mlservice.v1.PredictionService')
+
+def _timed_handler(method: str, handler: grpc.RpcMethodHandler) -> grpc.RpcMethodHandler:
+    return handler._replace(
+        request_deserializer=metrics.timed(handler.request_deserializer, "grpc", method, "deserialize"),
+        response_serializer=metrics.timed(handler.response_serializer, "grpc", method, "serialize"),
+    )
+
+class _TimedGenericHandler(grpc.GenericRpcHandler):
+    def __init__(self, handler: grpc.GenericRpcHandler):
+        self._handler = handler
+
+    def service(self, handler_call_details):
+        handler = self._handler.service(handler_call_details)
+        if handler is None:
+            return None
+        return _timed_handler(handler_call_details.method.rsplit("/", 1)[-1], handler)
+
+class _TimedRegistration:
+    """Server facade for the generated add_*_to_server functions.
+
+    gRPC parses requests and serializes responses outside the servicer, so
+    the (de)serializers of every registered method are wrapped to record
+    their time as stages.
+    """
+
+    def __init__(self, server):
+        self._server = server
+
+    def add_generic_rpc_handlers(self, handlers):
+        self._server.add_generic_rpc_handlers(tuple(_TimedGenericHandler(h) for h in handlers))
+
+    def add_registered_method_handlers(self, service_name, handlers):
+        self._server.add_registered_method_handlers(
+            service_name, {method: _timed_handler(method, handler) for method, handler in handlers.items()})
+
+def add_services(server, service, health_servicer):
+    """Register the prediction, reflection and health services and bind PORT.
+
+    Works for both grpc.server and grpc.aio.server.
+    """
+    from grpc_reflection.v1alpha import reflection
+    model_pb2_grpc.add_PredictionServiceServicer_to_server(service, _TimedRegistration(server))
     SERVICE_NAMES = (
         model_pb2.DESCRIPTOR.services_by_name['PredictionService'].full_name,
         reflection.SERVICE_NAME,
     )
     reflection.enable_server_reflection(SERVICE_NAMES, server)
-    server.add_insecure_port(f"[::]:{PORT}")
+    if server.add_insecure_port(f"[::]:{PORT}") == 0:
+        raise RuntimeError(f"Could not bind gRPC port {PORT}")
+    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
 
+def create_server(service: PredictionService) -> tuple[grpc.Server, health_rpc.HealthServicer]:
+    executor = InstrumentedThreadPoolExecutor("grpc", max_workers=MAX_WORKERS)
+    interceptors = ()
+    if service.admission is not None:
+        interceptors = (AdmissionInterceptor(service.admission, lambda: executor.pending, request_rows),)
+    server = grpc.server(executor, interceptors=interceptors, options=SERVER_OPTIONS)
     health_servicer = health_rpc.HealthServicer()
-    health_servicer.set('', health_pb2.HealthCheckResponse.SERVING)
-    health_servicer.set('mlservice.v1.PredictionService',
-                        health_pb2.HealthCheckResponse.SERVING)
+    add_services(server, service, health_servicer)
+    for name in HEALTH_SERVICE_NAMES:
+        health_servicer.set(name, health_pb2.HealthCheckResponse.SERVING)
+    return server, health_servicer
 
-    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
+class AioPredictionService(PredictionService):
+    """grpc.aio flavour of PredictionService.
+
+    One event loop holds all open streams. The CPU-bound handler bodies are
+    shared with the sync servicer and run in a bounded thread pool. Above
+    ``max_inflight`` concurrent requests new calls fail fast with
+    RESOURCE_EXHAUSTED instead of queueing without bound.
+    """
+
+    def __init__(self, registry: ModelRegistry = None, router: TrafficRouter = None, watcher: ModelWatcher = None,
+                 start_metrics: bool = True, inference_threads: int = AIO_INFERENCE_THREADS,
+                 max_inflight: int = AIO_MAX_INFLIGHT):
+        super().__init__(registry, router, watcher, start_metrics=start_metrics, scoring_threads=inference_threads)
+        self.executor = InstrumentedThreadPoolExecutor("inference", max_workers=inference_threads,
+                                                       thread_name_prefix="inference")
+        self.max_inflight = max_inflight
+        # Only touched from the event loop thread, so no lock is needed.
+        self.inflight = 0
+
+    def close(self):
+        super().close()
+        self.executor.shutdown(wait=False)
+
+    async def Health(self, request, context):
+        return super().Health(request, context)
+
+    async def Predict(self, request, context):
+        handler = functools.partial(self._predict, deadline=self._deadline(context))
+        return await self._dispatch(context, "Predict", handler, request, model_pb2.PredictResponse)
+
+    async def PredictBatch(self, request, context):
+        return await self._dispatch(context, "PredictBatch", self._predict_batch, request, model_pb2.PredictBatchResponse)
+
+    async def GetTrafficSplit(self, request, context):
+        return super().GetTrafficSplit(request, context)
+
+    async def SetTrafficSplit(self, request, context):
+        if not self._is_admin(context):
+            await context.abort(grpc.StatusCode.PERMISSION_DENIED, "SetTrafficSplit requires a valid x-admin-token")
+        return self._respond(context, self._invoke("SetTrafficSplit", self._set_traffic_split, request, model_pb2.TrafficSplit))
+
+    async def ReloadModel(self, request, context):
+        if not self._is_admin(context):
+            await context.abort(grpc.StatusCode.PERMISSION_DENIED, "ReloadModel requires a valid x-admin-token")
+        return await self._dispatch(context, "ReloadModel", self._reload_model, request, model_pb2.ReloadModelResponse)
+
+    async def PredictStream(self, request_iterator, context):
+        pending = asyncio.Queue(maxsize=STREAM_WINDOW_SIZE * 4)
+
+        async def read():
+            try:
+                async for request in request_iterator:
+                    await pending.put(request)
+            finally:
+                await pending.put(_STREAM_END)
+
+        reader = asyncio.create_task(read())
+        loop = asyncio.get_running_loop()
+        acked = 0
+        metrics.REQUESTS_IN_FLIGHT.labels(frontend="grpc", method="PredictStream").inc()
+        try:
+            done = False
+            while not done:
+                first = await pending.get()
+                if first is _STREAM_END:
+                    break
+                window, done = await self._collect_window(pending, first)
+                responses = await loop.run_in_executor(self.executor, self._predict_window, window, acked)
+                acked += len(window)
+                for response in responses:
+                    yield response
+        finally:
+            metrics.REQUESTS_IN_FLIGHT.labels(frontend="grpc", method="PredictStream").dec()
+            reader.cancel()
+
+    @staticmethod
+    async def _collect_window(pending: asyncio.Queue, first) -> tuple[list, bool]:
+        """asyncio counterpart of server.batching.collect_window."""
+        window = [first]
+        deadline = asyncio.get_running_loop().time() + STREAM_WINDOW_MS / 1000.0
+        while len(window) < STREAM_WINDOW_SIZE:
+            timeout = deadline - asyncio.get_running_loop().time()
+            try:
+                item = pending.get_nowait() if timeout <= 0 else await asyncio.wait_for(pending.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if item is _STREAM_END:
+                return window, True
+            window.append(item)
+        return window, False
+
+    async def _dispatch(self, context, method: str, handler, request, empty_response):
+        if self.inflight >= self.max_inflight:
+            INFLIGHT_REJECTED_TOTAL.labels(method=method).inc()
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                                f"Too many requests in flight (limit {self.max_inflight})")
+        admission = self.admission if method in ADMITTED_METHODS else None
+        inflight = self.inflight
+        if admission is not None and not admission.admit(method, inflight):
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                                f"Server overloaded (concurrency limit {admission.limit.limit})")
+        self.inflight += 1
+        try:
+            with metrics.in_flight("grpc", method):
+                loop = asyncio.get_running_loop()
+                if admission is None:
+                    outcome = await loop.run_in_executor(self.executor, self._invoke, method, handler, request,
+                                                         empty_response)
+                else:
+                    arrived = time.perf_counter()
+                    remaining = context.time_remaining()
+                    deadline = None if remaining is None else arrived + remaining
+                    outcome = await loop.run_in_executor(self.executor, self._invoke_admitted, admission, method,
+                                                         handler, request, empty_response, inflight, arrived,
+                                                         deadline)
+        finally:
+            self.inflight -= 1
+        return self._respond(context, outcome)
+
+    def _invoke_admitted(self, admission: AdmissionController, method: str, handler, request, empty_response,
+                         inflight: int, arrived: float, deadline: float):
+        outcome, refusal = admission.run(method, request_rows(request), inflight, arrived, deadline,
+                                         lambda: self._invoke(method, handler, request, empty_response))
+        if refusal is not None:
+            return empty_response(), grpc.StatusCode.DEADLINE_EXCEEDED, refusal
+        return outcome
+
+async def serve_aio(registry: ModelRegistry = None, router: TrafficRouter = None, watcher: ModelWatcher = None,
+                    start_metrics: bool = True):
+    service = AioPredictionService(registry, router, watcher, start_metrics=start_metrics)
+    service.warm_up()
+    server = grpc.aio.server(options=SERVER_OPTIONS)
+    health_servicer = health_rpc.aio.HealthServicer()
+    add_services(server, service, health_servicer)
+    for name in HEALTH_SERVICE_NAMES:
+        await health_servicer.set(name, health_pb2.HealthCheckResponse.SERVING)
+
+    def handle_sigterm():
+        logger.info(f"Received SIGTERM. Stopping gRPC aio server (grace {SHUTDOWN_GRACE_S}s)...")
+        asyncio.ensure_future(server.stop(SHUTDOWN_GRACE_S))
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, handle_sigterm)
+
+    await server.start()
+    logger.info(f"gRPC aio server started on :{PORT}, versions={service.registry.versions}, "
+                f"default={service.registry.default_version}, pid={os.getpid()}, max_inflight={service.max_inflight}")
+    try:
+        await server.wait_for_termination()
+    finally:
+        service.close()
+
+def serve(registry: ModelRegistry = None, router: TrafficRouter = None, watcher: ModelWatcher = None,
+          start_metrics: bool = True):
+    if SERVER_MODE == "aio":
+        try:
+            asyncio.run(serve_aio(registry, router, watcher, start_metrics=start_metrics))
+        except KeyboardInterrupt:
+            logger.info("Shutting down gRPC aio server...")
+        return
+
+    service = PredictionService(registry, router, watcher, start_metrics=start_metrics)
+    service.warm_up()
+    server, _ = create_server(service)
+
+    def handle_sigterm(signum, frame):
+        logger.info(f"Received SIGTERM. Stopping gRPC server (grace {SHUTDOWN_GRACE_S}s)...")
+        server.stop(SHUTDOWN_GRACE_S)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
 
     server.start()
-    logger.info(f"gRPC server started on :{PORT}, model={MODEL_PATH}, version={MODEL_VERSION}")
+    logger.info(f"gRPC server started on :{PORT}, versions={service.registry.versions}, "
+                f"default={service.registry.default_version}, pid={os.getpid()}")
     try:
         server.wait_for_termination()
     except KeyboardInterrupt:
         logger.info("Shutting down gRPC server...")
         server.stop(0)
+    finally:
+        service.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ML gRPC prediction service")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="number of server processes sharing the port (default: WORKERS env or 1)")
+    args = parser.parse_args()
+
     try:
         import uvloop
         uvloop.install()
     except Exception:
         pass
-    serve()
+
+    if args.workers > 1 and INFERENCE_PROCESSES > 0:
+        parser.error("INFERENCE_PROCESSES needs a single front-end process; use --workers 1")
+    if args.workers > 1:
+        from server.workers import serve_workers
+        serve_workers(args.workers, load_shared, serve, METRICS_PORT)
+    else:
+        serve()
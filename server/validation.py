@@ -1,9 +1,25 @@
-from typing import Iterable
+from typing import Iterable, Optional
+import numpy as np
 import model_pb2
 
 class ValidationError(Exception):
     pass
 
+class FeatureSchema:
+    """Ordered feature names the model expects, with a name -> column lookup."""
+
+    def __init__(self, names: Iterable[str]):
+        self.names = tuple(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        if len(self.index) != len(self.names):
+            raise ValueError(f"Feature schema has duplicate names: {self.names}")
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __repr__(self) -> str:
+        return f"FeatureSchema({list(self.names)})"
+
 def features_to_dict(features: Iterable[model_pb2.Feature]) -> dict[str, float]:
     data = {}
     for f in features:
@@ -14,4 +30,174 @@ def features_to_dict(features: Iterable[model_pb2.Feature]) -> dict[str, float]:
         data[f.name] = float(f.value)
     if not data:
         raise ValidationError("No features provided")
-    return data
\ No newline at end of file
+    return data
+
+def _fill_row(out: np.ndarray, features: Iterable[model_pb2.Feature], schema: FeatureSchema):
+    index = schema.index
+    seen = bytearray(len(schema))
+    count = 0
+    for f in features:
+        i = index.get(f.name)
+        if i is None:
+            if not f.name:
+                raise ValidationError("Empty feature name")
+            raise ValidationError(f"Unknown feature: {f.name}")
+        if seen[i]:
+            raise ValidationError(f"Duplicate feature: {f.name}")
+        seen[i] = 1
+        out[i] = f.value
+        count += 1
+    if count == 0:
+        raise ValidationError("No features provided")
+    if count < len(schema):
+        missing = [name for name, s in zip(schema.names, seen) if not s]
+        raise ValidationError(f"Missing features: {', '.join(missing)}")
+
+def features_to_row(features: Iterable[model_pb2.Feature], schema: Optional[FeatureSchema]) -> np.ndarray:
+    """Validate features into a float64 row ordered by ``schema``.
+
+    Without a schema the values keep the order the client sent them in.
+    """
+    if schema is None:
+        return np.fromiter(features_to_dict(features).values(), dtype=np.float64)
+    row = np.empty(len(schema), dtype=np.float64)
+    _fill_row(row, features, schema)
+    return row
+
+def rows_to_matrix(rows: Iterable[Iterable[model_pb2.Feature]], schema: Optional[FeatureSchema]) -> np.ndarray:
+    """Validate many rows into one (n_rows, n_features) float64 matrix.
+
+    Without a schema the first row's feature order is used for every row.
+    """
+    rows = list(rows)
+    if not rows:
+        raise ValidationError("No rows provided")
+    if schema is None:
+        schema = FeatureSchema(features_to_dict(rows[0]))
+    X = np.empty((len(rows), len(schema)), dtype=np.float64)
+    for i, features in enumerate(rows):
+        try:
+            _fill_row(X[i], features, schema)
+        except ValidationError as ve:
+            raise ValidationError(f"Row {i}: {ve}") from None
+    return X
+
+def dense_to_matrix(dense: model_pb2.DenseFeatures, schema: Optional[FeatureSchema]) -> np.ndarray:
+    """Decode DenseFeatures into a (num_rows, n_features) float64 matrix in schema order.
+
+    ``raw_values`` is wrapped with ``np.frombuffer`` without copying;
+    packed ``values`` are read with ``np.fromiter``. Without a schema the
+    columns keep the order of ``dense.names``.
+    """
+    names = list(dense.names)
+    if not names:
+        raise ValidationError("Dense features have no names")
+    columns = {}
+    for i, name in enumerate(names):
+        if not name:
+            raise ValidationError("Empty feature name")
+        if name in columns:
+            raise ValidationError(f"Duplicate feature: {name}")
+        columns[name] = i
+
+    n_rows, n_cols = dense.num_rows, len(names)
+    if n_rows == 0:
+        raise ValidationError("Dense features have no rows")
+    expected = n_rows * n_cols
+    if dense.raw_values and len(dense.values):
+        raise ValidationError("Set either values or raw_values, not both")
+    if dense.raw_values:
+        if len(dense.raw_values) != expected * 8:
+            raise ValidationError(f"raw_values holds {len(dense.raw_values)} bytes, expected {expected * 8} "
+                                  f"({n_rows} rows x {n_cols} features x 8)")
+        X = np.frombuffer(dense.raw_values, dtype="<f8").reshape(n_rows, n_cols)
+    else:
+        if len(dense.values) != expected:
+            raise ValidationError(f"values holds {len(dense.values)} numbers, expected {expected} "
+                                  f"({n_rows} rows x {n_cols} features)")
+        X = np.fromiter(dense.values, dtype=np.float64, count=expected).reshape(n_rows, n_cols)
+
+    if schema is None:
+        return X
+    unknown = [name for name in names if name not in schema.index]
+    if unknown:
+        raise ValidationError(f"Unknown feature: {unknown[0]}")
+    missing = [name for name in schema.names if name not in columns]
+    if missing:
+        raise ValidationError(f"Missing features: {', '.join(missing)}")
+    order = [columns[name] for name in schema.names]
+    if order == list(range(n_cols)):
+        return X
+    return X[:, order]
+
+def frame_to_matrix(frame, schema: Optional[FeatureSchema]) -> tuple[np.ndarray, dict[int, str]]:
+    """Validate a pandas DataFrame of feature columns into a float64 matrix in schema order.
+
+    Columns are checked like ``dense_to_matrix``: a missing, unknown or
+    duplicate column raises ValidationError. Cells are checked per row, so
+    one bad row does not fail the others: the second value maps the
+    position of every row with an empty or non-numeric cell to its error,
+    and the matrix holds NaN there. Without a schema the columns keep the
+    frame's order.
+    """
+    # Imported here: online requests never come as a DataFrame
+    import pandas as pd
+
+    names = [str(name) for name in frame.columns]
+    if not names:
+        raise ValidationError("No features provided")
+    seen = set()
+    for name in names:
+        if not name:
+            raise ValidationError("Empty feature name")
+        if name in seen:
+            raise ValidationError(f"Duplicate feature: {name}")
+        seen.add(name)
+    if schema is not None:
+        unknown = [name for name in names if name not in schema.index]
+        if unknown:
+            raise ValidationError(f"Unknown feature: {unknown[0]}")
+        missing = [name for name in schema.names if name not in seen]
+        if missing:
+            raise ValidationError(f"Missing features: {', '.join(missing)}")
+        names = list(schema.names)
+
+    X = np.empty((len(frame), len(names)), dtype=np.float64)
+    empty = np.zeros(X.shape, dtype=bool)
+    columns = {str(name): frame.iloc[:, i] for i, name in enumerate(frame.columns)}
+    for j, name in enumerate(names):
+        values = columns[name]
+        missing = values.isna()
+        if not pd.api.types.is_numeric_dtype(values):
+            missing |= values.astype("string").str.strip().eq("").fillna(False)
+        empty[:, j] = missing.to_numpy(dtype=bool)
+        X[:, j] = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    non_numeric = np.isnan(X) & ~empty
+    errors = {}
+    for i in np.flatnonzero((empty | non_numeric).any(axis=1)):
+        problems = []
+        if empty[i].any():
+            problems.append("Missing features: " + ", ".join(n for n, e in zip(names, empty[i]) if e))
+        if non_numeric[i].any():
+            problems.append("Non-numeric features: " + ", ".join(n for n, e in zip(names, non_numeric[i]) if e))
+        errors[int(i)] = "; ".join(problems)
+    return X, errors
+
+def request_to_row(request: model_pb2.PredictRequest, schema: Optional[FeatureSchema]) -> np.ndarray:
+    """Validate a PredictRequest in either encoding into one schema-ordered row."""
+    if request.HasField("dense"):
+        if len(request.features):
+            raise ValidationError("Set either features or dense, not both")
+        X = dense_to_matrix(request.dense, schema)
+        if len(X) != 1:
+            raise ValidationError(f"Predict takes exactly one row, got {len(X)}. Use PredictBatch for more.")
+        return X[0]
+    return features_to_row(request.features, schema)
+
+def batch_to_matrix(request: model_pb2.PredictBatchRequest, schema: Optional[FeatureSchema]) -> np.ndarray:
+    """Validate a PredictBatchRequest in either encoding into one matrix."""
+    if request.HasField("dense"):
+        if len(request.rows):
+            raise ValidationError("Set either rows or dense, not both")
+        return dense_to_matrix(request.dense, schema)
+    return rows_to_matrix((row.features for row in request.rows), schema)
@@ -0,0 +1,116 @@
+"""
+Multi-process serving: N forked gRPC servers sharing one port via SO_REUSEPORT.
+
+The models are loaded once in the parent before forking, so their pages are
+shared copy-on-write by all workers. Other state meant to be shared, such as
+the traffic split, is created there too. Prometheus metrics are written by every
+worker into PROMETHEUS_MULTIPROC_DIR and aggregated by the parent, which
+serves them on METRICS_PORT. The parent forwards SIGTERM/SIGINT to the
+workers, waits for their graceful stop and restarts workers that crash.
+"""
+
+import gc
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import server.logger as _logger
+
+logger = _logger.service_logger
+
+MULTIPROC_DIR_PREFIX = "ml-service-metrics-"
+RESTART_DELAY_S = 1.0
+
+def ensure_multiproc_dir():
+    """prometheus_client picks its storage backend when it is imported, so
+    PROMETHEUS_MULTIPROC_DIR must be set before the interpreter starts. When it
+    is missing, create a directory and re-execute the same command with it."""
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        os.makedirs(path, exist_ok=True)
+        for stale in Path(path).glob("*.db"):
+            stale.unlink()
+        return path
+    path = tempfile.mkdtemp(prefix=MULTIPROC_DIR_PREFIX)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    logger.info(f"Re-executing with PROMETHEUS_MULTIPROC_DIR={path}")
+    os.execv(sys.executable, [sys.executable] + sys.orig_argv[1:])
+
+def serve_workers(workers: int, load_shared, serve, metrics_port: int):
+    """Run ``workers`` copies of ``serve(**load_shared(), start_metrics=False)`` in forked processes."""
+    multiproc_dir = ensure_multiproc_dir()
+    from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+
+    shared = load_shared()
+    # Keep the loaded models out of the GC's reach so collections in the workers
+    # do not write to (and un-share) its pages.
+    gc.freeze()
+
+    children = {}
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            # Ctrl+C reaches the whole process group; only the parent reacts to it.
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            code = 0
+            try:
+                serve(**shared, start_metrics=False)
+            except Exception as e:
+                logger.error(f"Worker {index} failed: {e}")
+                code = 1
+            finally:
+                # os._exit skips atexit handlers, so flush queued log records here
+                _logger.stop_logging()
+                os._exit(code)
+        children[pid] = index
+        logger.info(f"Started worker {index} (pid {pid})")
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        logger.info(f"Stopping {len(children)} workers...")
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for index in range(workers):
+        spawn(index)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    metrics_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(metrics_registry)
+    start_http_server(metrics_port, registry=metrics_registry)
+    logger.info(f"Serving with {workers} worker processes. "
+                f"Aggregated Prometheus metrics are available on port: {metrics_port}")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None:
+            continue
+        multiprocess.mark_process_dead(pid)
+        if not stopping:
+            logger.warning(f"Worker {index} (pid {pid}) exited with code "
+                           f"{os.waitstatus_to_exitcode(status)}. Restarting.")
+            time.sleep(RESTART_DELAY_S)
+            if not stopping:
+                spawn(index)
+
+    logger.info("All workers stopped")
+    if Path(multiproc_dir).name.startswith(MULTIPROC_DIR_PREFIX):
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
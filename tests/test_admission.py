@@ -0,0 +1,143 @@
+"""Tests of server/admission.py: the gradient concurrency limit and deadline refusals."""
+import pytest
+
+import server.admission
+from server.admission import AdmissionController, GradientLimit
+
+
+class FakeClock:
+    """Stands in for time.perf_counter; ``advance`` moves it forward."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(server.admission.time, "perf_counter", clock)
+    return clock
+
+
+def test_limit_grows_while_latency_is_steady():
+    limit = GradientLimit(initial=20)
+    limits = []
+    for _ in range(50):
+        limit.update(0.01, inflight=limit.limit)
+        limits.append(limit.limit)
+    assert limits == sorted(limits) and limits[-1] > 40
+    # About its square root per sample, smoothed
+    single = GradientLimit(initial=100)
+    single.update(0.01, inflight=100)
+    assert single._limit == pytest.approx(100 + 0.2 * 10)
+
+
+def test_limit_holds_while_less_than_half_is_used():
+    limit = GradientLimit(initial=20)
+    for _ in range(50):
+        limit.update(0.01, inflight=9)
+    assert limit.limit == 20
+
+
+def test_limit_shrinks_when_latency_rises():
+    limit = GradientLimit(initial=100, max_limit=100)
+    for _ in range(100):
+        limit.update(0.01, inflight=100)
+    assert limit.limit == 100
+    limits = []
+    for _ in range(20):
+        limit.update(0.1, inflight=100)
+        limits.append(limit.limit)
+    assert limits == sorted(limits, reverse=True) and limits[-1] < 60
+    # Latency back to normal: the limit recovers
+    for _ in range(200):
+        limit.update(0.01, inflight=limit.limit)
+    assert limit.limit == 100
+
+
+def test_dropped_request_backs_off():
+    limit = GradientLimit(initial=100, backoff=0.9, smoothing=0.2)
+    limit.update(0.01, inflight=0, dropped=True)
+    assert limit._limit == pytest.approx(100 * 0.8 + 100 * 0.9 * 0.2)
+    # Backs off even when latency is steady and little of the limit is used
+    for _ in range(10):
+        limit.update(0.01, inflight=0, dropped=True)
+    assert limit._limit == pytest.approx(100 * 0.98 ** 11)
+
+
+@pytest.mark.parametrize("initial,expected", [(1, 5), (20, 20), (1000, 50)])
+def test_initial_limit_is_clamped(initial, expected):
+    assert GradientLimit(initial=initial, min_limit=5, max_limit=50).limit == expected
+
+
+def test_limit_stays_within_bounds():
+    limit = GradientLimit(initial=20, min_limit=5, max_limit=50)
+    for _ in range(200):
+        limit.update(0.01, inflight=limit.limit, dropped=True)
+    assert limit.limit == 5
+    for _ in range(200):
+        limit.update(0.01, inflight=limit.limit)
+    assert limit.limit == 50
+
+
+def test_admit():
+    admission = AdmissionController(["Predict"], limit=GradientLimit(initial=10))
+    assert admission.admit("Predict", 9)
+    assert not admission.admit("Predict", 10)
+    assert AdmissionController(["Predict"]).admit("Predict", 10_000)
+
+
+def test_run_refuses_an_expired_deadline(clock):
+    limit = GradientLimit(initial=100)
+    admission = AdmissionController(["Predict"], limit=limit)
+    calls = []
+    arrived = clock()
+    clock.advance(0.05)
+    result, refusal = admission.run("Predict", 1, 0, arrived, arrived + 0.01, lambda: calls.append(1))
+    assert result is None and calls == []
+    assert refusal == "Deadline passed before the request could be scored"
+    assert limit._limit == pytest.approx(98.0)
+
+
+def test_run_refuses_a_deadline_too_near_for_the_service_time(clock):
+    limit = GradientLimit(initial=100)
+    admission = AdmissionController(["PredictBatch"], deadline_margin=1.0, limit=limit)
+
+    def score():
+        clock.advance(0.001 * 10)
+        return "scored"
+
+    # 10 rows in 10ms teach 1ms per row
+    assert admission.run("PredictBatch", 10, 0, clock(), None, score) == ("scored", None)
+    result, refusal = admission.run("PredictBatch", 10, 0, clock(), clock() + 0.005, score)
+    assert result is None
+    assert refusal == "5.0ms left, scoring takes about 10.0ms"
+    assert limit._limit == pytest.approx(98.0)
+    # Fewer rows fit into the same deadline
+    assert admission.run("PredictBatch", 4, 0, clock(), clock() + 0.005, score) == ("scored", None)
+
+
+def test_run_without_deadline_check(clock):
+    admission = AdmissionController(["Predict"], deadline_margin=0)
+    arrived = clock()
+    clock.advance(1.0)
+    assert admission.run("Predict", 1, 0, arrived, arrived + 0.5, lambda: "scored") == ("scored", None)
+
+
+def test_run_finishing_after_the_deadline_backs_off(clock):
+    limit = GradientLimit(initial=100)
+    admission = AdmissionController(["Predict"], limit=limit)
+    arrived = clock()
+
+    def slow():
+        clock.advance(0.2)
+        return "scored"
+
+    assert admission.run("Predict", 1, 0, arrived, arrived + 0.1, slow) == ("scored", None)
+    assert limit._limit == pytest.approx(98.0)
@@ -0,0 +1,90 @@
+"""Tests of server/batching.py: MicroBatcher results, failures and deadlines."""
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+import pytest
+
+import server.batching
+from server.batching import MicroBatcher
+
+
+class FakeRunner:
+    """Stands in for ModelRunner: predicts the first feature as the label."""
+
+    version = "test"
+
+    def __init__(self, release: threading.Event = None, error: Exception = None):
+        self.release = release
+        self.error = error
+        self.batches = []
+
+    def predict_rows(self, rows, with_probabilities=False):
+        if self.release is not None:
+            self.release.wait()
+        if self.error is not None:
+            raise self.error
+        self.batches.append(len(rows))
+        return [(str(int(row[0])), 0.9, {"p": 1.0} if with_probabilities else None) for row in rows]
+
+
+@pytest.fixture
+def batcher():
+    batcher = MicroBatcher(max_batch_size=8, max_batch_delay_ms=5)
+    yield batcher
+    if batcher._thread.is_alive():
+        batcher.close()
+
+
+def test_predict_returns_each_rows_result(batcher):
+    runner = FakeRunner()
+    futures = [batcher.submit(runner, np.array([float(i)]), with_probabilities=i % 2 == 0) for i in range(20)]
+    results = [future.result(timeout=5) for future in futures]
+    assert [label for label, _, _ in results] == [str(i) for i in range(20)]
+    assert [probabilities is not None for _, _, probabilities in results] == [i % 2 == 0 for i in range(20)]
+    assert sum(runner.batches) == 20
+
+
+def test_runner_error_fails_the_batch(batcher):
+    future = batcher.submit(FakeRunner(error=ValueError("broken model")), np.array([1.0]))
+    with pytest.raises(ValueError, match="broken model"):
+        future.result(timeout=5)
+    # The thread survives a failing model
+    assert batcher.predict(FakeRunner(), np.array([2.0]))[0] == "2"
+
+
+def test_dead_thread_fails_pending_and_later_rows(batcher, monkeypatch):
+    release = threading.Event()
+    runner = FakeRunner(release)
+    first = batcher.submit(runner, np.array([1.0]))
+    time.sleep(0.05)  # the thread is now scoring ``first``
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("window failed")
+
+    monkeypatch.setattr(server.batching, "collect_window", broken)
+    second = batcher.submit(runner, np.array([2.0]))
+    release.set()
+    assert first.result(timeout=5)[0] == "1"
+    with pytest.raises(RuntimeError, match="window failed"):
+        second.result(timeout=5)
+    batcher._thread.join(timeout=5)
+    with pytest.raises(RuntimeError, match="window failed"):
+        batcher.submit(runner, np.array([3.0])).result(timeout=0)
+
+
+def test_predict_gives_up_at_the_deadline(batcher):
+    release = threading.Event()
+    try:
+        with pytest.raises(FutureTimeoutError):
+            batcher.predict(FakeRunner(release), np.array([1.0]), deadline=time.perf_counter() + 0.05)
+    finally:
+        release.set()
+
+
+def test_submit_after_close_fails():
+    batcher = MicroBatcher()
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit(FakeRunner(), np.array([1.0])).result(timeout=0)
@@ -0,0 +1,93 @@
+"""Tests of server/bulk.py: a stopped run resumed later writes the same output as an uninterrupted one."""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import server.bulk
+from server.bulk import score_file
+
+MODEL = "models/model.pkl"
+FEATURES = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
+ROWS, CHUNK_ROWS = 1000, 100
+
+
+@pytest.fixture
+def input_csv(tmp_path) -> str:
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame(rng.uniform(0.1, 7.9, (ROWS, len(FEATURES))).round(2), columns=FEATURES)
+    frame = frame.astype(object)
+    frame.loc[17, "sepal_width"] = ""
+    frame.loc[450, "petal_length"] = "n/a"
+    frame.insert(0, "id", [f"{i:05d}" for i in range(ROWS)])
+    path = tmp_path / "input.csv"
+    frame.to_csv(path, index=False)
+    return str(path)
+
+
+def stop_after(monkeypatch, stop: threading.Event, rows: int):
+    """Set ``stop`` once ``rows`` rows are committed, as a SIGTERM arriving mid-run would."""
+    commit = server.bulk.Progress.commit
+
+    def committing(self, **state):
+        commit(self, **state)
+        if self.state["rows"] >= rows:
+            stop.set()
+
+    monkeypatch.setattr(server.bulk.Progress, "commit", committing)
+
+
+def read_output(path: str) -> pd.DataFrame:
+    if os.path.isdir(path):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, dtype={"id": str}, keep_default_na=False)
+
+
+@pytest.mark.parametrize("output,workers", [("out.csv", 0), ("out.parquet", 0), ("out.csv", 1)],
+                         ids=["csv", "parquet", "csv_process_pool"])
+def test_stopped_run_resumes_to_the_same_output(input_csv, tmp_path, monkeypatch, output, workers):
+    options = dict(keep=["id"], chunk_rows=CHUNK_ROWS, probabilities=True, workers=workers)
+    expected_path = str(tmp_path / f"expected-{output}")
+    expected = score_file(input_csv, expected_path, MODEL, **options)
+    assert expected["complete"] and expected["rows"] == ROWS and expected["errors"] == 2
+
+    path = str(tmp_path / output)
+    stop = threading.Event()
+    with monkeypatch.context() as patch:
+        stop_after(patch, stop, 3 * CHUNK_ROWS)
+        stopped = score_file(input_csv, path, MODEL, stop=stop, **options)
+    assert not stopped["complete"] and 3 * CHUNK_ROWS <= stopped["rows"] < ROWS
+
+    resumed = score_file(input_csv, path, MODEL, **options)
+    assert resumed["complete"] and resumed["rows"] == ROWS and resumed["errors"] == 2
+    if os.path.isdir(path):
+        assert sorted(os.listdir(path)) == sorted(os.listdir(expected_path))
+    else:
+        with open(path, "rb") as f, open(expected_path, "rb") as g:
+            assert f.read() == g.read()
+
+    result = read_output(path)
+    pd.testing.assert_frame_equal(result, read_output(expected_path))
+    assert result["id"].tolist() == [f"{i:05d}" for i in range(ROWS)]
+    assert result.loc[17, "error"] == "Missing features: sepal_width"
+    assert result.loc[450, "error"] == "Non-numeric features: petal_length"
+    assert result.loc[[17, 450], "prediction"].tolist() == ["", ""]
+
+
+def test_finished_run_is_not_scored_again(input_csv, tmp_path):
+    path = str(tmp_path / "out.csv")
+    first = score_file(input_csv, path, MODEL, keep=["id"], chunk_rows=CHUNK_ROWS, workers=0)
+    mtime = os.stat(path).st_mtime_ns
+    assert score_file(input_csv, path, MODEL, keep=["id"], chunk_rows=CHUNK_ROWS, workers=0) == first
+    assert os.stat(path).st_mtime_ns == mtime
+
+
+def test_output_of_another_run_is_not_resumed(input_csv, tmp_path):
+    path = str(tmp_path / "out.csv")
+    stop = threading.Event()
+    stop.set()
+    score_file(input_csv, path, MODEL, keep=["id"], chunk_rows=CHUNK_ROWS, workers=0, stop=stop)
+    with pytest.raises(ValueError, match="different run"):
+        score_file(input_csv, path, MODEL, keep=["id"], chunk_rows=CHUNK_ROWS, workers=0, probabilities=True)
@@ -0,0 +1,199 @@
+"""Tests of canary_controller.py: the statistics, single decisions and whole rollouts on synthetic metrics."""
+import numpy as np
+import pytest
+from scipy import stats
+
+from canary_controller import (ADVANCE, HOLD, ROLLBACK, CanaryController, Snapshot, Thresholds, analyze,
+                               binomial_upper_tail, error_rate_test, histogram_quantile, mann_whitney_binned)
+from server.metrics import LATENCY_BUCKETS
+
+BASELINE, CANARY = "v1.0.0", "v2.0.0"
+
+
+class FakeMetricsSource:
+    """Synthetic traffic for two versions with log-normal latencies, on a virtual clock.
+
+    ``advance(seconds)`` generates ``rate * seconds`` requests split by the
+    canary weight set through ``apply``; ``canary_slowdown`` multiplies
+    canary latencies, ``canary_error_rate`` and ``canary_drop_rate`` make
+    canary requests fail or never reach it.
+    """
+
+    def __init__(self, baseline: str, canary: str, rate: float = 50.0, median_s: float = 0.004, sigma: float = 0.5,
+                 error_rate: float = 0.001, canary_slowdown: float = 1.0, canary_error_rate: float = None,
+                 canary_drop_rate: float = 0.0, seed: int = 0):
+        self.versions = (baseline, canary)
+        self.rate = rate
+        self.median_s = median_s
+        self.sigma = sigma
+        self.error_rate = {baseline: error_rate,
+                           canary: error_rate if canary_error_rate is None else canary_error_rate}
+        self.slowdown = {baseline: 1.0, canary: canary_slowdown}
+        self.canary_drop_rate = canary_drop_rate
+        self.canary_weight = 0.0
+        self.weights = []
+        self.now = 0.0
+        self.bounds = tuple(LATENCY_BUCKETS) + (float("inf"),)
+        self._counts = {v: np.zeros(len(self.bounds)) for v in self.versions}
+        self._errors = {v: 0.0 for v in self.versions}
+        self._rng = np.random.default_rng(seed)
+
+    def apply(self, canary_weight: float):
+        self.canary_weight = canary_weight
+        self.weights.append(canary_weight)
+
+    def advance(self, seconds: float):
+        self.now += seconds
+        n = self._rng.poisson(self.rate * seconds)
+        n_canary = self._rng.binomial(n, self.canary_weight / 100.0)
+        n_canary = self._rng.binomial(n_canary, 1.0 - self.canary_drop_rate)
+        for version, count in zip(self.versions, (n - n_canary, n_canary)):
+            latencies = self.median_s * self.slowdown[version] * self._rng.lognormal(0.0, self.sigma, count)
+            self._counts[version] += np.bincount(np.searchsorted(self.bounds, latencies), minlength=len(self.bounds))
+            self._errors[version] += self._rng.binomial(count, self.error_rate[version])
+
+    def snapshot(self, version: str) -> Snapshot:
+        return Snapshot(self.bounds, np.cumsum(self._counts[version]), self._errors[version])
+
+
+def rollout(rate: float = 50.0, seed: int = 0, **kwargs):
+    """Run the controller with its default stages and timings; returns (outcome, weight, source)."""
+    source = FakeMetricsSource(BASELINE, CANARY, rate=rate, seed=seed, **kwargs)
+    controller = CanaryController(source, source.apply, BASELINE, CANARY, sleep=source.advance,
+                                  clock=lambda: source.now)
+    outcome, weight = controller.run()
+    return outcome, weight, source
+
+
+def snapshot(counts, errors: float = 0.0) -> Snapshot:
+    bounds = tuple(LATENCY_BUCKETS[:len(counts) - 1]) + (float("inf"),)
+    return Snapshot(bounds, np.cumsum(np.asarray(counts, dtype=float)), errors)
+
+
+def expand(counts) -> np.ndarray:
+    """One value per observation, the bucket index: values in one bucket are ties."""
+    return np.repeat(np.arange(len(counts)), counts)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_mann_whitney_binned_matches_scipy(seed):
+    rng = np.random.default_rng(seed)
+    baseline = rng.integers(0, 50, 8)
+    canary = rng.integers(0, 50, 8)
+    p_value, slower = mann_whitney_binned(baseline.astype(float), canary.astype(float))
+    expected = stats.mannwhitneyu(expand(canary), expand(baseline), alternative="greater", use_continuity=False,
+                                  method="asymptotic")
+    assert p_value == pytest.approx(expected.pvalue, rel=1e-9)
+    assert slower == pytest.approx(expected.statistic / (canary.sum() * baseline.sum()))
+
+
+def test_mann_whitney_binned_direction():
+    baseline = np.array([10.0, 60, 30, 0])
+    assert mann_whitney_binned(baseline, baseline) == pytest.approx((0.5, 0.5))
+    p_slower, slower = mann_whitney_binned(baseline, np.array([0.0, 30, 60, 10]))
+    p_faster, faster = mann_whitney_binned(baseline, np.array([40.0, 50, 10, 0]))
+    assert p_slower < 0.001 and slower > 0.5
+    assert p_faster > 0.999 and faster < 0.5
+
+
+def test_mann_whitney_binned_degenerate():
+    assert mann_whitney_binned(np.zeros(3), np.array([1.0, 2, 3])) == (1.0, 0.5)
+    # Everything in one bucket: no evidence either way
+    assert mann_whitney_binned(np.array([0.0, 5, 0]), np.array([0.0, 7, 0])) == (1.0, 0.5)
+
+
+@pytest.mark.parametrize("k,n,p", [(0, 10, 0.3), (3, 10, 0.3), (10, 10, 0.3), (4, 14, 0.09), (40, 2000, 0.01)])
+def test_binomial_upper_tail_matches_scipy(k, n, p):
+    assert binomial_upper_tail(k, n, p) == pytest.approx(stats.binom.sf(k - 1, n, p), rel=1e-9)
+
+
+def test_binomial_upper_tail_edges():
+    assert binomial_upper_tail(1, 10, 0.0) == 0.0
+    assert binomial_upper_tail(1, 10, 1.0) == 1.0
+
+
+def test_error_rate_test():
+    # Same rates, or no traffic: nothing to report
+    assert error_rate_test(10, 10000, 10, 10000) > 0.5
+    assert error_rate_test(0, 0, 5, 100) == 1.0
+    # 1% against 0.1% of the same traffic
+    assert error_rate_test(10, 10000, 100, 10000) < 1e-15
+    # A canary with a lower error rate is never flagged
+    assert error_rate_test(100, 10000, 10, 10000) > 0.999
+
+
+def test_histogram_quantile():
+    bounds = (0.1, 0.2, 0.4, float("inf"))
+    cumulative = np.array([0.0, 50, 100, 100])
+    assert histogram_quantile(0.5, bounds, cumulative) == pytest.approx(0.2)
+    assert histogram_quantile(0.75, bounds, cumulative) == pytest.approx(0.3)
+    assert histogram_quantile(0.5, bounds, np.array([0.0, 0, 0, 10])) == 0.4
+    assert np.isnan(histogram_quantile(0.5, bounds, np.zeros(4)))
+
+
+def test_snapshot_since_restarts_after_counter_reset():
+    start = snapshot([10, 20, 0], errors=2)
+    later = snapshot([15, 30, 5], errors=3)
+    window = later.since(start)
+    assert list(window.buckets) == [5, 15, 20] and window.errors == 1
+    restarted = snapshot([1, 1, 0])
+    assert restarted.since(start) is restarted
+
+
+def test_analyze_holds_until_enough_requests():
+    verdict = analyze(snapshot([100, 300, 100, 0]), snapshot([10, 30, 10, 0]), 10, Thresholds())
+    assert verdict.decision == HOLD
+
+
+def test_analyze_advances_a_matching_canary():
+    verdict = analyze(snapshot([1000, 3000, 1000, 0], errors=5), snapshot([1000, 3000, 1000, 0], errors=5), 50,
+                      Thresholds())
+    assert verdict.decision == ADVANCE and verdict.reasons == []
+
+
+def test_analyze_rolls_back_a_slower_canary():
+    verdict = analyze(snapshot([1000, 3000, 1000, 0, 0]), snapshot([0, 1000, 3000, 1000, 0]), 50, Thresholds())
+    assert verdict.decision == ROLLBACK
+    assert any("p50" in reason for reason in verdict.reasons)
+
+
+def test_analyze_holds_an_insignificant_error_increase():
+    # 0.8% against 0.2% is above the tolerance, but 4 errors are not conclusive (p ~ 0.03)
+    verdict = analyze(snapshot([1000, 3000, 1000, 0], errors=10), snapshot([100, 300, 100, 0], errors=4), 9.1,
+                      Thresholds())
+    assert verdict.decision == HOLD
+    assert verdict.stats["errors_p_value"] == pytest.approx(binomial_upper_tail(4, 14, 500 / 5500))
+
+
+def test_analyze_rolls_back_a_starved_canary():
+    verdict = analyze(snapshot([1000, 3000, 1000, 0]), snapshot([100, 300, 100, 0]), 50, Thresholds())
+    assert verdict.decision == ROLLBACK
+    assert any("served" in reason for reason in verdict.reasons)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_healthy_canary_is_promoted(seed):
+    outcome, weight, source = rollout(seed=seed)
+    assert (outcome, weight) == ("promoted", 100)
+    assert source.weights == [10, 50, 90, 100]
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("kwargs", [
+    {"canary_slowdown": 2.0},
+    {"canary_slowdown": 1.3},
+    {"canary_error_rate": 0.02},
+    {"canary_drop_rate": 0.5},
+], ids=["2x_slower", "1.3x_slower", "errors", "starved"])
+def test_degraded_canary_is_rolled_back(kwargs, seed):
+    outcome, weight, source = rollout(seed=seed, **kwargs)
+    assert outcome == "rolled_back"
+    assert 100 not in source.weights
+    assert source.weights[-1] == 0
+
+
+def test_slow_canary_never_reaches_full_traffic_at_low_rate():
+    # Too little traffic for significance: held stages time out instead of advancing
+    outcome, weight, source = rollout(rate=0.5, canary_slowdown=2.0)
+    assert outcome == "rolled_back" and weight == 10
+    assert source.now >= 1800
@@ -0,0 +1,47 @@
+"""Tests of server/capture.py: the buffer bound and drop accounting under concurrent requests."""
+import threading
+
+import numpy as np
+import pyarrow.parquet as pq
+from prometheus_client import REGISTRY
+
+from server.capture import CaptureSink
+
+NAMES = ("a", "b")
+
+
+def dropped() -> float:
+    return REGISTRY.get_sample_value("capture_rows_dropped_total", {"reason": "buffer_full"}) or 0.0
+
+
+def test_buffer_never_exceeds_its_bound(tmp_path, monkeypatch):
+    # A writer that never flushes: everything past buffer_rows must be dropped and counted
+    monkeypatch.setattr(CaptureSink, "_flush", lambda self: None)
+    sink = CaptureSink(str(tmp_path), buffer_rows=1000)
+    before = dropped()
+    threads, calls, rows = 8, 200, 3
+    start = threading.Barrier(threads)
+
+    def send():
+        start.wait()
+        for _ in range(calls):
+            sink.capture("v1", NAMES, np.ones((rows, 2)), None, ["x"] * rows, [0.5] * rows)
+
+    workers = [threading.Thread(target=send) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    sink.close()
+    assert len(sink._buffer) == 1000
+    assert dropped() - before == threads * calls * rows - 1000
+
+
+def test_rows_are_written(tmp_path):
+    sink = CaptureSink(str(tmp_path), flush_interval_s=0.05)
+    sink.capture("v1", NAMES, [np.array([1.0, 2.0]), np.array([3.0, 4.0])], ["r1", "r2"], ["x", "y"], [0.9, 0.8])
+    sink.close()
+    [path] = tmp_path.glob("capture-*.parquet")
+    table = pq.read_table(path).to_pydict()
+    assert table["request_id"] == ["r1", "r2"] and table["prediction"] == ["x", "y"]
+    assert table["a"] == [1.0, 3.0] and table["b"] == [2.0, 4.0]
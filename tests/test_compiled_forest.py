@@ -0,0 +1,102 @@
+"""Tests of server/inference.py: the compiled forest backend against sklearn for both model artifacts."""
+import warnings
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.datasets import load_iris
+from sklearn.ensemble import RandomForestClassifier
+
+from server.inference import CompiledForest, ModelRunner
+
+MODELS = ["models/model.pkl", "models/model_v2.pkl"]
+VECTORIZED = CompiledForest.VECTORIZED_MAX_ROWS
+
+
+@pytest.fixture(scope="module", params=MODELS)
+def model(request):
+    return joblib.load(request.param)
+
+
+def rows(model, n: int, seed: int = 0) -> np.ndarray:
+    """Iris rows, random rows around them and rows sitting exactly on split thresholds."""
+    X, _ = load_iris(return_X_y=True)
+    rng = np.random.default_rng(seed)
+    random = rng.uniform(X.min(axis=0) - 1, X.max(axis=0) + 1, size=(n, X.shape[1]))
+    splits = [tree.tree_ for tree in model.estimators_]
+    on_threshold = X[rng.integers(0, len(X), n)].copy()
+    for row in on_threshold:
+        tree = splits[rng.integers(len(splits))]
+        node = rng.choice(np.flatnonzero(tree.children_left != -1))
+        row[tree.feature[node]] = tree.threshold[node]
+    return np.concatenate([X, random, on_threshold])[rng.permutation(len(X) + 2 * n)][:n]
+
+
+def assert_matches_sklearn(model, engine, X):
+    labels, confidences = engine.predict(X)
+    proba = engine.predict_proba(X)
+    assert np.array_equal(labels, model.predict(X))
+    np.testing.assert_allclose(proba, model.predict_proba(X), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(confidences, proba.max(axis=1), rtol=0, atol=0)
+
+
+@pytest.mark.parametrize("n", [1, 7, VECTORIZED, VECTORIZED + 1, 1000])
+def test_in_memory_matches_sklearn(model, n):
+    assert_matches_sklearn(model, CompiledForest(model), rows(model, n))
+
+
+@pytest.mark.parametrize("n", [1, 7, VECTORIZED, VECTORIZED + 1, 1000])
+def test_memory_mapped_matches_sklearn(model, n, tmp_path):
+    path = tmp_path / "model.forest"
+    CompiledForest(model).save(str(path))
+    loaded = CompiledForest.load(str(path))
+    assert loaded.trees is None and not loaded.value.flags.writeable
+    assert loaded.n_trees == len(model.estimators_)
+    assert np.array_equal(loaded.classes_, model.classes_)
+    assert_matches_sklearn(model, loaded, rows(model, n))
+
+
+def test_both_strategies_match_sklearn(model, monkeypatch):
+    engine = CompiledForest(model)
+    X = rows(model, 3 * VECTORIZED)
+    expected = model.predict_proba(X)
+    X32 = np.ascontiguousarray(X, dtype=np.float32)
+    np.testing.assert_allclose(engine._traverse(X32[:VECTORIZED]), expected[:VECTORIZED], rtol=0, atol=1e-12)
+    np.testing.assert_allclose(engine._traverse(X32), expected, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(engine._apply(X32), expected, rtol=0, atol=1e-12)
+
+    # predict_proba picks the traversal up to VECTORIZED_MAX_ROWS rows and apply above
+    used = []
+    for name in ("_traverse", "_apply"):
+        original = getattr(engine, name)
+        monkeypatch.setattr(engine, name, lambda X, name=name, original=original: used.append(name) or original(X))
+    engine.predict_proba(X[:VECTORIZED])
+    engine.predict_proba(X[:VECTORIZED + 1])
+    assert used == ["_traverse", "_apply"]
+
+
+def test_missing_values(model, tmp_path):
+    X = rows(model, 4)
+    X[1, 2] = np.nan
+    # In memory the sklearn model handles NaN; a memory-mapped forest has no model to fall back on
+    np.testing.assert_allclose(CompiledForest(model).predict_proba(X), model.predict_proba(X), rtol=0, atol=1e-12)
+    CompiledForest(model).save(str(tmp_path / "model.forest"))
+    with pytest.raises(ValueError, match="NaN"):
+        CompiledForest.load(str(tmp_path / "model.forest")).predict_proba(X)
+
+
+@pytest.mark.parametrize("backend", ["sklearn", "compiled"])
+def test_model_fitted_on_a_dataframe_scores_arrays_without_warnings(backend, tmp_path):
+    X, y = load_iris(return_X_y=True, as_frame=True)
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    joblib.dump(model, tmp_path / "model.pkl")
+    runner = ModelRunner(str(tmp_path / "model.pkl"), backend=backend)
+    assert runner.schema.names == tuple(X.columns)
+    X_nan = X.to_numpy()[:3].copy()
+    X_nan[0, 0] = np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        labels, _, proba = runner.score(X.to_numpy())
+        runner.score(X_nan)
+    assert np.array_equal(labels, model.predict(X))
+    np.testing.assert_allclose(proba, model.predict_proba(X), rtol=0, atol=1e-12)
@@ -0,0 +1,80 @@
+"""Tests of client/predictor.py: predict_many against a server that sheds some calls."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+import pytest
+
+import model_pb2
+import model_pb2_grpc
+from client.predictor import AsyncPredictionClient, PredictionClient
+
+
+class SheddingServicer(model_pb2_grpc.PredictionServiceServicer):
+    """Predicts the first feature; refuses rows whose first feature is negative like an overloaded server."""
+
+    def Predict(self, request, context):
+        value = request.features[0].value
+        if value < 0:
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Server overloaded (concurrency limit 1)")
+        if value == 999:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Bad row")
+        return model_pb2.PredictResponse(prediction=str(value))
+
+    def PredictBatch(self, request, context):
+        values = memoryview(request.dense.raw_values).cast("d")
+        rows = [values[i * len(request.dense.names)] for i in range(request.dense.num_rows)]
+        if rows[0] < 0:
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Server overloaded (concurrency limit 1)")
+        return model_pb2.PredictBatchResponse(predictions=[model_pb2.PredictResponse(prediction=str(v)) for v in rows])
+
+
+@pytest.fixture(scope="module")
+def target():
+    server = grpc.server(ThreadPoolExecutor(max_workers=4))
+    model_pb2_grpc.add_PredictionServiceServicer_to_server(SheddingServicer(), server)
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    yield f"localhost:{port}"
+    server.stop(None)
+
+
+ROWS = [[float(i) if i % 3 else -float(i) - 1, 0.0, 0.0, 0.0] for i in range(12)]
+
+
+def expected(rows, batch_size=1):
+    """Per row: its prediction, or None where the call holding it was shed."""
+    shed = set()
+    for start in range(0, len(rows), batch_size):
+        if rows[start][0] < 0:
+            shed.update(range(start, min(start + batch_size, len(rows))))
+    return [None if i in shed else str(row[0]) for i, row in enumerate(rows)]
+
+
+def outcome(responses):
+    return [None if r.error else r.prediction for r in responses]
+
+
+@pytest.mark.parametrize("batch_size", [0, 4])
+def test_predict_many_returns_shed_rows_as_errors(target, batch_size):
+    with PredictionClient(target, pool_size=1) as client:
+        responses = client.predict_many(ROWS, max_inflight=4, batch_size=batch_size)
+    assert outcome(responses) == expected(ROWS, max(batch_size, 1))
+    errors = [r.error for r in responses if r.error]
+    assert errors and set(errors) == {"RESOURCE_EXHAUSTED: Server overloaded (concurrency limit 1)"}
+
+
+def test_predict_many_raises_other_errors(target):
+    with PredictionClient(target, pool_size=1) as client:
+        with pytest.raises(grpc.RpcError) as info:
+            client.predict_many([[1.0, 0, 0, 0], [999.0, 0, 0, 0]])
+    assert info.value.code() == grpc.StatusCode.INVALID_ARGUMENT
+
+
+@pytest.mark.parametrize("batch_size", [0, 4])
+def test_async_predict_many_returns_shed_rows_as_errors(target, batch_size):
+    async def run():
+        async with AsyncPredictionClient(target, pool_size=1) as client:
+            return await client.predict_many(ROWS, max_inflight=4, batch_size=batch_size)
+
+    assert outcome(asyncio.run(run())) == expected(ROWS, max(batch_size, 1))
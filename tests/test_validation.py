@@ -0,0 +1,174 @@
+"""Tests of server/validation.py: request features, dense blocks and DataFrames to schema-ordered matrices."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import model_pb2
+from server.validation import (FeatureSchema, ValidationError, batch_to_matrix, dense_to_matrix, features_to_row,
+                               frame_to_matrix, request_to_row, rows_to_matrix)
+
+SCHEMA = FeatureSchema(["a", "b", "c"])
+
+
+def features(**values) -> list:
+    return [model_pb2.Feature(name=name, value=value) for name, value in values.items()]
+
+
+def named(*pairs) -> list:
+    """Features from (name, value) pairs, for names that are not Python identifiers or repeat."""
+    return [model_pb2.Feature(name=name, value=value) for name, value in pairs]
+
+
+def test_features_to_row_orders_by_schema():
+    row = features_to_row(features(c=3.0, a=1.0, b=2.0), SCHEMA)
+    assert row.tolist() == [1.0, 2.0, 3.0]
+
+
+def test_features_to_row_without_schema_keeps_request_order():
+    assert features_to_row(features(c=3.0, a=1.0), None).tolist() == [3.0, 1.0]
+
+
+@pytest.mark.parametrize("row,schema,message", [
+    (named(("a", 1), ("b", 2), ("c", 3), ("d", 4)), SCHEMA, "Unknown feature: d"),
+    (named(("a", 1), ("a", 2), ("b", 2), ("c", 3)), SCHEMA, "Duplicate feature: a"),
+    (named(("a", 1)), SCHEMA, "Missing features: b, c"),
+    (named(("", 1), ("a", 1)), SCHEMA, "Empty feature name"),
+    ([], SCHEMA, "No features provided"),
+    (named(("a", 1), ("a", 2)), None, "Duplicate feature: a"),
+    (named(("", 1)), None, "Empty feature name"),
+    ([], None, "No features provided"),
+], ids=["unknown", "duplicate", "missing", "empty_name", "no_features", "duplicate_no_schema",
+        "empty_name_no_schema", "no_features_no_schema"])
+def test_features_to_row_rejects(row, schema, message):
+    with pytest.raises(ValidationError, match=f"^{message}$"):
+        features_to_row(row, schema)
+
+
+def test_rows_to_matrix():
+    X = rows_to_matrix([features(b=2.0, a=1.0, c=3.0), features(a=4.0, b=5.0, c=6.0)], SCHEMA)
+    assert X.tolist() == [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]
+    # Without a schema every row follows the first row's order
+    X = rows_to_matrix([features(b=2.0, a=1.0), features(a=4.0, b=5.0)], None)
+    assert X.tolist() == [[2.0, 1.0], [5.0, 4.0]]
+
+
+@pytest.mark.parametrize("rows,schema,message", [
+    ([features(a=1, b=2, c=3), named(("a", 1), ("b", 2), ("c", 3), ("d", 4))], SCHEMA, "Row 1: Unknown feature: d"),
+    ([named(("a", 1), ("b", 2), ("b", 3), ("c", 4))], SCHEMA, "Row 0: Duplicate feature: b"),
+    ([features(a=1, b=2, c=3), features(a=1)], SCHEMA, "Row 1: Missing features: b, c"),
+    ([named(("", 1), ("a", 1))], SCHEMA, "Row 0: Empty feature name"),
+    ([features(a=1, b=2), features(a=1)], None, "Row 1: Missing features: b"),
+    ([features(a=1), features(b=1)], None, "Row 1: Unknown feature: b"),
+    ([], SCHEMA, "No rows provided"),
+], ids=["unknown", "duplicate", "missing", "empty_name", "missing_no_schema", "unknown_no_schema", "no_rows"])
+def test_rows_to_matrix_rejects(rows, schema, message):
+    with pytest.raises(ValidationError, match=f"^{message}$"):
+        rows_to_matrix(rows, schema)
+
+
+def test_request_to_row_reads_features():
+    request = model_pb2.PredictRequest(features=features(b=2.0, c=3.0, a=1.0))
+    assert request_to_row(request, SCHEMA).tolist() == [1.0, 2.0, 3.0]
+    assert isinstance(request_to_row(request, SCHEMA), np.ndarray)
+
+
+def dense(names, rows, raw=True) -> model_pb2.DenseFeatures:
+    values = np.asarray(rows, dtype=np.float64).reshape(-1)
+    if raw:
+        return model_pb2.DenseFeatures(names=names, num_rows=len(rows), raw_values=values.astype("<f8").tobytes())
+    return model_pb2.DenseFeatures(names=names, num_rows=len(rows), values=values)
+
+
+@pytest.mark.parametrize("raw", [True, False], ids=["raw_values", "values"])
+def test_dense_to_matrix_reorders_columns_into_schema_order(raw):
+    X = dense_to_matrix(dense(["c", "a", "b"], [[3.0, 1.0, 2.0], [6.0, 4.0, 5.0]], raw), SCHEMA)
+    assert X.tolist() == [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]
+    # Without a schema the columns keep the order of the names
+    X = dense_to_matrix(dense(["c", "a"], [[3.0, 1.0]], raw), None)
+    assert X.tolist() == [[3.0, 1.0]]
+
+
+def test_dense_to_matrix_does_not_copy_raw_values_in_schema_order():
+    X = dense_to_matrix(dense(["a", "b", "c"], [[1.0, 2.0, 3.0]]), SCHEMA)
+    assert not X.flags.owndata and not X.flags.writeable
+
+
+@pytest.mark.parametrize("block,message", [
+    (dense(["a", "b", "c", "d"], [[1, 2, 3, 4]]), "Unknown feature: d"),
+    (dense(["a", "b", "a"], [[1, 2, 3]]), "Duplicate feature: a"),
+    (dense(["a"], [[1]]), "Missing features: b, c"),
+    (dense(["a", "", "c"], [[1, 2, 3]]), "Empty feature name"),
+    (model_pb2.DenseFeatures(num_rows=1), "Dense features have no names"),
+    (model_pb2.DenseFeatures(names=["a", "b", "c"]), "Dense features have no rows"),
+    (model_pb2.DenseFeatures(names=["a", "b", "c"], num_rows=2, raw_values=bytes(40)),
+     r"raw_values holds 40 bytes, expected 48 \(2 rows x 3 features x 8\)"),
+    (model_pb2.DenseFeatures(names=["a", "b", "c"], num_rows=1, raw_values=bytes(24), values=[1, 2, 3]),
+     "Set either values or raw_values, not both"),
+    (model_pb2.DenseFeatures(names=["a", "b", "c"], num_rows=2, values=[1, 2, 3]),
+     r"values holds 3 numbers, expected 6 \(2 rows x 3 features\)"),
+], ids=["unknown", "duplicate", "missing", "empty_name", "no_names", "no_rows", "raw_values_length", "both_encodings",
+        "values_length"])
+def test_dense_to_matrix_rejects(block, message):
+    with pytest.raises(ValidationError, match=f"^{message}$"):
+        dense_to_matrix(block, SCHEMA)
+
+
+def test_batch_to_matrix_reads_either_encoding():
+    rows = model_pb2.PredictBatchRequest(rows=[model_pb2.PredictRequest(features=features(c=3.0, a=1.0, b=2.0))])
+    block = model_pb2.PredictBatchRequest(dense=dense(["c", "a", "b"], [[3.0, 1.0, 2.0]]))
+    assert batch_to_matrix(rows, SCHEMA).tolist() == batch_to_matrix(block, SCHEMA).tolist() == [[1.0, 2.0, 3.0]]
+
+
+def test_batch_to_matrix_rejects_both_encodings():
+    request = model_pb2.PredictBatchRequest(rows=[model_pb2.PredictRequest(features=features(a=1, b=2, c=3))],
+                                            dense=dense(["a", "b", "c"], [[1, 2, 3]]))
+    with pytest.raises(ValidationError, match="^Set either rows or dense, not both$"):
+        batch_to_matrix(request, SCHEMA)
+
+
+def test_request_to_row_takes_one_dense_row():
+    request = model_pb2.PredictRequest(dense=dense(["b", "a", "c"], [[2.0, 1.0, 3.0]]))
+    assert request_to_row(request, SCHEMA).tolist() == [1.0, 2.0, 3.0]
+    with pytest.raises(ValidationError, match="^Predict takes exactly one row, got 2"):
+        request_to_row(model_pb2.PredictRequest(dense=dense(["a", "b", "c"], [[1, 2, 3], [4, 5, 6]])), SCHEMA)
+    with pytest.raises(ValidationError, match="^Set either features or dense, not both$"):
+        request_to_row(model_pb2.PredictRequest(features=features(a=1, b=2, c=3),
+                                                dense=dense(["a", "b", "c"], [[1, 2, 3]])), SCHEMA)
+
+
+def test_frame_to_matrix_reorders_columns_into_schema_order():
+    frame = pd.DataFrame({"c": [3.0, 6.0], "a": [1.0, 4.0], "b": [2.0, 5.0]})
+    X, errors = frame_to_matrix(frame, SCHEMA)
+    assert X.tolist() == [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]] and errors == {}
+    X, errors = frame_to_matrix(frame[["c", "a"]], None)
+    assert X.tolist() == [[3.0, 1.0], [6.0, 4.0]] and errors == {}
+
+
+def test_frame_to_matrix_reports_bad_cells_per_row():
+    # As read from CSV with keep_default_na=False, na_values=[""]: text columns hold strings or NaN
+    frame = pd.DataFrame({
+        "a": ["1", None, "x", "  ", "4"],
+        "b": [2.0, 2.0, 2.0, np.nan, 5.0],
+        "c": ["3", "3", "3", "abc", "6e0"],
+    })
+    X, errors = frame_to_matrix(frame, SCHEMA)
+    assert errors == {
+        1: "Missing features: a",
+        2: "Non-numeric features: a",
+        3: "Missing features: a, b; Non-numeric features: c",
+    }
+    assert X[0].tolist() == [1.0, 2.0, 3.0] and X[4].tolist() == [4.0, 5.0, 6.0]
+    assert np.isnan(X[1, 0]) and np.isnan(X[2, 0]) and np.isnan(X[3]).all()
+
+
+@pytest.mark.parametrize("columns,message", [
+    (["a", "b", "c", "d"], "Unknown feature: d"),
+    (["a", "b", "a", "c"], "Duplicate feature: a"),
+    (["a"], "Missing features: b, c"),
+    (["a", "", "b", "c"], "Empty feature name"),
+    ([], "No features provided"),
+], ids=["unknown", "duplicate", "missing", "empty_name", "no_columns"])
+def test_frame_to_matrix_rejects_columns(columns, message):
+    frame = pd.DataFrame([[1.0] * len(columns)], columns=columns)
+    with pytest.raises(ValidationError, match=f"^{message}$"):
+        frame_to_matrix(frame, SCHEMA)
@@ -3,11 +3,16 @@ Script for creating a simple trained ML model
 Used for demonstrating the gRPC service
 """
 
+import json
 import pickle
 import os
 from sklearn.datasets import load_iris
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
+from server.inference import CompiledForest, MAPPED_SUFFIX
+
+# Feature names clients send in PredictRequest, in the column order of iris.data
+FEATURE_NAMES = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
 
 def create_model():
     """Create and train model"""
@@ -43,6 +48,30 @@ def save_model(model, path='models/model.pkl'):
     print(f"Model successfully saved to {path}")
     print(f"File size: {os.path.getsize(path)} bytes")
 
+    save_feature_schema(path)
+    save_mapped_model(model, path)
+
+def save_feature_schema(model_path, feature_names=FEATURE_NAMES):
+    """Save the feature order next to the model (read by server/inference.py)"""
+    schema_path = os.path.splitext(model_path)[0] + '.features.json'
+    with open(schema_path, 'w') as f:
+        json.dump(feature_names, f)
+        f.write('\n')
+
+    print(f"Feature schema saved to {schema_path}")
+
+def save_mapped_model(model, model_path):
+    """Export the forest as a memory-mapped artifact next to the pickle.
+
+    Serve it with MODEL_PATH=models/model.forest: it loads without unpickling
+    and its pages are shared by all server processes.
+    """
+    mapped_path = os.path.splitext(model_path)[0] + MAPPED_SUFFIX
+    CompiledForest(model).save(mapped_path)
+
+    print(f"Memory-mapped model saved to {mapped_path}")
+    print(f"File size: {os.path.getsize(mapped_path)} bytes")
+
 if __name__ == '__main__':
     model = create_model()
     save_model(model)
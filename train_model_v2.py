@@ -4,6 +4,7 @@ from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 import pickle
 import os
+from train_model import save_feature_schema, save_mapped_model
 
 def create_model_v2():
     print("Loading Iris dataset for v2...")
@@ -33,6 +34,8 @@ def save_model(model, path='models/model_v2.pkl'):
         pickle.dump(model, f)
     print(f"Model v2 successfully saved to {path}")
     print(f"File size: {os.path.getsize(path)} bytes")
+    save_feature_schema(path)
+    save_mapped_model(model, path)
 
 if __name__ == '__main__':
     model = create_model_v2()